@@ -1,16 +1,32 @@
 # ocr_compiler_gui_singlefile_modtime_sort_es_unique_txt.py
+# GUI front end. The OCR/compile backend (and the headless command line) lives in batch_ocr.py.
 
 # --- Standard Library Imports ---
-import tkinter
-import tkinter.messagebox
-import tkinter.filedialog
 import os
 import threading
-import time
 import sys
+import multiprocessing # For the parallel OCR worker pool
 import queue  # For thread communication
+import collections # Bounded log buffer for the status box
 import traceback # For detailed error logging
 
+# --- Backend (no heavy imports until OCR actually runs) ---
+import batch_ocr
+from batch_ocr import (
+    OCR_LANGUAGES, DEFAULT_OCR_WORKERS, DEFAULT_OCR_CACHE_PATH,
+    DEFAULT_INCREMENTAL_COMPILE, DEFAULT_COMPILED_FILENAME, DEFAULT_USE_JOURNAL, JOURNAL_FILENAME, build_folder_index, check_existing_txt_files,
+    run_ocr_and_compile, OCRDaemonClient, PREPROCESS_PRESETS, ProgressCounters, RunMetrics, OCRRunControl, DEFAULT_OCR_ORDER,
+)
+
+# --- Headless mode: any command line arguments go to the batch_ocr CLI (no Tk needed) ---
+if __name__ == "__main__" and len(sys.argv) > 1:
+    multiprocessing.freeze_support()
+    sys.exit(batch_ocr.main(sys.argv[1:]))
+
+import tkinter
+import tkinter.messagebox
+import tkinter.filedialog
+
 # --- Third-Party Library Imports ---
 # Attempt imports and provide guidance if they fail
 try:
@@ -20,325 +36,19 @@ except ImportError:
     print("Please install it: pip install customtkinter")
     sys.exit(1)
 
-try:
-    import easyocr
-except ImportError:
-    print("ERROR: easyocr library not found.")
-    print("Please install it: pip install easyocr")
-    # Also mention dependencies implicitly needed by easyocr
-    print("Ensure you also have PyTorch installed (check easyocr documentation).")
-    print("You might also need: pip install opencv-python-headless numpy")
-    sys.exit(1)
-
-try:
-    import cv2 # OpenCV
-except ImportError:
-    print("ERROR: OpenCV (cv2) library not found.")
-    print("Please install it: pip install opencv-python-headless")
-    sys.exit(1)
-
-try:
-    import numpy as np
-except ImportError:
-    print("ERROR: numpy library not found.")
-    print("Please install it: pip install numpy")
-    sys.exit(1)
-
-try:
-    # Optional: Check for torch availability for GPU message
-    import torch
-    TORCH_AVAILABLE = True
-except ImportError:
-    TORCH_AVAILABLE = False
-
 
 # --- Constants ---
 APP_NAME = "Batch OCR & Compiler (Sort by Mod Time, ES/EN)"
-DEFAULT_COMPILED_FILENAME = "_compiled_ocr_output_by_time.txt"
-IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif')
-OCR_LANGUAGES = ['es', 'en'] # Spanish and English
+LOG_VIEW_MAX_LINES = 2000 # Status box keeps only the newest lines (full log: "Save full log + metrics" checkbox)
+LOG_REFRESH_MS = 100 # Queued log lines and progress are pushed to the widgets once per tick
+RUN_LOG_FILENAME = "_ocr_run_log.txt" # Written into the image folder (with the run metrics) when the full log is enabled
+ORDER_CHOICES = {"Oldest first": "mtime", "Smallest first": "smallest"} # Processing order menu (the compiled file stays oldest first)
 
 # --- Appearance Settings ---
 customtkinter.set_appearance_mode("System")
 customtkinter.set_default_color_theme("blue")
 
 
-# ==============================================================================
-# --- BACKEND LOGIC FUNCTIONS ---
-# ==============================================================================
-
-def find_image_files(folder_path):
-    """
-    Finds all image files in the specified folder.
-    Returns a list of paths sorted by modification time (oldest first), and error_msg.
-    """
-    images_with_time = []
-    try:
-        abs_folder_path = os.path.abspath(folder_path)
-        if not os.path.isdir(abs_folder_path):
-            return None, f"Error: Folder not found or is not a directory: {abs_folder_path}"
-
-        for filename in os.listdir(abs_folder_path):
-            # Check BOTH extension and ensure it's a file (not directory)
-            base, ext = os.path.splitext(filename)
-            if ext.lower() in IMAGE_EXTENSIONS: # Check against our tuple of valid extensions
-                full_path = os.path.join(abs_folder_path, filename)
-                if os.path.isfile(full_path): # Double-check it's a file
-                    try:
-                        mod_time = os.path.getmtime(full_path)
-                        images_with_time.append((mod_time, full_path))
-                    except OSError as e:
-                        print(f"Warning: Could not get modification time for {filename}: {e}")
-                        images_with_time.append((0, full_path)) # Sorts first if time unreadable
-
-        if not images_with_time:
-             return [], "No image files found matching extensions."
-
-        images_with_time.sort(key=lambda item: item[0]) # Sort by mod_time
-        sorted_image_files = [path for mod_time, path in images_with_time]
-        return sorted_image_files, None # Success
-
-    except Exception as e:
-        print(f"Unexpected error in find_image_files for folder: {folder_path}")
-        print(traceback.format_exc())
-        return None, f"Unexpected error accessing folder {folder_path}: {e}"
-
-
-# --- MODIFIED: Function to generate the unique txt filename ---
-def get_unique_txt_path(image_path):
-    """Generates the unique .txt filename based on the image path."""
-    # Example: /path/to/image.png -> /path/to/image.png.txt
-    return image_path + '.txt'
-
-
-def check_existing_txt_files(folder_path):
-    """Checks if any unique .txt files corresponding to image files exist."""
-    image_files, error = find_image_files(folder_path)
-    if error or not image_files: return False
-
-    for img_path in image_files:
-        # Use the new function to check for the unique filename
-        unique_txt_path = get_unique_txt_path(img_path)
-        if os.path.exists(unique_txt_path): return True
-    return False
-
-
-# --- MODIFIED: perform_batch_ocr uses unique txt filenames ---
-def perform_batch_ocr(folder_path, languages=OCR_LANGUAGES, use_gpu=True, overwrite_mode=True, status_callback=None):
-    """
-    Performs OCR on images (sorted by mod time) using specified languages.
-    Saves output to unique .txt files (imagename.ext.txt).
-    Skips based on overwrite_mode.
-    Returns (processed_count, skipped_count, error_count, error_message).
-    """
-    def log(msg):
-        if status_callback:
-            try: status_callback(msg)
-            except Exception as e: print(f"Error in status_callback: {e}")
-
-    log(f"OCR Task: Scanning folder for images (sorted by modification time): {folder_path}")
-    image_files, error = find_image_files(folder_path)
-
-    if error: return 0, 0, 0, error
-    if not image_files: return 0, 0, 0, "No image files found in the specified folder."
-
-    log(f"OCR Task: Found {len(image_files)} image file(s). Processing oldest first.")
-
-    processed_count, error_count, skipped_count = 0, 0, 0
-    reader = None
-
-    ocr_needed = False
-    if overwrite_mode: ocr_needed = True
-    else:
-        for image_path in image_files:
-            # Check existence using the unique filename format
-            unique_txt_path = get_unique_txt_path(image_path)
-            if not os.path.exists(unique_txt_path):
-                ocr_needed = True; break
-
-    if not ocr_needed and not overwrite_mode:
-        log("OCR Task: All images seem to have existing unique .txt files and overwrite is OFF. Skipping OCR.")
-        skipped_count = len(image_files)
-        return 0, skipped_count, 0, None
-
-    log(f"OCR Task: Initializing EasyOCR for languages: {languages} (GPU: {use_gpu})")
-    try:
-        reader = easyocr.Reader(languages, gpu=use_gpu)
-        log("OCR Task: EasyOCR initialized successfully.")
-    except Exception as e:
-        err_msg = f"Error initializing EasyOCR: {e}\nCheck dependencies (PyTorch, CUDA if using GPU)."
-        log(f"!!! {err_msg} !!!")
-        return 0, 0, 0, err_msg
-
-    total_start_time = time.time()
-
-    for i, image_path in enumerate(image_files):
-        filename = os.path.basename(image_path)
-        # --- Use the new function to get the unique output path ---
-        output_filename = get_unique_txt_path(image_path)
-        output_txt_basename = os.path.basename(output_filename) # For logging
-
-        # --- Check for existing file using unique name ---
-        if not overwrite_mode and os.path.exists(output_filename):
-            log(f"---> Skipping ({i+1}/{len(image_files)}): {filename} (using existing '{output_txt_basename}')")
-            skipped_count += 1
-            continue
-
-        log(f"===> Processing ({i+1}/{len(image_files)}): Image '{filename}'")
-        start_time = time.time()
-
-        try:
-            # --- Image Loading ---
-            log(f"     Reading image file: {image_path}")
-            with open(image_path, "rb") as f: img_bytes = f.read()
-            if not img_bytes: raise IOError(f"File is empty: {filename}")
-
-            img_np = np.frombuffer(img_bytes, np.uint8)
-            log(f"     Decoding image data for: {filename}")
-            img = cv2.imdecode(img_np, cv2.IMREAD_COLOR)
-            if img is None:
-                img = cv2.imdecode(img_np, cv2.IMREAD_UNCHANGED)
-                if img is None: raise IOError(f"OpenCV could not decode image: {filename}")
-                if len(img.shape) > 2 and img.shape[2] == 4:
-                     log(f"     INFO: Converting RGBA/BGRA image to BGR for {filename}")
-                     img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-
-            # --- OCR Execution ---
-            if reader is None: raise RuntimeError("EasyOCR reader was not initialized.")
-            log(f"     Performing OCR ({'/'.join(languages)}) on image data from: {filename}")
-            results = reader.readtext(img, detail=0, paragraph=True)
-            extracted_text = "\n".join(results).strip()
-            elapsed_time = time.time() - start_time
-            log(f"     OCR complete for {filename} in {elapsed_time:.2f}s. Text length: {len(extracted_text)}")
-
-            # --- Save to UNIQUE TXT File ---
-            log(f"     Saving extracted text to unique file: '{output_txt_basename}'")
-            try:
-                with open(output_filename, 'w', encoding='utf-8') as f:
-                    f.write(extracted_text)
-                log(f"     Successfully saved: '{output_txt_basename}'")
-                processed_count += 1
-            except Exception as e:
-                error_count += 1
-                log(f"     !!! Error SAVING text file '{output_txt_basename}': {e} !!!")
-
-        except Exception as e:
-            log(f"!!! Error PROCESSING image '{filename}': {e} !!!")
-            log(f"     Full image path with error: {image_path}")
-            # log(traceback.format_exc()) # Uncomment for full traceback
-            error_count += 1
-
-    total_elapsed_time = time.time() - total_start_time
-    summary = f"OCR Task Finished. Processed: {processed_count}, Skipped: {skipped_count}, Errors: {error_count}, Time: {total_elapsed_time:.2f}s"
-    log(summary)
-
-    return processed_count, skipped_count, error_count, None
-
-
-# --- MODIFIED: compile_text_files reads unique txt filenames ---
-def compile_text_files(input_folder, output_file, status_callback=None):
-    """
-    Compiles unique .txt files (imagename.ext.txt) based on the modification time
-    of their corresponding image files (oldest first).
-    Includes a separator with the unique source filename before each file's content.
-    Returns (compiled_count, error_message).
-    """
-    def log(msg):
-        if status_callback:
-            try: status_callback(msg)
-            except Exception as e: print(f"Error in status_callback: {e}")
-
-    log(f"Compile Task: Starting Text Compilation")
-    log(f"Compile Task: Finding images sorted by modification time in: {input_folder}")
-
-    # --- Step 1: Get the correctly time-sorted list of IMAGE files ---
-    image_files, error = find_image_files(input_folder)
-
-    if error:
-        err_msg = f"Compile Task: Error finding image files needed for ordering: {error}"
-        log(f"!!! {err_msg} !!!")
-        return 0, err_msg
-    if not image_files:
-        msg = "Compile Task: No image files found. Nothing to compile."
-        log(msg)
-        return 0, None
-
-    log(f"Compile Task: Found {len(image_files)} images. Will compile corresponding unique .txt files in this order (oldest first).")
-
-    # --- Step 2: Iterate through SORTED image list and process corresponding UNIQUE .txt files ---
-    compiled_count = 0
-    error_in_compilation = False
-    output_base_name = os.path.basename(output_file) # To avoid compiling itself
-
-    try:
-        with open(output_file, 'w', encoding='utf-8') as outfile:
-            for i, image_path in enumerate(image_files):
-                image_filename = os.path.basename(image_path)
-                # --- Construct the expected UNIQUE .txt file path ---
-                unique_txt_filepath = get_unique_txt_path(image_path)
-                unique_txt_filename = os.path.basename(unique_txt_filepath)
-
-                # Skip if the txt file happens to be the compilation target itself (unlikely now)
-                if unique_txt_filename == output_base_name:
-                    log(f"  Skipping '{unique_txt_filename}' as it is the compilation target file.")
-                    continue
-
-                log(f"  Checking for unique .txt file ({i+1}/{len(image_files)}): '{unique_txt_filename}' (from image '{image_filename}')")
-
-                # Check if the corresponding UNIQUE .txt file exists
-                if os.path.isfile(unique_txt_filepath):
-                    try:
-                        log(f"    Reading content from: '{unique_txt_filename}'")
-                        with open(unique_txt_filepath, 'r', encoding='utf-8') as infile:
-                            content = infile.read().strip()
-                        log(f"    Read {len(content)} characters.")
-
-                        # --- Use the UNIQUE .txt filename in the separator ---
-                        leading_newlines = "\n\n" if compiled_count > 0 else ""
-                        separator = f"{leading_newlines}{'=' * 60}\n=== Source File: {unique_txt_filename} ===\n{'=' * 60}\n\n"
-
-                        log(f"    Writing separator and content for '{unique_txt_filename}' to output.")
-                        outfile.write(separator)
-                        if content:
-                            outfile.write(content)
-                        else:
-                            log(f"    Note: Source file '{unique_txt_filename}' was empty.")
-                        compiled_count += 1
-
-                    except Exception as e:
-                        error_in_compilation = True
-                        log(f"    !!! Warning: Could not read or process file '{unique_txt_filename}'. Error: {e} !!!")
-                        error_marker = f"\n\n{'!' * 60}\n!!! Error processing file: {unique_txt_filename} - {e} !!!\n{'!' * 60}\n\n"
-                        try: outfile.write(error_marker); log(f"    Wrote error marker to output for '{unique_txt_filename}'.")
-                        except Exception as write_err: log(f"    !!! Additionally failed to write error marker to output file: {write_err} !!!")
-                else:
-                    # Corresponding unique .txt file does not exist
-                    log(f"    Skipping: Corresponding unique file '{unique_txt_filename}' not found for image '{image_filename}'.")
-
-
-        # --- Compilation Loop Finished ---
-        total_expected = len(image_files)
-        summary = f"Compile Task Finished. Compiled content from {compiled_count}/{total_expected} existing source file(s) into:"
-        log(summary)
-        log(os.path.abspath(output_file))
-
-        if compiled_count == 0 and len(image_files) > 0: log("Compile Task: Warning - No unique .txt files were available for compilation.")
-        if error_in_compilation:
-             log("Compile Task: Completed, but one or more source .txt files could not be read/processed.")
-             return compiled_count, "Compilation completed with errors reading source files (check log)."
-        else:
-             if compiled_count < total_expected: log(f"Compile Task: Note - {total_expected - compiled_count} expected unique .txt file(s) were not found.")
-             return compiled_count, None # Success
-
-    except IOError as e: # Error writing the main output file
-        err_msg = f"Compile Task: Critical Error writing to output file '{output_file}': {e}"
-        log(f"!!! {err_msg} !!!"); return compiled_count, err_msg
-    except Exception as e: # Other unexpected errors
-        err_msg = f"Compile Task: An unexpected critical error occurred during compilation: {e}"
-        log(f"!!! {err_msg} !!!"); log(traceback.format_exc())
-        return compiled_count, err_msg
-
-
 # ==============================================================================
 # --- GUI Application Class (Essentially Unchanged) ---
 # ==============================================================================
@@ -353,8 +63,12 @@ class App(customtkinter.CTk):
         self.geometry("700x550")
         self.selected_folder = ""
         self.status_queue = queue.Queue()
+        self.pending_log = collections.deque(maxlen=LOG_VIEW_MAX_LINES) # Lines waiting for the next refresh tick
+        self.dropped_log_lines = 0
+        self.progress = ProgressCounters()
         self.processing_thread = None
         self.is_processing = False
+        self.run_control = None # OCRRunControl of the current run (Pause/Cancel buttons)
         self.grid_columnconfigure(0, weight=0); self.grid_columnconfigure(1, weight=1)
         self.grid_rowconfigure(0, weight=0); self.grid_rowconfigure(1, weight=1)
         # Controls Frame
@@ -368,14 +82,54 @@ class App(customtkinter.CTk):
         self.browse_button = customtkinter.CTkButton(self.control_frame, text="Browse...", width=100, command=self.browse_folder)
         self.browse_button.grid(row=0, column=2, padx=(5, 10), pady=10, sticky="e")
         self.run_button = customtkinter.CTkButton(self.control_frame, text="Click me to Batch OCR and Compile!", height=40, command=self.start_processing)
-        self.run_button.grid(row=1, column=0, columnspan=3, padx=10, pady=(5, 10), sticky="ew")
+        self.workers_label = customtkinter.CTkLabel(self.control_frame, text="OCR Workers:")
+        self.workers_label.grid(row=1, column=0, padx=(10, 5), pady=(0, 5), sticky="w")
+        worker_choices = sorted({1, 2, 4, 8, 16, 32, os.cpu_count() or 1} & set(range(1, (os.cpu_count() or 1) + 1)))
+        self.workers_menu = customtkinter.CTkOptionMenu(self.control_frame, values=[str(n) for n in worker_choices], width=100)
+        self.workers_menu.set(str(DEFAULT_OCR_WORKERS))
+        self.workers_menu.grid(row=1, column=1, padx=5, pady=(0, 5), sticky="w")
+        self.cache_checkbox = customtkinter.CTkCheckBox(self.control_frame, text="Use OCR cache")
+        self.cache_checkbox.grid(row=1, column=2, padx=(5, 10), pady=(0, 5), sticky="e")
+        self.daemon_checkbox = customtkinter.CTkCheckBox(self.control_frame, text="Use OCR daemon if running (models stay loaded)")
+        self.preprocess_label = customtkinter.CTkLabel(self.control_frame, text="Preprocess:")
+        self.preprocess_label.grid(row=2, column=0, padx=(10, 5), pady=(0, 5), sticky="w")
+        self.preprocess_menu = customtkinter.CTkOptionMenu(self.control_frame, values=list(PREPROCESS_PRESETS), width=100)
+        self.preprocess_menu.set("none")
+        self.preprocess_menu.grid(row=2, column=1, padx=5, pady=(0, 5), sticky="w")
+        self.cpu_mode_checkbox = customtkinter.CTkCheckBox(self.control_frame, text="CPU optimized mode")
+        self.cpu_mode_checkbox.grid(row=2, column=2, padx=(5, 10), pady=(0, 5), sticky="e")
+        self.daemon_checkbox.grid(row=3, column=0, columnspan=2, padx=10, pady=(0, 5), sticky="w")
+        self.log_file_checkbox = customtkinter.CTkCheckBox(self.control_frame, text="Save full log + metrics to folder")
+        self.log_file_checkbox.grid(row=3, column=2, padx=(5, 10), pady=(0, 5), sticky="e")
+        self.dedup_checkbox = customtkinter.CTkCheckBox(self.control_frame, text="Reuse text for near-duplicate frames (1 worker)")
+        self.dedup_checkbox.grid(row=4, column=0, columnspan=2, padx=10, pady=(0, 5), sticky="w")
+        self.tiling_checkbox = customtkinter.CTkCheckBox(self.control_frame, text="Huge scans in strips + all TIFF pages")
+        self.tiling_checkbox.grid(row=4, column=2, padx=(5, 10), pady=(0, 5), sticky="e")
+        self.store_checkbox = customtkinter.CTkCheckBox(self.control_frame, text="Keep searchable text store (batch_ocr query)")
+        self.store_checkbox.grid(row=5, column=0, columnspan=2, padx=10, pady=(0, 5), sticky="w")
+        self.order_menu = customtkinter.CTkOptionMenu(self.control_frame, values=list(ORDER_CHOICES), width=150)
+        self.order_menu.set(next(iter(ORDER_CHOICES)))
+        self.order_menu.grid(row=5, column=2, padx=(5, 10), pady=(0, 5), sticky="e")
+        self.journal_checkbox = customtkinter.CTkCheckBox(self.control_frame, text=f"Resume interrupted runs ({JOURNAL_FILENAME} in the folder)")
+        if DEFAULT_USE_JOURNAL: self.journal_checkbox.select()
+        self.journal_checkbox.grid(row=6, column=0, columnspan=3, padx=10, pady=(0, 5), sticky="w")
+        self.run_button.grid(row=7, column=0, columnspan=3, padx=10, pady=(5, 5), sticky="ew")
+        self.pause_button = customtkinter.CTkButton(self.control_frame, text="Pause", state="disabled", command=self.toggle_pause)
+        self.pause_button.grid(row=8, column=0, columnspan=2, padx=(10, 5), pady=(0, 10), sticky="ew")
+        self.cancel_button = customtkinter.CTkButton(self.control_frame, text="Cancel", width=100, state="disabled", command=self.cancel_processing)
+        self.cancel_button.grid(row=8, column=2, padx=(5, 10), pady=(0, 10), sticky="ew")
         # Status Frame
         self.status_frame = customtkinter.CTkFrame(self)
         self.status_frame.grid(row=1, column=0, columnspan=2, padx=10, pady=(5, 10), sticky="nsew")
         self.status_frame.grid_rowconfigure(0, weight=1); self.status_frame.grid_columnconfigure(0, weight=1)
         self.status_textbox = customtkinter.CTkTextbox(self.status_frame, wrap=tkinter.WORD, state="disabled", corner_radius=0, font=("Consolas", 10) or ("Courier New", 10))
         self.status_textbox.grid(row=0, column=0, sticky="nsew")
-        self.after(100, self.check_status_queue)
+        self.progress_bar = customtkinter.CTkProgressBar(self.status_frame)
+        self.progress_bar.set(0)
+        self.progress_bar.grid(row=1, column=0, padx=5, pady=(5, 0), sticky="ew")
+        self.progress_label = customtkinter.CTkLabel(self.status_frame, text="", anchor="w")
+        self.progress_label.grid(row=2, column=0, padx=5, pady=(0, 5), sticky="ew")
+        self.after(LOG_REFRESH_MS, self.check_status_queue)
 
     def browse_folder(self):
         if self.is_processing: return
@@ -390,21 +144,55 @@ class App(customtkinter.CTk):
             self.log_status(f"Selected folder: {self.selected_folder}")
 
     def log_status(self, message):
+        self.queue_log_line(message)
+        self.flush_log_view()
+
+    def queue_log_line(self, message):
+        if len(self.pending_log) == self.pending_log.maxlen: self.dropped_log_lines += 1
+        self.pending_log.append(message if message.endswith("\n") else message + "\n")
+
+    def flush_log_view(self):
+        # One insert (and one trim/scroll) for everything queued since the last tick
+        if not self.pending_log: return
+        lines = list(self.pending_log); self.pending_log.clear()
+        if self.dropped_log_lines:
+            lines.insert(0, f"... {self.dropped_log_lines} log line(s) skipped in this view ...\n"); self.dropped_log_lines = 0
         try:
             self.status_textbox.configure(state="normal")
-            if not message.endswith("\n"): message += "\n"
-            self.status_textbox.insert(tkinter.END, message)
+            self.status_textbox.insert(tkinter.END, "".join(lines))
+            excess = int(self.status_textbox.index("end-1c").split(".")[0]) - LOG_VIEW_MAX_LINES
+            if excess > 0: self.status_textbox.delete("1.0", f"{excess + 1}.0")
             self.status_textbox.configure(state="disabled")
             self.status_textbox.see(tkinter.END)
-            self.update_idletasks()
         except Exception as e: print(f"Error updating status textbox: {e}")
 
+    def update_progress_view(self):
+        if self.progress.start_time is None: return
+        self.progress_bar.set(self.progress.fraction)
+        self.progress_label.configure(text=self.progress.summary())
+
     def start_processing(self):
         if self.is_processing: tkinter.messagebox.showwarning("Busy", "Processing is already in progress."); return
         if not self.selected_folder or not os.path.isdir(self.selected_folder): tkinter.messagebox.showerror("Error", "Please select a valid image folder first."); return
 
         overwrite_mode = True
-        try: has_existing = check_existing_txt_files(self.selected_folder)
+        try: workers = int(self.workers_menu.get())
+        except ValueError: workers = DEFAULT_OCR_WORKERS
+        cache_path = DEFAULT_OCR_CACHE_PATH if self.cache_checkbox.get() else None
+        use_daemon = bool(self.daemon_checkbox.get())
+        log_to_file = bool(self.log_file_checkbox.get())
+        preprocess = self.preprocess_menu.get()
+        cpu_mode = bool(self.cpu_mode_checkbox.get())
+        dedup = bool(self.dedup_checkbox.get())
+        tiling = bool(self.tiling_checkbox.get())
+        text_store = bool(self.store_checkbox.get())
+        journal = bool(self.journal_checkbox.get())
+        order = ORDER_CHOICES[self.order_menu.get()]
+        # One folder scan per run: the same sorted snapshot drives the check, OCR and compile
+        try:
+            folder_index, index_error = build_folder_index(self.selected_folder)
+            if index_error: raise Exception(index_error)
+            has_existing = check_existing_txt_files(self.selected_folder, folder_index)
         except Exception as e: tkinter.messagebox.showerror("Error", f"Failed check for existing files:\n{e}"); return
 
         if has_existing:
@@ -416,75 +204,122 @@ class App(customtkinter.CTk):
 
         self.is_processing = True
         self.status_textbox.configure(state="normal"); self.status_textbox.delete("1.0", tkinter.END); self.status_textbox.configure(state="disabled")
-        self.run_button.configure(state="disabled", text="Processing..."); self.browse_button.configure(state="disabled")
-        self.log_status(f"--- Starting Full Process (Overwrite: {overwrite_mode}, Sort: Mod Time, Langs: {OCR_LANGUAGES}) ---")
+        self.pending_log.clear(); self.dropped_log_lines = 0
+        self.progress = ProgressCounters(); self.progress_bar.set(0); self.progress_label.configure(text="")
+        self.run_button.configure(state="disabled", text="Processing..."); self.browse_button.configure(state="disabled"); self.workers_menu.configure(state="disabled"); self.cache_checkbox.configure(state="disabled"); self.daemon_checkbox.configure(state="disabled"); self.preprocess_menu.configure(state="disabled"); self.cpu_mode_checkbox.configure(state="disabled"); self.log_file_checkbox.configure(state="disabled"); self.dedup_checkbox.configure(state="disabled"); self.tiling_checkbox.configure(state="disabled"); self.store_checkbox.configure(state="disabled"); self.journal_checkbox.configure(state="disabled"); self.order_menu.configure(state="disabled")
+        self.run_control = OCRRunControl(); self.pause_button.configure(state="normal", text="Pause"); self.cancel_button.configure(state="normal")
+        self.log_status(f"--- Starting Full Process (Overwrite: {overwrite_mode}, Sort: Mod Time, Langs: {OCR_LANGUAGES}, Workers: {workers}, Preprocess: {preprocess}, CPU Mode: {cpu_mode}, Near-duplicates: {dedup}, Tiled: {tiling}, Text Store: {text_store}, Journal: {journal}, Order: {order}) ---")
         self.log_status(f"--- Target Folder: {self.selected_folder} ---")
 
-        self.processing_thread = threading.Thread(target=self.run_ocr_and_compile_thread, args=(self.selected_folder, overwrite_mode, self.status_queue), daemon=True)
+        self.processing_thread = threading.Thread(target=self.run_ocr_and_compile_thread, args=(self.selected_folder, overwrite_mode, self.status_queue, workers, cache_path, folder_index, use_daemon, preprocess, log_to_file, cpu_mode, dedup, tiling, text_store, order, self.run_control, journal), daemon=True)
         self.processing_thread.start()
 
     def check_status_queue(self):
+        # Drain everything queued since the last tick, then redraw once (the box never sees per-line updates)
         try:
             while True:
                 message = self.status_queue.get_nowait()
-                if message == "PROCESS_COMPLETE": self.log_status("\n=== Process Finished Successfully ==="); self.reset_gui_state()
-                elif message == "PROCESS_ERROR": self.log_status("\n=== Process Finished with Errors (see log) ==="); self.reset_gui_state()
+                if isinstance(message, dict): self.progress.update(message) # Structured progress record
+                elif message == "PROCESS_COMPLETE": self.queue_log_line("\n=== Process Finished Successfully ==="); self.reset_gui_state()
+                elif message == "PROCESS_ERROR": self.queue_log_line("\n=== Process Finished with Errors (see log) ==="); self.reset_gui_state()
+                elif message == "PROCESS_CANCELLED": self.queue_log_line("\n=== Process Cancelled (finished images keep their .txt files) ==="); self.reset_gui_state()
                 elif message == "THREAD_STARTED": pass
-                else: self.log_status(str(message))
+                else: self.queue_log_line(str(message))
         except queue.Empty: pass
-        except Exception as e: print(f"Error processing status queue: {e}"); self.log_status(f"GUI Error: {e}"); self.reset_gui_state()
-        if self.winfo_exists(): self.after(150, self.check_status_queue)
+        except Exception as e: print(f"Error processing status queue: {e}"); self.queue_log_line(f"GUI Error: {e}"); self.reset_gui_state()
+        self.flush_log_view()
+        self.update_progress_view()
+        if self.winfo_exists(): self.after(LOG_REFRESH_MS, self.check_status_queue)
 
     def reset_gui_state(self):
         self.is_processing = False
         self.run_button.configure(state="normal", text="Click me to Batch OCR and Compile!")
         self.browse_button.configure(state="normal")
+        self.workers_menu.configure(state="normal")
+        self.cache_checkbox.configure(state="normal")
+        self.daemon_checkbox.configure(state="normal")
+        self.preprocess_menu.configure(state="normal")
+        self.cpu_mode_checkbox.configure(state="normal")
+        self.log_file_checkbox.configure(state="normal")
+        self.dedup_checkbox.configure(state="normal")
+        self.tiling_checkbox.configure(state="normal")
+        self.store_checkbox.configure(state="normal")
+        self.journal_checkbox.configure(state="normal")
+        self.order_menu.configure(state="normal")
+        self.pause_button.configure(state="disabled", text="Pause")
+        self.cancel_button.configure(state="disabled")
+
+    def toggle_pause(self):
+        if self.run_control is None or self.run_control.cancelled: return
+        if self.run_control.paused:
+            self.run_control.resume(); self.pause_button.configure(text="Pause"); self.log_status("--- Resumed ---")
+        else:
+            self.run_control.pause(); self.pause_button.configure(text="Resume"); self.log_status("--- Pausing after the current image ---")
+
+    def cancel_processing(self):
+        if self.run_control is None or self.run_control.cancelled: return
+        self.run_control.cancel()
+        self.pause_button.configure(state="disabled", text="Pause"); self.cancel_button.configure(state="disabled")
+        self.log_status("--- Cancelling after the current image (finished images keep their .txt files) ---")
 
-    def run_ocr_and_compile_thread(self, folder_path, overwrite_mode, status_q):
+    def run_ocr_and_compile_thread(self, folder_path, overwrite_mode, status_q, workers=DEFAULT_OCR_WORKERS, cache_path=None, folder_index=None, use_daemon=False, preprocess=None, log_to_file=False, cpu_mode=False, dedup=False, tiling=False, text_store=False, order=DEFAULT_OCR_ORDER, control=None, journal=DEFAULT_USE_JOURNAL):
+        log_file, log_file_lock = None, threading.Lock() # The pipeline's writer thread logs too
         def callback(message):
+            if log_file is not None:
+                with log_file_lock:
+                    try: log_file.write(f"{message}\n")
+                    except Exception as e: print(f"Log File Error: {e}")
             try: status_q.put(message)
             except Exception as e: print(f"Queue Error: {message} - {e}")
 
-        overall_success = True
         try:
             callback("THREAD_STARTED")
-            # Step 1: OCR
-            use_gpu = False
-            if TORCH_AVAILABLE:
-                try:
-                    if torch.cuda.is_available(): use_gpu = True; callback("INFO: PyTorch CUDA found, attempting GPU.")
-                    else: callback("INFO: PyTorch CUDA not available, using CPU.")
-                except Exception as torch_err: callback(f"INFO: Error checking Torch CUDA ({torch_err}), using CPU.")
-            else: callback("INFO: PyTorch not found, using CPU.")
-
-            ocr_processed, ocr_skipped, ocr_errors, ocr_msg = perform_batch_ocr(
-                folder_path, languages=OCR_LANGUAGES, use_gpu=use_gpu,
-                overwrite_mode=overwrite_mode, status_callback=callback
-            )
-            if ocr_msg and not ("No image files found" in ocr_msg): overall_success = False; raise Exception(f"OCR Step Failed Critically: {ocr_msg}")
-            if ocr_errors > 0: callback(f"Warning: OCR process completed with {ocr_errors} file errors.")
-            if ocr_processed == 0 and ocr_skipped == 0 and ocr_errors == 0 : callback("OCR Task: No images were processed, skipped, or errored.")
-
-            # Step 2: Compile
-            output_filename = os.path.join(folder_path, DEFAULT_COMPILED_FILENAME)
-            compile_count, compile_msg = compile_text_files(
-                folder_path, output_filename, status_callback=callback
+            if log_to_file:
+                log_path = os.path.join(folder_path, RUN_LOG_FILENAME)
+                try: log_file = open(log_path, 'w', encoding='utf-8'); callback(f"INFO: Writing the full log to: {log_path}")
+                except Exception as e: callback(f"Warning: Could not open log file '{log_path}': {e}")
+            if use_daemon:
+                client = OCRDaemonClient()
+                if client.is_available():
+                    callback("INFO: Submitting job to the running OCR daemon (models already loaded). Pause/Cancel only apply to runs in this window.")
+                    result = client.submit({
+                        "op": "run", "folder": os.path.abspath(folder_path), "overwrite": overwrite_mode,
+                        "languages": OCR_LANGUAGES, "preprocess": preprocess, "dedup": dedup or None, "tiling": tiling or None, "store": text_store, "order": order, "journal": journal, "compile": True, "incremental": DEFAULT_INCREMENTAL_COMPILE,
+                        "output": os.path.abspath(os.path.join(folder_path, DEFAULT_COMPILED_FILENAME)),
+                        "metrics_dir": os.path.abspath(folder_path) if log_to_file else None,
+                    }, callback, status_q.put)
+                    if result.get("error"): raise Exception(f"OCR Daemon Job Failed: {result['error']}")
+                    if result.get("errors"): callback(f"Warning: OCR process completed with {result['errors']} file errors.")
+                    if result.get("compile_error"): callback(f"Warning: {result['compile_error']}")
+                    status_q.put("PROCESS_ERROR" if result.get("compile_error") else "PROCESS_COMPLETE")
+                    return
+                callback("INFO: No OCR daemon is running, processing in this window instead.")
+            # The daemon's CPU mode is fixed when it starts ('serve --cpu-mode'); it only applies to local runs
+
+            overall_success = run_ocr_and_compile(
+                folder_path, overwrite_mode=overwrite_mode, status_callback=callback,
+                languages=OCR_LANGUAGES, workers=workers, cache_path=cache_path,
+                folder_index=folder_index, incremental=DEFAULT_INCREMENTAL_COMPILE, preprocess=preprocess,
+                progress_callback=status_q.put, metrics=RunMetrics(folder_path) if log_to_file else None,
+                cpu_mode=cpu_mode or None, dedup=dedup or None, tiling=tiling or None, text_store=text_store or None, order=order, control=control, journal=journal
             )
-            if compile_msg and not ("Compilation completed with errors" in compile_msg or "No .txt files found" in compile_msg): overall_success = False; raise Exception(f"Compilation Step Failed Critically: {compile_msg}")
-            if compile_msg and "Compilation completed with errors" in compile_msg: callback(f"Warning: {compile_msg}"); overall_success = False
-            if compile_msg and "No .txt files found" in compile_msg: callback("Info: Compilation found no .txt files to combine.")
 
             # Finished
-            if overall_success: status_q.put("PROCESS_COMPLETE")
+            if control is not None and control.cancelled: status_q.put("PROCESS_CANCELLED")
+            elif overall_success: status_q.put("PROCESS_COMPLETE")
             else: status_q.put("PROCESS_ERROR")
         except Exception as e:
             callback(f"\n!!! THREAD ERROR: {e} !!!\n{traceback.format_exc()}"); status_q.put("PROCESS_ERROR")
+        finally:
+            if log_file is not None:
+                with log_file_lock: log_file.close()
 
 
 # ==============================================================================
 # --- Main Execution Block ---
 # ==============================================================================
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # Needed by the 'spawn' OCR worker pool in frozen builds
     try: # Pre-check Tkinter
         dummy_root = tkinter.Tk(); dummy_root.withdraw(); dummy_root.destroy()
     except tkinter.TclError as e: print(f"FATAL ERROR: Tkinter not available: {e}"); sys.exit(1)
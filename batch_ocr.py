@@ -0,0 +1,3797 @@
+# batch_ocr.py
+# Backend (library + headless command line) for the Batch OCR & Compiler GUI.
+# Heavy dependencies (easyocr/torch, cv2, numpy) are imported on first use, so
+# `--help`, folder scans and compile-only runs never pay for them.
+
+# --- Standard Library Imports ---
+import os
+import threading
+import time
+import sys
+import argparse
+import importlib
+import importlib.metadata
+import multiprocessing # For the parallel OCR worker pool
+import concurrent.futures # For the prefetch/writer pipeline threads
+import collections
+import hashlib # For content-addressed OCR cache keys
+import json
+import sqlite3 # Persistent OCR result cache
+import stat
+import difflib # Text similarity in the preprocessing report
+import socket # OCR daemon
+import socketserver
+import secrets # OCR daemon: per-start access token
+import hmac
+import traceback # For detailed error logging
+import shutil # Sharded mode: removing finished runs' lease directories
+import bisect # Latency histogram buckets
+import contextlib
+import cProfile # Opt-in profiling of the OCR loop
+import pstats
+import io
+import tempfile # Tiled mode: single TIFF pages on OpenCV without buffer page ranges
+import select # Watch mode: waiting on the inotify descriptor
+import struct
+import ctypes # Watch mode: inotify without extra dependencies (Linux)
+import ctypes.util
+import signal # Ctrl+C cancels a command line run cooperatively
+
+
+# --- Third-Party Library Imports (lazy) ---
+# Imported by import_heavy() the first time a function actually needs them.
+INSTALL_HINTS = {
+    'easyocr': "pip install easyocr\nEnsure you also have PyTorch installed (check easyocr documentation).\n"
+               "You might also need: pip install opencv-python-headless numpy",
+    'cv2': "pip install opencv-python-headless",
+    'numpy': "pip install numpy",
+    'torch': "pip install torch (check easyocr documentation for the right build)",
+}
+
+
+def import_heavy(module_name):
+    """
+    Imports a heavy third-party module on first use (later calls hit sys.modules).
+    Raises ImportError with installation guidance if it is missing.
+    """
+    try:
+        return importlib.import_module(module_name)
+    except ImportError as e:
+        raise ImportError(f"{module_name} library not found. Please install it: {INSTALL_HINTS.get(module_name, 'pip install ' + module_name)}") from e
+
+
+def get_torch():
+    """Returns the torch module, or None if PyTorch is not installed (optional, for GPU/threads)."""
+    try: return import_heavy('torch')
+    except ImportError: return None
+
+
+def get_package_version(package_name):
+    """Installed version of a package without importing it (importing easyocr pulls in torch)."""
+    try: return importlib.metadata.version(package_name)
+    except importlib.metadata.PackageNotFoundError: return "unknown"
+
+
+# --- Constants ---
+
+DEFAULT_COMPILED_FILENAME = "_compiled_ocr_output_by_time.txt"
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif')
+OCR_LANGUAGES = ['es', 'en'] # Spanish and English
+DEFAULT_OCR_WORKERS = 1 # 1 = single process; >1 = one process (and one Reader) per worker
+DEFAULT_PREFETCH_IMAGES = 2 # Images read+decoded ahead of the one being OCR'd (0 = no pipeline)
+READTEXT_OPTIONS = {'detail': 0, 'paragraph': True} # Passed to reader.readtext (part of the cache key)
+DEFAULT_OCR_BATCH_IMAGES = 0 # Decoded images grouped per batched OCR call (0/1 = one image at a time)
+RECOGNITION_BATCH_SIZE = 16 # Text crops per recognizer forward pass when batching (EasyOCR default is 1)
+BATCH_SIZE_BUCKET_PX = 128 # Batching: images whose sides round up to the same multiple of this are padded to one size and batched together
+CPU_MODE_DEFAULTS = { # CPU inference mode (cpu_mode=True); any key can be overridden with a dict
+    'quantize': True,         # Dynamic int8 quantization of the recognizer (EasyOCR's quantize=True, also its default on CPU)
+    'intra_op_threads': 0,    # torch.set_num_threads; 0 = all cores, split between worker processes
+    'inter_op_threads': 1,    # torch.set_num_interop_threads; OCR runs one model call at a time
+    'inference_mode': True,   # Run the OCR loop under torch.inference_mode() (no autograd bookkeeping)
+    'channels_last': False,   # Detector weights in channels-last memory layout (can help on AVX-512 CPUs)
+}
+DEDUP_DEFAULTS = { # Near-duplicate frame detection (dedup=True); any key can be overridden with a dict
+    'hash': 'phash',  # 'phash' (DCT hash; ignores sensor/compression noise on flat backgrounds) or 'dhash' (gradient hash, cheaper)
+    'hash_size': 16,  # Hash is hash_size**2 bits; larger catches smaller changes (e.g. a few edited characters)
+    'threshold': 4,   # Max Hamming distance to the last OCR'd frame for its text to be reused (0 = identical hash)
+}
+TILING_DEFAULTS = { # Tiled OCR for huge scans and multi-page TIFFs (tiling=True); any key can be overridden with a dict
+    'min_side': 8000,              # Pages with a longer side than this are OCR'd in overlapping horizontal strips
+    'strip_pixels': 2048 * 2048,   # Pixel budget per strip (bounds EasyOCR's working memory); strip height = budget / width
+    'overlap': 200,                # Rows shared by neighbouring strips; must be taller than the tallest text line
+    'grayscale': True,             # Decode tiled images and TIFF pages as 8-bit grayscale (1 byte/pixel instead of 3)
+    'all_pages': True,             # OCR every page of a multi-page TIFF, in order (False = first page only)
+}
+STRIP_EDGE_MARGIN = 2 # px: a text box this close to a strip's cut edge was cut off, the neighbouring strip has it whole
+DEFAULT_OCR_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "batch_ocr", "ocr_cache.sqlite3")
+DEFAULT_OCR_CACHE_MAX_BYTES = 256 * 1024 * 1024 # Text stored in the cache before LRU eviction kicks in
+FOLDER_INDEX_MANIFEST_FILENAME = "_ocr_folder_index.json" # Optional saved folder scan (name, size, mtime, txt status)
+COMPILE_SEGMENT_INDEX_SUFFIX = ".segments.json" # Sidecar next to the compiled file, used by incremental compile
+TEXT_STORE_FILENAME = "_ocr_text_store.sqlite3" # Optional searchable copy of the folder's OCR text (SQLite FTS5)
+JOURNAL_FILENAME = "_ocr_journal.jsonl" # Append-only record of finished images, lets an interrupted run resume
+DEFAULT_USE_JOURNAL = True # GUI/CLI/daemon runs keep the journal (library default: off)
+JOURNAL_FSYNC_EVERY_N_RECORDS = 100
+DEFAULT_INCREMENTAL_COMPILE = True # GUI: only rewrite the compiled file from the first changed source onwards
+METRICS_JSON_FILENAME = "_ocr_run_metrics.json" # Written to the metrics folder at the end of a run
+METRICS_PROM_FILENAME = "_ocr_run_metrics.prom" # Prometheus text format (node_exporter textfile collector)
+PROFILE_STATS_FILENAME = "_ocr_profile.pstats" # cProfile output (python -m pstats FILE)
+PROFILE_TRACE_FILENAME = "_ocr_profile_trace.json" # torch.profiler Chrome trace (chrome://tracing)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0) # Seconds
+OCR_CANCELLED_MESSAGE = "OCR run cancelled."
+DEFAULT_OCR_ORDER = "mtime" # Processing order (see OCR_ORDER_POLICIES); the compiled file is always in mtime order
+DEFAULT_WATCH_SETTLE_SECONDS = 1.0 # Watch mode: an image is OCR'd once it hasn't changed for this long
+DEFAULT_WATCH_POLL_SECONDS = 0.5 # Watch mode: polling interval without inotify (also the stop-check interval)
+WATCH_RECENT_SECONDS = 30.0 # Watch mode: images written this recently are re-stat'ed every cycle (writers that pause)
+SHARD_DIRNAME = "_ocr_shards" # Sharded mode: lease files of the nodes sharing one folder
+DEFAULT_SHARD_CHUNK_IMAGES = 16 # Sharded mode: images claimed per lease
+DEFAULT_SHARD_LEASE_SECONDS = 60.0 # Sharded mode: a lease not renewed for this long is taken over (its node is presumed dead)
+SHARD_POLL_SECONDS = 2.0 # Sharded mode: how often an idle node looks for expired leases or the end of the run
+DEFAULT_DAEMON_HOST = "127.0.0.1" # The OCR daemon only listens locally by default
+DEFAULT_DAEMON_PORT = 47823
+DAEMON_MAX_REQUEST_BYTES = 16 * 1024 * 1024
+DAEMON_TOKEN_DIR = os.path.join(os.path.expanduser("~"), ".cache", "batch_ocr") # daemon-PORT.token, readable by the user only
+
+
+# ==============================================================================
+# --- BACKEND LOGIC FUNCTIONS ---
+# ==============================================================================
+
+# --- Folder index: one scandir pass shared by the OCR and compile steps ---
+ImageEntry = collections.namedtuple("ImageEntry", "name path size mtime has_txt")
+
+
+def folder_order_key(entry):
+    """Compile order: oldest first, equal mtimes by name (OCRTextStore.export_compiled sorts the same way)."""
+    return entry.mtime, entry.name
+
+
+class FolderIndex:
+    """
+    Snapshot of the images in one folder, sorted by modification time (oldest first).
+    Built with a single os.scandir pass: .txt status comes from the same directory
+    listing, so no per-file exists/isfile probes are needed. One snapshot is built
+    per run and handed to check_existing_txt_files, perform_batch_ocr and compile_text_files.
+    Optionally persisted as a JSON manifest (FOLDER_INDEX_MANIFEST_FILENAME), a saved
+    snapshot other tools can read without scanning the folder.
+    """
+    def __init__(self, folder_path, entries, restat_count=0):
+        self.folder_path = folder_path
+        self.entries = entries # Sorted by mtime, oldest first
+        self.restat_count = restat_count # How many stat() calls building this index took (0 on Windows, where scandir has them)
+
+    @property
+    def image_paths(self):
+        return [entry.path for entry in self.entries]
+
+    def has_any_txt(self):
+        return any(entry.has_txt for entry in self.entries)
+
+    def manifest_path(self):
+        return os.path.join(self.folder_path, FOLDER_INDEX_MANIFEST_FILENAME)
+
+    def save_manifest(self):
+        """Writes the manifest atomically (temp file + rename). Returns error_msg or None."""
+        manifest_path = self.manifest_path()
+        tmp_path = manifest_path + ".tmp"
+        try:
+            data = {"version": 1, "entries": [[e.name, e.size, e.mtime, e.has_txt] for e in self.entries]}
+            with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(data, f)
+            os.replace(tmp_path, manifest_path)
+            return None
+        except Exception as e:
+            return f"Could not save folder index manifest '{manifest_path}': {e}"
+
+
+def build_folder_index(folder_path, use_manifest=False):
+    """
+    Scans the folder once with os.scandir and returns (FolderIndex, error_msg).
+    With use_manifest, the refreshed manifest is saved as well.
+    Size and mtime always come from the entry's own stat (free on Windows, one stat() elsewhere):
+    an image edited in place changes neither the listing nor the directory's mtime, so values
+    remembered from an earlier scan could put it in the wrong place in the mtime order.
+    """
+    try:
+        abs_folder_path = os.path.abspath(folder_path)
+        if not os.path.isdir(abs_folder_path):
+            return None, f"Error: Folder not found or is not a directory: {abs_folder_path}"
+
+        image_dir_entries, txt_names = [], set()
+        with os.scandir(abs_folder_path) as it:
+            for dir_entry in it:
+                name = dir_entry.name
+                ext = os.path.splitext(name)[1].lower()
+                if ext == '.txt': txt_names.add(name)
+                elif ext in IMAGE_EXTENSIONS: image_dir_entries.append(dir_entry) # Check against our tuple of valid extensions
+
+        images_with_time, restat_count = [], 0
+        for dir_entry in image_dir_entries:
+            name = dir_entry.name
+            try:
+                if not dir_entry.is_file(): continue # Skip directories named like images
+                if os.name != 'nt': restat_count += 1 # Windows' scandir already returned the stat
+                st = dir_entry.stat()
+                size, mod_time = st.st_size, st.st_mtime
+            except OSError as e:
+                print(f"Warning: Could not get modification time for {name}: {e}")
+                size, mod_time = 0, 0 # Sorts first if time unreadable
+            has_txt = get_unique_txt_path(name) in txt_names
+            images_with_time.append(ImageEntry(name, os.path.join(abs_folder_path, name), size, mod_time, has_txt))
+
+        images_with_time.sort(key=folder_order_key) # Sort by mod_time; ties by name, not by the directory's listing order
+        folder_index = FolderIndex(abs_folder_path, images_with_time, restat_count)
+        if use_manifest:
+            manifest_error = folder_index.save_manifest()
+            if manifest_error: print(f"Warning: {manifest_error}")
+        return folder_index, None
+
+    except Exception as e:
+        print(f"Unexpected error in build_folder_index for folder: {folder_path}")
+        print(traceback.format_exc())
+        return None, f"Unexpected error accessing folder {folder_path}: {e}"
+
+
+def find_image_files(folder_path, folder_index=None):
+    """
+    Finds all image files in the specified folder (or in an existing FolderIndex snapshot).
+    Returns a list of paths sorted by modification time (oldest first), and error_msg.
+    """
+    if folder_index is None:
+        folder_index, error = build_folder_index(folder_path)
+        if error: return None, error
+    if not folder_index.entries:
+        return [], "No image files found matching extensions."
+    return folder_index.image_paths, None # Success
+
+
+# --- MODIFIED: Function to generate the unique txt filename ---
+def get_unique_txt_path(image_path):
+    """Generates the unique .txt filename based on the image path."""
+    # Example: /path/to/image.png -> /path/to/image.png.txt
+    return image_path + '.txt'
+
+
+def check_existing_txt_files(folder_path, folder_index=None):
+    """Checks if any unique .txt files corresponding to image files exist."""
+    if folder_index is None:
+        folder_index, error = build_folder_index(folder_path)
+        if error: return False
+    return folder_index.has_any_txt()
+
+
+# ==============================================================================
+# --- OCR RESULT CACHE ---
+# ==============================================================================
+
+def get_ocr_settings_fingerprint(languages, preprocess=None, cpu_mode=None, tiling=None):
+    """
+    Everything besides the image bytes that changes the OCR output.
+    Any change here produces new cache keys, so stale text is never reused.
+    """
+    fingerprint = {
+        "languages": list(languages),
+        "readtext": READTEXT_OPTIONS,
+        "easyocr_version": get_package_version('easyocr'),
+        "preprocess": preprocess,
+    }
+    # Thread counts and inference_mode don't change the text; the model numerics do
+    if cpu_mode: fingerprint["cpu_mode"] = {key: cpu_mode[key] for key in ('quantize', 'channels_last')}
+    if tiling: fingerprint["tiling"] = tiling
+    return fingerprint
+
+
+class OCRResultCache:
+    """
+    Persistent, content-addressed store of OCR text (a single SQLite file).
+    Key = sha256 of the image bytes + hash of the OCR settings fingerprint, so renamed or
+    copied images are never OCR'd twice and edited images always miss.
+    Entries are evicted least-recently-used first once the stored text exceeds max_bytes.
+    Safe to share between threads; each process opens its own instance.
+    """
+    EVICT_EVERY_N_PUTS = 100
+
+    def __init__(self, cache_path, settings, max_bytes=DEFAULT_OCR_CACHE_MAX_BYTES):
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.settings_hash = hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        self.hits, self.misses = 0, 0
+        self._puts_since_evict = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS ocr_cache (key TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ocr_cache_lru ON ocr_cache (last_used)")
+
+    def key_for(self, img_bytes):
+        return f"{hashlib.sha256(img_bytes).hexdigest()}:{self.settings_hash}"
+
+    def get(self, key):
+        """Returns the cached text for key (marking it recently used), or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE ocr_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, text):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO ocr_cache (key, text, size, last_used) VALUES (?, ?, ?, ?)",
+                               (key, text, len(text.encode('utf-8')), time.time()))
+            self._puts_since_evict += 1
+            if self._puts_since_evict >= self.EVICT_EVERY_N_PUTS: self._evict_locked()
+
+    def _evict_locked(self):
+        # Trim to 90% of the cap so eviction doesn't run again on the very next put.
+        self._puts_since_evict = 0
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()[0]
+        if total <= self.max_bytes: return
+        to_free, stale_keys = total - int(self.max_bytes * 0.9), []
+        for key, size in self._conn.execute("SELECT key, size FROM ocr_cache ORDER BY last_used"):
+            if to_free <= 0: break
+            stale_keys.append((key,)); to_free -= size
+        self._conn.execute("BEGIN")
+        self._conn.executemany("DELETE FROM ocr_cache WHERE key = ?", stale_keys)
+        self._conn.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            try: self._evict_locked()
+            finally: self._conn.close()
+
+
+def get_key_digest(cache_key):
+    """The image bytes' sha256 (hex) a cache key starts with; load_image_for_ocr can also hand out the bare digest."""
+    return cache_key.partition(":")[0] if cache_key else None
+
+
+def open_ocr_cache(cache_path, languages, log, preprocess=None, cpu_mode=None, tiling=None):
+    """Opens the OCR cache, or logs a warning and returns None (OCR then runs uncached)."""
+    if not cache_path: return None
+    try:
+        ocr_cache = OCRResultCache(cache_path, get_ocr_settings_fingerprint(languages, preprocess, cpu_mode, tiling))
+        log(f"OCR Task: Using OCR result cache: {cache_path}")
+        return ocr_cache
+    except Exception as e:
+        log(f"Warning: Could not open OCR cache '{cache_path}' ({e}). Continuing without cache.")
+        return None
+
+
+# ==============================================================================
+# --- SEARCHABLE TEXT STORE (SQLite FTS5, next to the compiled file) ---
+# ==============================================================================
+
+class OCRTextStore:
+    """
+    Searchable copy of one folder's OCR text (a single SQLite file with an FTS5 index):
+    one row per image with its name, mtime, size, sha256 and text.
+    add() only queues a row (safe from any thread); rows are written FLUSH_EVERY_N_ROWS at a
+    time in one transaction, stat'ing the image and its .txt at that point. The image's sha256
+    comes from the OCR load stage; without one, the stored digest is kept while the image's size
+    and mtime are unchanged, and only new or changed images are read and hashed.
+    sync() catches up with .txt files written without the store and drops rows whose image
+    or .txt is gone. search() returns ranked hits; export_compiled() rebuilds the compiled file.
+    """
+    FLUSH_EVERY_N_ROWS = 200
+
+    def __init__(self, store_path, folder_path, metrics=None):
+        self.store_path = store_path
+        self.folder_path = os.path.abspath(folder_path)
+        self.metrics = metrics # Bulk writes are timed as the "store" stage
+        self.pending = [] # (image_path, text or None to read it from the .txt, sha256 or None)
+        self.written = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(store_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS images (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, mtime REAL NOT NULL,
+                size INTEGER NOT NULL, sha256 TEXT NOT NULL, txt_mtime REAL NOT NULL, text TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS images_by_mtime ON images (mtime, name);
+            CREATE VIRTUAL TABLE IF NOT EXISTS images_fts USING fts5(text, content='images', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2');
+            CREATE TRIGGER IF NOT EXISTS images_ai AFTER INSERT ON images BEGIN
+                INSERT INTO images_fts (rowid, text) VALUES (new.id, new.text); END;
+            CREATE TRIGGER IF NOT EXISTS images_ad AFTER DELETE ON images BEGIN
+                INSERT INTO images_fts (images_fts, rowid, text) VALUES ('delete', old.id, old.text); END;
+            CREATE TRIGGER IF NOT EXISTS images_au AFTER UPDATE ON images BEGIN
+                INSERT INTO images_fts (images_fts, rowid, text) VALUES ('delete', old.id, old.text);
+                INSERT INTO images_fts (rowid, text) VALUES (new.id, new.text); END;
+        """)
+
+    def add(self, image_path, text=None, digest=None):
+        """Queues the text saved for one image (None = read it from the image's .txt at flush time) and its bytes' sha256."""
+        with self._lock:
+            self.pending.append((image_path, text, digest))
+            if len(self.pending) >= self.FLUSH_EVERY_N_ROWS: self._flush_locked()
+
+    def flush(self):
+        with self._lock: self._flush_locked()
+
+    def _flush_locked(self):
+        rows = []
+        for image_path, text, digest in self.pending:
+            try:
+                st = os.stat(image_path)
+                if digest is None:
+                    stored = self._conn.execute("SELECT mtime, size, sha256 FROM images WHERE name = ?", (os.path.basename(image_path),)).fetchone()
+                    if stored is not None and stored[:2] == (st.st_mtime, st.st_size): digest = stored[2] # Image unchanged, only its .txt
+                    else:
+                        with open(image_path, 'rb') as f: digest = hashlib.file_digest(f, 'sha256').hexdigest() if hasattr(hashlib, 'file_digest') else hashlib.sha256(f.read()).hexdigest()
+                txt_path = get_unique_txt_path(image_path)
+                if text is None:
+                    with open(txt_path, 'r', encoding='utf-8') as f: text = f.read()
+                rows.append((os.path.basename(image_path), st.st_mtime, st.st_size, digest, os.stat(txt_path).st_mtime, text))
+            except OSError as e:
+                print(f"Warning: Could not add '{image_path}' to the text store: {e}")
+        self.pending = []
+        if not rows: return
+        with stage_timer(self.metrics, "store"):
+            self._write_rows(rows)
+        self.written += len(rows)
+
+    def _write_rows(self, rows):
+        self._conn.execute("BEGIN")
+        self._conn.executemany("INSERT INTO images (name, mtime, size, sha256, txt_mtime, text) VALUES (?, ?, ?, ?, ?, ?) "
+                               "ON CONFLICT (name) DO UPDATE SET mtime = excluded.mtime, size = excluded.size, "
+                               "sha256 = excluded.sha256, txt_mtime = excluded.txt_mtime, text = excluded.text", rows)
+        self._conn.execute("COMMIT")
+
+    def sync(self, folder_index, log, written=None):
+        """
+        Brings the store in line with the folder: adds/refreshes images whose .txt is not stored yet
+        (or changed: image or .txt mtime/size differ) and deletes rows without an image or .txt.
+        Costs one stat per .txt file. After a run, pass the names whose .txt it saved (and already
+        added) as `written`: the run's folder index is then enough and no .txt is stat'ed, so a .txt
+        edited by hand is only picked up by a full sync (compile --store). Returns (updated_count, removed_count).
+        """
+        with self._lock:
+            self._flush_locked()
+            stored = {name: (mtime, size, txt_mtime) for name, mtime, size, txt_mtime in
+                      self._conn.execute("SELECT name, mtime, size, txt_mtime FROM images")}
+            keep = set()
+            for entry in folder_index.entries:
+                if written is not None and entry.name in written:
+                    keep.add(entry.name)
+                    continue
+                if not entry.has_txt: continue
+                if written is not None:
+                    keep.add(entry.name)
+                    if stored.get(entry.name, (None, None))[:2] != (entry.mtime, entry.size): self.pending.append((entry.path, None, None))
+                    continue
+                try: txt_mtime = os.stat(get_unique_txt_path(entry.path)).st_mtime
+                except OSError: continue
+                keep.add(entry.name)
+                if stored.get(entry.name) != (entry.mtime, entry.size, txt_mtime): self.pending.append((entry.path, None, None))
+            updated = len(self.pending) + len(keep & written if written else ())
+            self._flush_locked()
+            removed = [(name,) for name in stored if name not in keep]
+            if removed:
+                self._conn.execute("BEGIN")
+                self._conn.executemany("DELETE FROM images WHERE name = ?", removed)
+                self._conn.execute("COMMIT")
+        log(f"Text Store: Synced {os.path.basename(self.store_path)}: {updated} image(s) added/updated, {len(removed)} removed.")
+        return updated, len(removed)
+
+    def search(self, query, limit=20):
+        """
+        Ranked full-text search (FTS5 bm25, best first). `query` uses FTS5 syntax (words, "phrases",
+        prefix*, AND/OR/NOT); input that doesn't parse is searched as plain words.
+        Returns [{"path", "image", "mtime", "score", "snippet"}].
+        """
+        sql = ("SELECT images.name, images.mtime, bm25(images_fts), snippet(images_fts, 0, '[', ']', ' ... ', 16) "
+               "FROM images_fts JOIN images ON images.id = images_fts.rowid WHERE images_fts MATCH ? ORDER BY bm25(images_fts) LIMIT ?")
+        with self._lock:
+            try: rows = self._conn.execute(sql, (query, limit)).fetchall()
+            except sqlite3.OperationalError:
+                plain_words = " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+                rows = self._conn.execute(sql, (plain_words, limit)).fetchall() if plain_words else []
+        return [{"path": os.path.join(self.folder_path, name), "image": name, "mtime": mtime, "score": round(-score, 4), "snippet": " ".join(snippet.split())}
+                for name, mtime, score, snippet in rows]
+
+    def export_compiled(self, output_file, log):
+        """
+        Writes the compiled file from the store (image mtime order, ties by name) in the same format
+        as compile_text_files, without touching the .txt files. Returns (compiled_count, error_message).
+        """
+        compiled_count = 0
+        try:
+            with self._lock:
+                self._flush_locked()
+                with open(output_file, 'w', encoding='utf-8') as outfile:
+                    for name, text in self._conn.execute("SELECT name, text FROM images ORDER BY mtime, name"):
+                        outfile.write(format_compile_separator(get_unique_txt_path(name), is_first=(compiled_count == 0)))
+                        outfile.write(text.strip())
+                        compiled_count += 1
+        except (OSError, sqlite3.Error) as e:
+            err_msg = f"Text Store: Could not export the compiled file '{output_file}': {e}"
+            log(f"!!! {err_msg} !!!")
+            return compiled_count, err_msg
+        log(f"Text Store: Exported {compiled_count} image text(s) to: {os.path.abspath(output_file)}")
+        return compiled_count, None
+
+    def close(self):
+        with self._lock:
+            try: self._flush_locked()
+            finally: self._conn.close()
+
+
+def get_text_store_path(folder_path, text_store=True):
+    """Store file for a folder: text_store=True means FOLDER/TEXT_STORE_FILENAME, a string is used as the path."""
+    return text_store if isinstance(text_store, str) else os.path.join(os.path.abspath(folder_path), TEXT_STORE_FILENAME)
+
+
+def open_text_store(text_store, folder_path, log, metrics=None):
+    """Opens the folder's text store (see get_text_store_path), or logs a warning and returns None."""
+    if not text_store: return None
+    store_path = get_text_store_path(folder_path, text_store)
+    try:
+        store = OCRTextStore(store_path, folder_path, metrics)
+        log(f"OCR Task: Updating searchable text store: {store_path}")
+        return store
+    except Exception as e:
+        log(f"Warning: Could not open text store '{store_path}' ({e}). Continuing without it.")
+        return None
+
+
+# ==============================================================================
+# --- RUN JOURNAL (crash-safe resume) ---
+# ==============================================================================
+
+class OCRJournal:
+    """
+    Append-only JSON-lines journal of one folder's current OCR run:
+      {"event": "start", "settings": ..., "overwrite": bool, "time": t}   (a new run truncates the file)
+      {"event": "resume", "time": t}
+      {"done": name, "size": n, "mtime": t}   (after the image's .txt was atomically renamed into place)
+      {"event": "end", "processed": n, "errors": n, "time": t}   (only if the file can't be deleted, see finish)
+    A run that didn't finish (crash, kill, cancel) is resumed by the next run with the same
+    OCR settings and overwrite mode: images recorded as done, and unchanged since (same size and
+    mtime in the folder index), are skipped without touching their .txt files.
+    Lines are flushed as they are written and fsync'ed every JOURNAL_FSYNC_EVERY_N_RECORDS; a torn
+    last line is ignored when reading, so at worst a few finished images are OCR'd again.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._unsynced = 0
+        self._lock = threading.Lock()
+
+    def read_last_run(self):
+        """Returns (start_record, {name: (size, mtime)} of finished images, ended) of the journaled run."""
+        start, done, ended = None, {}, False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try: record = json.loads(line)
+                    except ValueError: continue # Torn write at the crash
+                    if record.get("event") == "start": start, done, ended = record, {}, False
+                    elif record.get("event") == "end": ended = True
+                    elif "done" in record: done[record["done"]] = (record["size"], record["mtime"])
+        except FileNotFoundError: pass
+        return start, done, ended
+
+    def begin(self, settings, overwrite_mode, log):
+        """
+        Opens the journal for this run. Returns {name: (size, mtime)} of the images an interrupted
+        run with the same settings already finished ({} when starting a new run).
+        """
+        settings = json.loads(json.dumps(settings)) # Same shape as read back from the file
+        start, done, ended = self.read_last_run()
+        resume = start is not None and not ended and start.get("settings") == settings and start.get("overwrite") == overwrite_mode
+        if start is not None and not ended and not resume:
+            log("OCR Task: The journal holds an interrupted run with different settings or overwrite mode; starting a new run.")
+        self._file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+        if resume:
+            log(f"OCR Task: Resuming the interrupted run started {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start['time']))}: "
+                f"{len(done)} image(s) already finished.")
+            self._write({"event": "resume", "time": time.time()})
+            return done
+        self._write({"event": "start", "settings": settings, "overwrite": overwrite_mode, "time": time.time()})
+        return {}
+
+    def _write(self, record, sync=False):
+        with self._lock:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            self._unsynced += 1
+            if sync or self._unsynced >= JOURNAL_FSYNC_EVERY_N_RECORDS:
+                os.fsync(self._file.fileno()); self._unsynced = 0
+
+    def record_done(self, name, size, mtime):
+        self._write({"done": name, "size": size, "mtime": mtime})
+
+    def finish(self, processed_count, error_count):
+        """Marks the run complete by deleting the journal (or, failing that, appending an "end" record): the next run starts over."""
+        if self._file is None: return # The run ended before it needed the journal
+        self.close()
+        try: os.remove(self.path)
+        except OSError:
+            self._file = open(self.path, 'a', encoding='utf-8')
+            self._write({"event": "end", "processed": processed_count, "errors": error_count, "time": time.time()}, sync=True)
+
+    def close(self):
+        with self._lock:
+            if self._file is None: return
+            try: os.fsync(self._file.fileno())
+            finally: self._file.close(); self._file = None
+
+
+def get_journal_path(folder_path, journal=True):
+    """Journal file for a folder: journal=True means FOLDER/JOURNAL_FILENAME, a string is used as the path."""
+    return journal if isinstance(journal, str) else os.path.join(os.path.abspath(folder_path), JOURNAL_FILENAME)
+
+
+# ==============================================================================
+# --- IMAGE PREPROCESSING (between decode and OCR) ---
+# ==============================================================================
+
+# Option keys: max_side (cap on the longest side, px), grayscale, deskew, binarize,
+# reduced_decode (let libjpeg decode JPEGs at 1/2, 1/4 or 1/8 scale when max_side allows).
+PREPROCESS_PRESETS = {
+    'none': None,
+    'balanced': {'max_side': 2560, 'reduced_decode': True},
+    'fast': {'max_side': 1600, 'grayscale': True, 'reduced_decode': True},
+    'document': {'max_side': 2560, 'grayscale': True, 'deskew': True, 'binarize': True, 'reduced_decode': True},
+}
+
+
+def resolve_preprocess(preprocess):
+    """Accepts a preset name, an options dict or None. Returns an options dict or None (no preprocessing)."""
+    if preprocess is None: return None
+    if isinstance(preprocess, str):
+        if preprocess not in PREPROCESS_PRESETS:
+            raise ValueError(f"Unknown preprocess preset '{preprocess}'. Choose from: {', '.join(PREPROCESS_PRESETS)}")
+        preprocess = PREPROCESS_PRESETS[preprocess]
+    return dict(preprocess) if preprocess else None
+
+
+def get_jpeg_dimensions(img_bytes):
+    """Reads (width, height) from a JPEG's SOF header without decoding. None if not a JPEG."""
+    if img_bytes[:2] != b'\xff\xd8': return None
+    i, n = 2, len(img_bytes)
+    while i + 9 < n:
+        if img_bytes[i] != 0xFF: i += 1; continue
+        marker = img_bytes[i + 1]
+        if marker == 0xFF: i += 1; continue # Fill byte
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8: i += 2; continue # Markers without a length
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC): # Start Of Frame
+            height = int.from_bytes(img_bytes[i + 5:i + 7], 'big')
+            width = int.from_bytes(img_bytes[i + 7:i + 9], 'big')
+            return width, height
+        i += 2 + int.from_bytes(img_bytes[i + 2:i + 4], 'big')
+    return None
+
+
+def choose_jpeg_reduction(img_bytes, preprocess):
+    """Largest JPEG decode downscale (1, 2, 4 or 8) that still keeps the longest side >= max_side."""
+    if not preprocess or not preprocess.get('reduced_decode') or not preprocess.get('max_side'): return 1
+    dimensions = get_jpeg_dimensions(img_bytes)
+    if not dimensions: return 1
+    longest = max(dimensions)
+    for factor in (8, 4, 2):
+        if longest / factor >= preprocess['max_side']: return factor
+    return 1
+
+
+def get_decode_flag(cv2, reduction, grayscale):
+    """cv2.imdecode flag for a decode reduction factor, in color or grayscale."""
+    if grayscale:
+        return {1: cv2.IMREAD_GRAYSCALE, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+                4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8}[reduction]
+    return {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+            4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}[reduction]
+
+
+def deskew_image(img, log, max_angle=15.0):
+    """
+    Straightens slightly rotated text: estimates the skew from the minimum-area rectangle
+    around dark (ink) pixels and rotates it away. Angles beyond max_angle are left alone.
+    """
+    cv2 = import_heavy('cv2')
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    coords = cv2.findNonZero(ink)
+    if coords is None or len(coords) < 50: return img
+    angle = cv2.minAreaRect(coords)[-1]
+    # OpenCV < 4.5.1 reports [-90, 0), newer versions (0, 90]: fold both into [-45, 45]
+    if angle < -45: angle += 90
+    elif angle > 45: angle -= 90
+    if abs(angle) < 0.3 or abs(angle) > max_angle: return img
+    log(f"     Deskewing by {angle:.2f} degrees")
+    h, w = img.shape[:2]
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    return cv2.warpAffine(img, matrix, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def preprocess_image(img, preprocess, filename, log):
+    """Applies downscale -> grayscale -> deskew -> binarize, as enabled in the options dict."""
+    cv2 = import_heavy('cv2')
+    max_side = preprocess.get('max_side')
+    h, w = img.shape[:2]
+    if max_side and max(h, w) > max_side:
+        scale = max_side / max(h, w)
+        img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+        log(f"     Downscaled {filename} from {w}x{h} to {img.shape[1]}x{img.shape[0]}")
+    if preprocess.get('grayscale') and img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if preprocess.get('deskew'):
+        img = deskew_image(img, log)
+    if preprocess.get('binarize'):
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        img = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 15)
+    return img
+
+
+def compare_preprocess_presets(image_paths, reader, languages, presets=('none', 'balanced', 'fast'), log=print):
+    """
+    Runs every preset over the same sample of images and reports the trade-off against
+    the first preset (the baseline, normally 'none'):
+    per preset -> total/avg decode+preprocess+OCR seconds, speedup, avg text length,
+    and avg text similarity to the baseline (difflib ratio, 1.0 = identical).
+    Returns a list of row dicts, one per preset.
+    """
+    samples = []
+    for image_path in image_paths:
+        try: samples.append((os.path.basename(image_path), read_image_bytes(image_path, lambda msg: None)))
+        except Exception as e: log(f"Warning: Skipping {image_path} in preprocess report: {e}")
+
+    quiet = lambda msg: None
+    rows, baseline_texts = [], None
+    for preset in presets:
+        options = resolve_preprocess(preset)
+        texts, seconds = [], 0.0
+        for filename, img_bytes in samples:
+            start_time = time.perf_counter()
+            try:
+                img = decode_image_bytes(img_bytes, filename, quiet, options)
+                texts.append(run_ocr_on_image(reader, img, languages, filename, quiet))
+            except Exception as e:
+                log(f"Warning: {filename} failed with preset '{preset}': {e}")
+                texts.append("")
+            seconds += time.perf_counter() - start_time
+        if baseline_texts is None: baseline_texts, baseline_seconds = texts, seconds
+        similarity = [difflib.SequenceMatcher(None, base, text).ratio() if (base or text) else 1.0
+                      for base, text in zip(baseline_texts, texts)]
+        row = {
+            "preset": preset, "images": len(samples), "total_seconds": round(seconds, 3),
+            "avg_seconds": round(seconds / max(1, len(samples)), 3),
+            "speedup": round(baseline_seconds / seconds, 2) if seconds else None,
+            "avg_text_length": round(sum(map(len, texts)) / max(1, len(texts)), 1),
+            "avg_similarity_to_baseline": round(sum(similarity) / max(1, len(similarity)), 4),
+        }
+        log(f"Preset '{preset}': {row['avg_seconds']:.3f}s/image (x{row['speedup']}), "
+            f"avg text length {row['avg_text_length']}, similarity to '{presets[0]}' {row['avg_similarity_to_baseline']:.3f}")
+        rows.append(row)
+    return rows
+
+
+# ==============================================================================
+# --- CPU INFERENCE MODE ---
+# ==============================================================================
+
+def resolve_cpu_mode(cpu_mode):
+    """Accepts None/False (off), True (CPU_MODE_DEFAULTS) or a dict of overrides. Returns an options dict or None."""
+    if not cpu_mode: return None
+    options = dict(CPU_MODE_DEFAULTS)
+    if isinstance(cpu_mode, dict):
+        unknown = set(cpu_mode) - set(CPU_MODE_DEFAULTS)
+        if unknown: raise ValueError(f"Unknown CPU mode option(s): {', '.join(sorted(unknown))}. Choose from: {', '.join(CPU_MODE_DEFAULTS)}")
+        options.update(cpu_mode)
+    return options
+
+
+def apply_cpu_mode(reader, cpu_mode, log):
+    """
+    Tunes torch for CPU inference: explicit intra-op/inter-op thread counts and, optionally,
+    a channels-last detector. Quantization itself happens when the Reader is built
+    (EasyOCR's quantize flag runs torch's dynamic int8 quantization on the recognizer).
+    Returns the reader.
+    """
+    torch = get_torch()
+    if torch is None or not cpu_mode: return reader
+    threads = cpu_mode['intra_op_threads'] or get_torch_threads_per_worker(1)
+    torch.set_num_threads(threads)
+    try: torch.set_num_interop_threads(cpu_mode['inter_op_threads'])
+    except RuntimeError: pass # Can only be set once per process (e.g. a daemon's second Reader)
+    if cpu_mode['channels_last'] and getattr(reader, 'detector', None) is not None:
+        reader.detector = reader.detector.to(memory_format=torch.channels_last)
+    log(f"OCR Task: CPU mode: recognizer {'int8 (dynamic quantization)' if cpu_mode['quantize'] else 'fp32'}, "
+        f"torch threads {threads} intra-op / {torch.get_num_interop_threads()} inter-op, "
+        f"inference_mode {'on' if cpu_mode['inference_mode'] else 'off'}, channels-last detector {'on' if cpu_mode['channels_last'] else 'off'}")
+    return reader
+
+
+def inference_context(cpu_mode):
+    """torch.inference_mode() for the OCR loop when the CPU mode asks for it, otherwise a no-op context."""
+    torch = get_torch() if cpu_mode and cpu_mode['inference_mode'] else None
+    if torch is None or not hasattr(torch, 'inference_mode'): return contextlib.nullcontext()
+    return torch.inference_mode()
+
+
+def compare_cpu_mode(image_paths, languages, cpu_mode, log=print, reader_factory=None):
+    """
+    Runs the same sample through an fp32 Reader (the baseline: no quantization, no
+    inference_mode, default layout, same thread counts) and through a Reader in `cpu_mode`,
+    and reports speed and how the text differs:
+    per variant -> total/avg OCR seconds, speedup, avg similarity to fp32 (difflib ratio),
+    and how many images came out with different text. Returns a list of row dicts.
+    """
+    reader_factory = reader_factory or create_reader
+    quiet = lambda msg: None
+    samples = []
+    for image_path in image_paths:
+        try: samples.append((os.path.basename(image_path), decode_image_bytes(read_image_bytes(image_path, quiet), image_path, quiet)))
+        except Exception as e: log(f"Warning: Skipping {image_path} in CPU mode report: {e}")
+
+    variants = [("fp32", dict(cpu_mode, quantize=False, inference_mode=False, channels_last=False)), ("cpu_mode", cpu_mode)]
+    rows, baseline_texts, baseline_seconds = [], None, None
+    for name, options in variants:
+        reader = reader_factory(languages, False, verbose=False, cpu_mode=options, log=log)
+        texts, seconds = [], 0.0
+        with inference_context(options):
+            for filename, img in samples:
+                start_time = time.perf_counter()
+                try: texts.append(run_ocr_on_image(reader, img, languages, filename, quiet))
+                except Exception as e:
+                    log(f"Warning: {filename} failed with {name}: {e}")
+                    texts.append("")
+                seconds += time.perf_counter() - start_time
+        if baseline_texts is None: baseline_texts, baseline_seconds = texts, seconds
+        similarity = [difflib.SequenceMatcher(None, base, text).ratio() if (base or text) else 1.0
+                      for base, text in zip(baseline_texts, texts)]
+        changed = [filename for (filename, _), base, text in zip(samples, baseline_texts, texts) if base != text]
+        row = {
+            "variant": name, "options": options, "images": len(samples), "total_seconds": round(seconds, 3),
+            "avg_seconds": round(seconds / max(1, len(samples)), 3),
+            "speedup": round(baseline_seconds / seconds, 2) if seconds else None,
+            "avg_similarity_to_fp32": round(sum(similarity) / max(1, len(similarity)), 4),
+            "images_with_different_text": len(changed), "changed_images": changed[:20],
+        }
+        log(f"{name}: {row['avg_seconds']:.3f}s/image (x{row['speedup']}), similarity to fp32 {row['avg_similarity_to_fp32']:.4f}, "
+            f"{len(changed)}/{len(samples)} image(s) with different text")
+        rows.append(row)
+    return rows
+
+
+# ==============================================================================
+# --- NEAR-DUPLICATE FRAMES (perceptual hash, reuse the previous frame's text) ---
+# ==============================================================================
+
+def resolve_dedup(dedup):
+    """Accepts None/False (off), True (DEDUP_DEFAULTS), an int (Hamming threshold) or a dict of overrides. Returns an options dict or None."""
+    if dedup is None or dedup is False: return None
+    options = dict(DEDUP_DEFAULTS)
+    if isinstance(dedup, dict):
+        unknown = set(dedup) - set(DEDUP_DEFAULTS)
+        if unknown: raise ValueError(f"Unknown near-duplicate option(s): {', '.join(sorted(unknown))}. Choose from: {', '.join(DEDUP_DEFAULTS)}")
+        options.update(dedup)
+    elif dedup is not True: options['threshold'] = int(dedup)
+    if options['hash'] not in ('phash', 'dhash'): raise ValueError(f"Unknown image hash '{options['hash']}'. Choose from: phash, dhash")
+    if options['hash_size'] < 2 or options['threshold'] < 0: raise ValueError("Near-duplicate hash_size must be >= 2 and threshold >= 0.")
+    return options
+
+
+def compute_image_hash(img, dedup):
+    """
+    Perceptual hash of a decoded image as an int of hash_size**2 bits, computed with NumPy
+    on a small grayscale copy (INTER_AREA downscale, so every source pixel contributes).
+    dhash: one bit per pixel of a (hash_size+1) x hash_size copy, set if it is brighter than its right neighbour.
+    phash: the lowest hash_size x hash_size 2D DCT coefficients of a 4*hash_size square copy, set if above their median.
+    """
+    np, cv2 = import_heavy('numpy'), import_heavy('cv2')
+    size = dedup['hash_size']
+    width, height = (size + 1, size) if dedup['hash'] == 'dhash' else (size * 4, size * 4)
+    small = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA) # Downscale before the grayscale conversion
+    small = (small if small.ndim == 2 else cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)).astype(np.float64)
+    if dedup['hash'] == 'dhash':
+        bits = small[:, 1:] > small[:, :-1]
+    else:
+        k = np.arange(width)
+        dct = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * width)) # DCT-II basis, one row per frequency
+        coefficients = (dct @ small @ dct.T)[:size, :size].ravel()
+        bits = coefficients > np.median(coefficients[1:]) # Median without the DC term
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), 'big')
+
+
+def hamming_distance(hash_a, hash_b):
+    """Number of differing bits between two image hashes."""
+    return bin(hash_a ^ hash_b).count('1')
+
+
+class NearDuplicateTracker:
+    """
+    Decides which frames can reuse the text of the last frame that was actually OCR'd (the anchor).
+    A frame is a near-duplicate when it has the anchor's exact size and its hash is within
+    the Hamming threshold. Frames are compared with the anchor rather than with their
+    immediate predecessor, so a slow drift over many frames still gets OCR'd again.
+    Meant for images processed in order (mod time) by one Reader; `reused` counts reused frames.
+    """
+    def __init__(self, dedup, metrics=None):
+        self.dedup = dedup
+        self.metrics = metrics
+        self.anchor = None # {"shape", "hash", "name", "text"}; text is None while the anchor's OCR is pending
+        self.reused = 0
+
+    def fingerprint(self, img):
+        """(shape, hash) of a decoded image, timed as the "hash" stage. Safe to call from the loader threads."""
+        if isinstance(img, TiledImage): return None # Huge scans and TIFF documents are always OCR'd
+        with stage_timer(self.metrics, "hash"): return img.shape, compute_image_hash(img, self.dedup)
+
+    def find_anchor(self, fingerprint):
+        """Returns (anchor, distance) if `fingerprint` is a near-duplicate of the anchor, else (None, None)."""
+        if fingerprint is None or self.anchor is None or fingerprint[0] != self.anchor["shape"]: return None, None
+        distance = hamming_distance(fingerprint[1], self.anchor["hash"])
+        return (self.anchor, distance) if distance <= self.dedup['threshold'] else (None, None)
+
+    def remember(self, fingerprint, text, filename):
+        """Makes a frame that is being OCR'd the new anchor. No fingerprint (e.g. a cache hit) clears the anchor."""
+        self.anchor = None if fingerprint is None else {"shape": fingerprint[0], "hash": fingerprint[1], "name": filename, "text": text}
+        return self.anchor
+
+    def reuse(self, anchor, distance, log):
+        """Counts and logs one reused frame. Returns the anchor's text."""
+        self.reused += 1
+        log(f"     Near-duplicate of '{anchor['name']}' (hash distance {distance} <= {self.dedup['threshold']}): reusing its OCR text (no OCR needed)")
+        return anchor["text"]
+
+
+# ==============================================================================
+# --- TILED OCR (huge scans in overlapping strips, multi-page TIFFs page by page) ---
+# ==============================================================================
+
+def resolve_tiling(tiling):
+    """Accepts None/False (off), True (TILING_DEFAULTS) or a dict of overrides. Returns an options dict or None."""
+    if not tiling: return None
+    options = dict(TILING_DEFAULTS)
+    if isinstance(tiling, dict):
+        unknown = set(tiling) - set(TILING_DEFAULTS)
+        if unknown: raise ValueError(f"Unknown tiling option(s): {', '.join(sorted(unknown))}. Choose from: {', '.join(TILING_DEFAULTS)}")
+        options.update(tiling)
+    if options['overlap'] < 0 or options['strip_pixels'] <= 0: raise ValueError("Tiling overlap must be >= 0 and strip_pixels > 0.")
+    return options
+
+
+def is_tiff(img_bytes):
+    return img_bytes[:4] in (b'II*\x00', b'MM\x00*')
+
+
+def get_image_dimensions(img_bytes):
+    """Reads (width, height) from a PNG, BMP or JPEG header without decoding. None for other formats."""
+    if img_bytes[:8] == b'\x89PNG\r\n\x1a\n' and len(img_bytes) >= 24:
+        return int.from_bytes(img_bytes[16:20], 'big'), int.from_bytes(img_bytes[20:24], 'big')
+    if img_bytes[:2] == b'BM' and len(img_bytes) >= 26:
+        return abs(int.from_bytes(img_bytes[18:22], 'little', signed=True)), abs(int.from_bytes(img_bytes[22:26], 'little', signed=True))
+    return get_jpeg_dimensions(img_bytes)
+
+
+def plan_strips(height, width, tiling):
+    """(top, bottom) rows of the overlapping full-width strips covering a page, the last one aligned to the bottom."""
+    overlap = tiling['overlap']
+    strip_height = max(2 * overlap, tiling['strip_pixels'] // max(1, width), 1)
+    if height <= strip_height: return [(0, height)]
+    step = max(1, strip_height - overlap)
+    return [(top, top + strip_height) for top in range(0, height - strip_height, step)] + [(height - strip_height, height)]
+
+
+def box_overlap(a, b):
+    """Intersection area of two (min_x, min_y, max_x, max_y) boxes over the smaller box's area."""
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0: return 0.0
+    return width * height / max(1e-6, min((a[2] - a[0]) * (a[3] - a[1]), (b[2] - b[0]) * (b[3] - b[1])))
+
+
+class TiledImage:
+    """
+    Takes the place of the decoded image in tiled mode for TIFFs (any number of pages) and for
+    images larger than tiling['min_side']. The loader threads only keep the file bytes; pages are
+    decoded one at a time when the model reaches them, so at most one full page per Reader is
+    in memory. `img` is set when the image was already decoded (size unknown from its header).
+    """
+    def __init__(self, img_bytes, filename, tiling, preprocess=None, img=None):
+        self.img_bytes = img_bytes
+        self.filename = filename
+        self.tiling = tiling
+        self.preprocess = preprocess
+        self.img = img
+        self.control = None # OCRRunControl checked between pages and strips (set by the OCR loop)
+        self.page_source = "buffer" # How single TIFF pages are decoded: "buffer", "file" or "first" (see decode_tiff_page)
+        self.temp_path = None
+
+    def pages(self, log, metrics=None):
+        """Yields the decoded (and preprocessed) pages in order. Raises IOError if no page can be decoded."""
+        if self.img is not None:
+            yield self.img
+            return
+        np, cv2 = import_heavy('numpy'), import_heavy('cv2')
+        buffer = np.frombuffer(self.img_bytes, np.uint8)
+        grayscale = self.tiling['grayscale'] or bool(self.preprocess and self.preprocess.get('grayscale'))
+        multi_page = is_tiff(self.img_bytes) and self.tiling['all_pages']
+        page_index = 0
+        try:
+            while True:
+                if self.control is not None: self.control.checkpoint()
+                with stage_timer(metrics, "decode"):
+                    if multi_page: page = self.decode_tiff_page(cv2, buffer, get_decode_flag(cv2, 1, grayscale), page_index, log)
+                    else: page = None if page_index else cv2.imdecode(buffer, get_decode_flag(cv2, choose_jpeg_reduction(self.img_bytes, self.preprocess), grayscale))
+                if page is None: break
+                page_index += 1
+                log(f"     Decoded page {page_index} of {self.filename}: {page.shape[1]}x{page.shape[0]}")
+                if self.preprocess:
+                    with stage_timer(metrics, "preprocess"): page = preprocess_image(page, self.preprocess, self.filename, log)
+                yield page
+                page = None
+        finally:
+            if self.temp_path is not None:
+                try: os.remove(self.temp_path)
+                except OSError: pass
+                self.temp_path = None
+        if page_index == 0: raise IOError(f"OpenCV could not decode image: {self.filename}")
+
+    def decode_tiff_page(self, cv2, buffer, flag, page_index, log):
+        """
+        Decodes only page `page_index` of a TIFF (None past the last page): from the buffer with a page
+        range (newer OpenCV), else from a temporary copy of the file with imreadmulti(start, count).
+        An OpenCV with neither can only decode the first page, so the other pages are skipped with a warning.
+        """
+        if self.page_source == "buffer":
+            try:
+                ok, decoded = cv2.imdecodemulti(buffer, flag, None, (page_index, page_index + 1))
+                return decoded[0] if ok and len(decoded) else None
+            except (AttributeError, TypeError, cv2.error): self.page_source = "file"
+        if self.page_source == "file":
+            try:
+                if self.temp_path is None:
+                    with tempfile.NamedTemporaryFile(suffix=".tif", delete=False) as f:
+                        self.temp_path = f.name
+                        f.write(self.img_bytes)
+                ok, decoded = cv2.imreadmulti(self.temp_path, page_index, 1, None, flag)
+                return decoded[0] if ok and len(decoded) else None
+            except (TypeError, cv2.error, OSError):
+                self.page_source = "first"
+                log(f"     Warning: This OpenCV can't decode single TIFF pages; only the first page of {self.filename} is OCR'd.")
+        return None if page_index else cv2.imdecode(buffer, flag)
+
+
+def run_strip_ocr(reader, page, tiling, log, control=None):
+    """
+    OCRs one huge page in overlapping full-width strips (see plan_strips) and returns its text.
+    Every strip is read at full resolution (canvas_size = its longest side, so EasyOCR doesn't shrink it).
+    Text lines touching a strip's cut edge are dropped (the neighbouring strip holds them whole) and
+    lines seen whole by two strips are kept once. The lines are then merged into paragraphs in page
+    coordinates, the way readtext's paragraph mode does it for a whole image.
+    """
+    height, width = page.shape[:2]
+    strips = plan_strips(height, width, tiling)
+    log(f"     Reading {width}x{height} page in {len(strips)} strip(s) of {strips[0][1] - strips[0][0]} rows ({tiling['overlap']} rows overlap)")
+    lines, previous_strip = [], [] # (bounds, box, text, confidence) in page coordinates
+    for top, bottom in strips:
+        if control is not None: control.checkpoint()
+        current = []
+        results = reader.readtext(page[top:bottom], canvas_size=max(width, bottom - top), **dict(READTEXT_OPTIONS, detail=1, paragraph=False))
+        for box, text, confidence in results:
+            xs, ys = [float(point[0]) for point in box], [float(point[1]) + top for point in box]
+            bounds = (min(xs), min(ys), max(xs), max(ys))
+            if (top > 0 and bounds[1] <= top + STRIP_EDGE_MARGIN) or (bottom < height and bounds[3] >= bottom - STRIP_EDGE_MARGIN): continue
+            if any(box_overlap(bounds, seen[0]) > 0.5 for seen in previous_strip): continue # Whole in both strips (inside the overlap)
+            current.append((bounds, [[x, y] for x, y in zip(xs, ys)], text, confidence))
+        lines += current
+        previous_strip = current
+    lines.sort(key=lambda line: (line[0][1] + line[0][3]) / 2) # Top to bottom, like EasyOCR's own detection order
+    if READTEXT_OPTIONS.get('paragraph'):
+        paragraphs = import_heavy('easyocr.utils').get_paragraph([[box, text, confidence] for _, box, text, confidence in lines], mode='ltr')
+        texts = [text for _, text in paragraphs]
+    else: texts = [text for _, _, text, _ in lines]
+    return "\n".join(texts).strip()
+
+
+def run_tiled_ocr(reader, document, languages, filename, log, metrics=None):
+    """
+    OCR stage for a TiledImage: pages in order, huge pages in strips (run_strip_ocr), the rest with one
+    readtext call each. Documents with several pages get a "--- Page N ---" line before each page's text.
+    The "ocr" stage records the model time of the whole document.
+    """
+    texts, ocr_seconds = [], 0.0
+    for page in document.pages(log, metrics):
+        start_time = time.perf_counter()
+        if max(page.shape[:2]) > document.tiling['min_side']: texts.append(run_strip_ocr(reader, page, document.tiling, log, document.control))
+        else: texts.append("\n".join(reader.readtext(page, **READTEXT_OPTIONS)).strip())
+        ocr_seconds += time.perf_counter() - start_time
+    if metrics is not None: metrics.observe("ocr", ocr_seconds)
+    if len(texts) == 1: return texts[0]
+    log(f"     OCR'd {len(texts)} pages of {filename}")
+    return "\n\n".join(f"--- Page {number} ---\n{text}" for number, text in enumerate(texts, 1))
+
+
+# ==============================================================================
+# --- RUN CONTROL (cancel, pause/resume, processing order) ---
+# ==============================================================================
+
+class OCRCancelled(Exception):
+    """Raised at a checkpoint inside an image once its run was cancelled (see OCRRunControl)."""
+
+
+class OCRRunControl:
+    """
+    Cooperative cancel and pause/resume of a perform_batch_ocr run, driven from another thread
+    (e.g. the GUI). The run checks it before each image and, for tiled documents, between pages
+    and strips; a model call that already started finishes first. Images finished before a cancel
+    keep their .txt files. Built on multiprocessing events so pool workers see it as well.
+    """
+    def __init__(self):
+        ctx = multiprocessing.get_context("spawn")
+        self._cancelled, self._running = ctx.Event(), ctx.Event()
+        self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        self._running.set() # Wake a paused run so it can stop
+
+    def pause(self): self._running.clear()
+
+    def resume(self): self._running.set()
+
+    @property
+    def cancelled(self): return self._cancelled.is_set()
+
+    @property
+    def paused(self): return not self._running.is_set() and not self.cancelled
+
+    def wait(self):
+        """Blocks while paused. Returns False once the run is cancelled (don't start the next image)."""
+        self._running.wait()
+        return not self._cancelled.is_set()
+
+    def checkpoint(self):
+        """wait() for use inside an image: raises OCRCancelled instead of returning False."""
+        if not self.wait(): raise OCRCancelled("OCR run cancelled")
+
+
+OCR_ORDER_POLICIES = {
+    "mtime": None, # Oldest first, like the compiled file
+    "smallest": lambda entry: entry.size, # Small (quick) images first, so they don't wait behind huge ones
+    "priority": None, # Images named in the priority list first (in list order), then the rest oldest first
+}
+
+
+def resolve_ocr_order(order=DEFAULT_OCR_ORDER, priority=None):
+    """
+    Returns the sort key (ImageEntry -> comparable) for a processing order, or None to keep mtime order.
+    `order` is an OCR_ORDER_POLICIES name or any key function; `priority` lists image names or paths
+    for "priority" (and with "mtime" implies it). Raises ValueError for unknown orders.
+    """
+    if callable(order): return order
+    order = order or DEFAULT_OCR_ORDER
+    if order not in OCR_ORDER_POLICIES: raise ValueError(f"Unknown processing order '{order}' (expected one of: {', '.join(OCR_ORDER_POLICIES)})")
+    if order == "priority" or (order == "mtime" and priority):
+        if not priority: raise ValueError("Processing order 'priority' needs a priority list of image names.")
+        ranks = {}
+        for name in priority: ranks.setdefault(os.path.basename(name), len(ranks))
+        return lambda entry: ranks.get(entry.name, len(ranks))
+    return OCR_ORDER_POLICIES[order]
+
+
+# ==============================================================================
+# --- PER-IMAGE OCR STAGES ---
+# ==============================================================================
+
+def create_reader(languages, use_gpu, verbose=True, cpu_mode=None, log=None):
+    """
+    Builds an easyocr.Reader (imports easyocr/torch on first call).
+    On CPU EasyOCR int8-quantizes the recognizer by default; with a cpu_mode (see resolve_cpu_mode)
+    the quantize flag is passed explicitly (fp32 with quantize=False) and torch threading/memory
+    layout are tuned.
+    """
+    easyocr = import_heavy('easyocr')
+    if not cpu_mode or use_gpu: return easyocr.Reader(languages, gpu=use_gpu, verbose=verbose)
+    reader = easyocr.Reader(languages, gpu=False, verbose=verbose, quantize=cpu_mode['quantize'])
+    return apply_cpu_mode(reader, cpu_mode, log or (lambda msg: None))
+
+
+def detect_gpu(log):
+    """Returns True if PyTorch reports a usable CUDA device (logs the decision)."""
+    torch = get_torch()
+    if torch is None: log("INFO: PyTorch not found, using CPU."); return False
+    try:
+        if torch.cuda.is_available(): log("INFO: PyTorch CUDA found, attempting GPU."); return True
+        log("INFO: PyTorch CUDA not available, using CPU.")
+    except Exception as torch_err: log(f"INFO: Error checking Torch CUDA ({torch_err}), using CPU.")
+    return False
+
+
+def read_image_bytes(image_path, log):
+    """Reads the raw bytes of an image file. Raises IOError if the file is empty."""
+    log(f"     Reading image file: {image_path}")
+    with open(image_path, "rb") as f: img_bytes = f.read()
+    if not img_bytes: raise IOError(f"File is empty: {os.path.basename(image_path)}")
+    return img_bytes
+
+
+def decode_image_bytes(img_bytes, filename, log, preprocess=None, metrics=None, tiling=None):
+    """
+    Decodes image bytes into a BGR (or, with grayscale preprocessing, single channel)
+    numpy array for EasyOCR, then applies the optional preprocessing options.
+    Large JPEGs are decoded directly at reduced resolution when the options allow it.
+    Falls back to IMREAD_UNCHANGED (and BGRA -> BGR) for images IMREAD_COLOR can't handle.
+    With tiling options, TIFFs and images over tiling['min_side'] come back as a TiledImage
+    (decoded page by page at OCR time) instead.
+    Raises IOError if the data cannot be decoded.
+    """
+    if tiling:
+        dimensions = get_image_dimensions(img_bytes)
+        if is_tiff(img_bytes) or (dimensions and max(dimensions) > tiling['min_side']):
+            log(f"     Tiled mode: {filename} is decoded page by page when OCR reaches it")
+            return TiledImage(img_bytes, filename, tiling, preprocess)
+    np, cv2 = import_heavy('numpy'), import_heavy('cv2')
+    img_np = np.frombuffer(img_bytes, np.uint8)
+    log(f"     Decoding image data for: {filename}")
+    reduction = choose_jpeg_reduction(img_bytes, preprocess)
+    if reduction > 1: log(f"     Decoding JPEG at 1/{reduction} resolution")
+    with stage_timer(metrics, "decode"):
+        img = cv2.imdecode(img_np, get_decode_flag(cv2, reduction, bool(preprocess and preprocess.get('grayscale'))))
+        if img is None:
+            img = cv2.imdecode(img_np, cv2.IMREAD_UNCHANGED)
+            if img is None: raise IOError(f"OpenCV could not decode image: {filename}")
+            if len(img.shape) > 2 and img.shape[2] == 4:
+                 log(f"     INFO: Converting RGBA/BGRA image to BGR for {filename}")
+                 img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    if preprocess:
+        with stage_timer(metrics, "preprocess"): img = preprocess_image(img, preprocess, filename, log)
+    if tiling and max(img.shape[:2]) > tiling['min_side']: return TiledImage(img_bytes, filename, tiling, preprocess, img=img)
+    return img
+
+
+def load_image_for_ocr(image_path, log, ocr_cache=None, preprocess=None, metrics=None, tiling=None, control=None, hash_bytes=False):
+    """
+    Load stage: reads the file, looks its bytes up in the OCR cache and decodes it on a miss.
+    Returns (img, cache_key, cached_text). img is None when cached_text can be reused.
+    Without a cache, hash_bytes still hashes the bytes (for the text store): cache_key is then the
+    bare sha256; get_key_digest gives it in both cases.
+    A TiledImage gets `control` (an OCRRunControl) to check between its pages and strips.
+    """
+    filename = os.path.basename(image_path)
+    with stage_timer(metrics, "read"): img_bytes = read_image_bytes(image_path, log)
+    cache_key = hashlib.sha256(img_bytes).hexdigest() if hash_bytes and ocr_cache is None else None
+    if ocr_cache is not None:
+        cache_key = ocr_cache.key_for(img_bytes)
+        cached_text = ocr_cache.get(cache_key)
+        if cached_text is not None:
+            log(f"     Cache hit: reusing OCR text for {filename} (no decode/OCR needed)")
+            return None, cache_key, cached_text
+    img = decode_image_bytes(img_bytes, filename, log, preprocess, metrics, tiling)
+    if isinstance(img, TiledImage): img.control = control
+    return img, cache_key, None
+
+
+def run_ocr_on_image(reader, img, languages, filename, log, metrics=None):
+    """Runs EasyOCR on an already decoded image (or a TiledImage). Returns the extracted text (stripped)."""
+    if reader is None: raise RuntimeError("EasyOCR reader was not initialized.")
+    log(f"     Performing OCR ({'/'.join(languages)}) on image data from: {filename}")
+    if isinstance(img, TiledImage): return run_tiled_ocr(reader, img, languages, filename, log, metrics)
+    with stage_timer(metrics, "ocr"): results = reader.readtext(img, **READTEXT_OPTIONS)
+    return "\n".join(results).strip()
+
+
+def run_ocr_on_batch(reader, imgs, languages, filenames, log, metrics=None):
+    """
+    Runs EasyOCR's batched entry point on images that all have the same shape (see pad_images_to_bucket), so detection
+    runs as one stacked forward pass and the crops are recognized RECOGNITION_BATCH_SIZE at a time.
+    Returns one extracted text (stripped) per image, in input order.
+    The "ocr" stage records the batch time split evenly over its images.
+    """
+    if reader is None: raise RuntimeError("EasyOCR reader was not initialized.")
+    height, width = imgs[0].shape[:2]
+    log(f"     Performing batched OCR ({'/'.join(languages)}) on {len(imgs)} images of {width}x{height}: {', '.join(filenames)}")
+    # n_width/n_height equal to the shared size: EasyOCR's resize step becomes a no-op
+    start_time = time.perf_counter()
+    results = reader.readtext_batched(imgs, n_width=width, n_height=height, batch_size=RECOGNITION_BATCH_SIZE, **READTEXT_OPTIONS)
+    if metrics is not None:
+        for _ in imgs: metrics.observe("ocr", (time.perf_counter() - start_time) / len(imgs))
+    if len(results) != len(imgs): raise RuntimeError(f"readtext_batched returned {len(results)} results for {len(imgs)} images.")
+    return ["\n".join(result).strip() for result in results]
+
+
+def get_batch_bucket(shape):
+    """Batching bucket of an image shape: height and width rounded up to BATCH_SIZE_BUCKET_PX, plus the channel count."""
+    return tuple(-(-side // BATCH_SIZE_BUCKET_PX) * BATCH_SIZE_BUCKET_PX for side in shape[:2]) + tuple(shape[2:])
+
+
+def pad_images_to_bucket(imgs):
+    """
+    Pads one bucket's images to its largest height and width, so they can share a batched call.
+    Padding goes below and to the right (text keeps its coordinates) in the median colour of each
+    image's bottom row and right column, so it reads as background. Same-shaped images are left
+    alone; padded ones can get slightly different text than when read on their own.
+    """
+    height, width = max(img.shape[0] for img in imgs), max(img.shape[1] for img in imgs)
+    if all(img.shape[:2] == (height, width) for img in imgs): return imgs
+    np = import_heavy('numpy')
+    padded = []
+    for img in imgs:
+        if img.shape[:2] != (height, width):
+            canvas = np.empty((height, width) + img.shape[2:], img.dtype)
+            canvas[...] = np.median(np.concatenate([img[-1], img[:, -1]]), axis=0).astype(img.dtype)
+            canvas[:img.shape[0], :img.shape[1]] = img
+            img = canvas
+        padded.append(img)
+    return padded
+
+
+def recognize_image_group(reader, group, languages, log, ocr_cache=None, metrics=None):
+    """
+    OCR stage for several loaded images at once. `group` is a list of (filename, loaded) tuples,
+    loaded being the output of load_image_for_ocr (or None if it failed to load).
+    Cache hits are returned as-is; the remaining images are bucketed by size (sides rounded up to
+    BATCH_SIZE_BUCKET_PX) and each bucket with more than one image is padded to one size (see
+    pad_images_to_bucket) and goes through run_ocr_on_batch. If a batched call fails, its images
+    fall back to one readtext call each so one bad image cannot fail its whole bucket.
+    Returns a list of (text, error) per group entry, in group order.
+    """
+    outcomes = [None] * len(group)
+    buckets = {} # size bucket -> [group index, ...]
+    for i, (filename, loaded) in enumerate(group):
+        if loaded is None: continue
+        img, cache_key, cached_text = loaded
+        if cached_text is not None: outcomes[i] = (cached_text, None)
+        else: buckets.setdefault(("tiled", i) if isinstance(img, TiledImage) else get_batch_bucket(img.shape), []).append(i)
+
+    for indices in buckets.values():
+        if len(indices) > 1:
+            try:
+                texts = run_ocr_on_batch(reader, pad_images_to_bucket([group[i][1][0] for i in indices]), languages,
+                                         [group[i][0] for i in indices], log, metrics)
+                for i, text in zip(indices, texts): outcomes[i] = (text, None)
+            except Exception as e:
+                log(f"     Warning: Batched OCR failed ({e}); retrying these {len(indices)} images one at a time.")
+        for i in indices:
+            if outcomes[i] is not None: continue
+            try: outcomes[i] = (run_ocr_on_image(reader, group[i][1][0], languages, group[i][0], log, metrics), None)
+            except Exception as e: outcomes[i] = (None, e)
+
+    for i, (filename, loaded) in enumerate(group):
+        if loaded is None or outcomes[i][1] is not None or loaded[2] is not None: continue
+        cache_key = loaded[1]
+        if ocr_cache is not None and cache_key is not None:
+            try: ocr_cache.put(cache_key, outcomes[i][0])
+            except Exception as e: log(f"     Warning: Could not store OCR text in cache for {filename}: {e}")
+    return outcomes
+
+
+def save_ocr_text(image_path, extracted_text, log, metrics=None, store=None, digest=None):
+    """
+    Writes extracted text to the image's unique .txt file (and queues it, with the image's
+    sha256 `digest` from the load stage, for the OCRTextStore, if any).
+    The text goes to a temp file that is fsync'ed and renamed over the .txt, so a crash never leaves
+    a truncated .txt behind. Returns True on success.
+    """
+    output_filename = get_unique_txt_path(image_path)
+    output_txt_basename = os.path.basename(output_filename) # For logging
+    tmp_filename = f"{output_filename}.{socket.gethostname()}.{os.getpid()}.tmp" # Per process and host: pool workers and sharded nodes never share one
+    log(f"     Saving extracted text to unique file: '{output_txt_basename}'")
+    try:
+        with stage_timer(metrics, "write"):
+            with open(tmp_filename, 'w', encoding='utf-8') as f:
+                f.write(extracted_text)
+                f.flush(); os.fsync(f.fileno())
+            os.replace(tmp_filename, output_filename)
+        log(f"     Successfully saved: '{output_txt_basename}'")
+        if store is not None: store.add(image_path, extracted_text, digest)
+        return True
+    except Exception as e:
+        log(f"     !!! Error SAVING text file '{output_txt_basename}': {e} !!!")
+        try: os.remove(tmp_filename)
+        except OSError: pass
+        return False
+
+
+def log_image_error(image_path, error, log):
+    """Logs a read/decode/OCR failure for one image in the standard format."""
+    log(f"!!! Error PROCESSING image '{os.path.basename(image_path)}': {error} !!!")
+    log(f"     Full image path with error: {image_path}")
+    # log(traceback.format_exc()) # Uncomment for full traceback
+
+
+def recognize_loaded_image(reader, loaded, languages, filename, log, ocr_cache=None, metrics=None):
+    """
+    OCR stage for the output of load_image_for_ocr: reuses cached text or runs the model
+    (storing the new text in the cache). Returns the extracted text.
+    """
+    img, cache_key, cached_text = loaded
+    if cached_text is not None: return cached_text
+    extracted_text = run_ocr_on_image(reader, img, languages, filename, log, metrics)
+    if ocr_cache is not None and cache_key is not None:
+        try: ocr_cache.put(cache_key, extracted_text)
+        except Exception as e: log(f"     Warning: Could not store OCR text in cache for {filename}: {e}")
+    return extracted_text
+
+
+def report_image_progress(progress_callback, image_path, position, saved, cache_hit=False, text_length=0, seconds=0.0, near_duplicate=False):
+    """Sends one per-image record to progress_callback (see perform_batch_ocr for the record types)."""
+    if progress_callback is None: return
+    try: progress_callback({"type": "image", "image": os.path.basename(image_path), "position": position, "saved": saved,
+                            "cache_hit": cache_hit, "near_duplicate": near_duplicate, "text_length": text_length, "seconds": round(seconds, 3)})
+    except Exception as e: print(f"Error in progress_callback: {e}")
+
+
+def ocr_and_save_image(reader, image_path, languages, position, log, ocr_cache=None, preprocess=None, progress_callback=None, metrics=None, tiling=None, store=None, control=None):
+    """
+    Reads, decodes and OCRs a single image, then saves the text to its unique .txt file.
+    Used by the parallel worker processes and when prefetching is disabled.
+    Returns True if the .txt file was saved, False on any error (already logged).
+    Raises OCRCancelled if `control` (an OCRRunControl) was cancelled before the text was saved.
+    """
+    filename = os.path.basename(image_path)
+    log(f"===> Processing ({position}): Image '{filename}'")
+    start_time = time.time()
+
+    try:
+        loaded = load_image_for_ocr(image_path, log, ocr_cache, preprocess, metrics, tiling, control, hash_bytes=store is not None)
+        if control is not None: control.checkpoint() # Decoded but not OCR'd yet
+        extracted_text = recognize_loaded_image(reader, loaded, languages, filename, log, ocr_cache, metrics)
+        elapsed_time = time.time() - start_time
+        log(f"     OCR complete for {filename} in {elapsed_time:.2f}s. Text length: {len(extracted_text)}")
+    except OCRCancelled:
+        log(f"     OCR of {filename} cancelled.")
+        raise
+    except Exception as e:
+        log_image_error(image_path, e, log)
+        report_image_progress(progress_callback, image_path, position, False, seconds=time.time() - start_time)
+        return False
+
+    saved = save_ocr_text(image_path, extracted_text, log, metrics, store, get_key_digest(loaded[1]))
+    report_image_progress(progress_callback, image_path, position, saved, loaded[2] is not None, len(extracted_text), elapsed_time)
+    return saved
+
+
+def run_ocr_pipeline(reader, pending, languages, log, prefetch=DEFAULT_PREFETCH_IMAGES, ocr_cache=None, preprocess=None,
+                     batch_images=DEFAULT_OCR_BATCH_IMAGES, progress_callback=None, metrics=None, dedup=None, tiling=None, store=None, control=None):
+    """
+    Bounded producer/consumer OCR loop for a single Reader.
+    - A thread pool reads and decodes up to `prefetch` images ahead of the one being OCR'd.
+    - The calling thread runs readtext (the model) on images strictly in `pending` order.
+    - A single writer thread saves the .txt files so disk writes never block the model.
+    Log lines from the loader are buffered per image and replayed when that image
+    reaches the model, so each image's log block stays together and in order.
+    With batch_images > 1 the model takes the next `batch_images` loaded images at once and
+    runs same-sized ones through a single batched call (see recognize_image_group).
+    With a NearDuplicateTracker as `dedup`, the loader threads also hash every decoded image and
+    frames close enough to the last OCR'd one reuse its text instead of going through the model.
+    With tiling options, TIFFs and huge images only hold their file bytes while queued (see TiledImage).
+    Saved texts are also queued for `store` (an OCRTextStore), which writes them in bulk transactions.
+    With an OCRRunControl as `control`, the loop waits while it is paused and stops once it is
+    cancelled (before the next image, or between the pages/strips of a tiled one); images that were
+    only prefetched are dropped and already queued .txt writes still finish.
+    `pending` is a list of (image_path, position) tuples. progress_callback gets one
+    per-image record once its .txt write has finished (or the image failed).
+    Returns (processed_count, error_count).
+    """
+    group_size = max(1, batch_images)
+    if group_size > 1 or dedup is not None: prefetch = max(prefetch, 1) # Batching and hashing run in the loader threads
+    if prefetch <= 0:
+        processed_count, error_count = 0, 0
+        for image_path, position in pending:
+            if control is not None and not control.wait(): break
+            try: saved = ocr_and_save_image(reader, image_path, languages, position, log, ocr_cache, preprocess, progress_callback, metrics, tiling, store, control)
+            except OCRCancelled: break
+            if saved: processed_count += 1
+            else: error_count += 1
+        return processed_count, error_count
+
+    def load_task(image_path):
+        messages = []
+        try:
+            loaded = load_image_for_ocr(image_path, messages.append, ocr_cache, preprocess, metrics, tiling, control, hash_bytes=store is not None)
+            fingerprint = dedup.fingerprint(loaded[0]) if dedup is not None and loaded[0] is not None else None
+            return loaded, messages, None, fingerprint
+        except Exception as e: return None, messages, e, None
+
+    processed_count, error_count = 0, 0
+    pending_iter = iter(pending)
+    loading = collections.deque() # (image_path, position, future) in processing order
+    saving = collections.deque()  # (future, image_path, position, cache_hit, text_length, seconds, near_duplicate) of queued .txt writes, oldest first
+    max_queued_writes = max(2, prefetch * 2)
+
+    def reap_writes(wait_all=False):
+        # Collect finished writes; block on the oldest one only while the write queue is full.
+        nonlocal processed_count, error_count
+        while saving and (wait_all or saving[0][0].done() or len(saving) >= max_queued_writes):
+            future, image_path, position, cache_hit, text_length, seconds, near_duplicate = saving.popleft()
+            saved = future.result()
+            if saved: processed_count += 1
+            else: error_count += 1
+            report_image_progress(progress_callback, image_path, position, saved, cache_hit, text_length, seconds, near_duplicate)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=prefetch, thread_name_prefix="ocr-prefetch") as loader, \
+         concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="ocr-writer") as writer:
+
+        def submit_next_load():
+            item = next(pending_iter, None)
+            if item is not None: loading.append((item[0], item[1], loader.submit(load_task, item[0])))
+
+        for _ in range(prefetch + group_size): submit_next_load() # At most prefetch+group_size decoded images in memory
+
+        while loading and group_size == 1:
+            if control is not None and not control.wait(): loading.clear(); break # Cancelled: drop the prefetched images
+            image_path, position, future = loading.popleft()
+            filename = os.path.basename(image_path)
+            loaded, messages, load_error, fingerprint = future.result()
+            submit_next_load()
+
+            log(f"===> Processing ({position}): Image '{filename}'")
+            for msg in messages: log(msg)
+            start_time = time.time()
+            anchor = None
+            try:
+                if load_error is not None: raise load_error
+                if dedup is not None: anchor, distance = dedup.find_anchor(fingerprint)
+                if anchor is not None: extracted_text = dedup.reuse(anchor, distance, log)
+                else:
+                    extracted_text = recognize_loaded_image(reader, loaded, languages, filename, log, ocr_cache, metrics)
+                    if dedup is not None: dedup.remember(fingerprint, extracted_text, filename)
+                elapsed_time = time.time() - start_time
+                log(f"     OCR complete for {filename} in {elapsed_time:.2f}s. Text length: {len(extracted_text)}")
+            except OCRCancelled:
+                log(f"     OCR of {filename} cancelled.")
+                loading.clear(); break
+            except Exception as e:
+                log_image_error(image_path, e, log)
+                report_image_progress(progress_callback, image_path, position, False, seconds=time.time() - start_time)
+                error_count += 1
+                continue
+
+            saving.append((writer.submit(save_ocr_text, image_path, extracted_text, log, metrics, store, get_key_digest(loaded[1])),
+                           image_path, position, loaded[2] is not None, len(extracted_text), elapsed_time, anchor is not None))
+            reap_writes()
+
+        while loading: # Batched mode: one model call per group of loaded images
+            if control is not None and not control.wait(): loading.clear(); break
+            group = [] # (image_path, position, filename, loaded, fingerprint)
+            while loading and len(group) < group_size:
+                image_path, position, future = loading.popleft()
+                filename = os.path.basename(image_path)
+                loaded, messages, load_error, fingerprint = future.result()
+                submit_next_load()
+                log(f"===> Processing ({position}): Image '{filename}'")
+                for msg in messages: log(msg)
+                if load_error is not None:
+                    log_image_error(image_path, load_error, log)
+                    report_image_progress(progress_callback, image_path, position, False)
+                    error_count += 1
+                    continue
+                group.append((image_path, position, filename, loaded, fingerprint))
+            if not group: continue
+
+            # Near-duplicates are decided in order before the model runs; an anchor inside the group gets its text after the batch
+            anchors, duplicates = {}, {} # group index -> anchor this image starts / (anchor, distance) it reuses
+            for i, (_, _, filename, _, fingerprint) in enumerate(group if dedup is not None else ()):
+                anchor, distance = dedup.find_anchor(fingerprint)
+                if anchor is not None: duplicates[i] = (anchor, distance)
+                else: anchors[i] = dedup.remember(fingerprint, None, filename)
+
+            start_time = time.time()
+            outcomes = recognize_image_group(reader, [(filename, None if i in duplicates else loaded) for i, (_, _, filename, loaded, _) in enumerate(group)],
+                                             languages, log, ocr_cache, metrics)
+            for i, anchor in anchors.items():
+                if anchor is not None and outcomes[i][1] is None: anchor["text"] = outcomes[i][0]
+            for i, (anchor, distance) in list(duplicates.items()):
+                if anchor["text"] is not None: outcomes[i] = (dedup.reuse(anchor, distance, log), None); continue
+                try: outcomes[i] = (recognize_loaded_image(reader, group[i][3], languages, group[i][2], log, ocr_cache, metrics), None) # Its anchor failed
+                except Exception as e: outcomes[i] = (None, e)
+                duplicates.pop(i)
+            if dedup is not None and dedup.anchor is not None and dedup.anchor["text"] is None: dedup.anchor = None # Last anchor failed
+            per_image_time = (time.time() - start_time) / len(group)
+            for i, ((image_path, position, filename, loaded, _), (extracted_text, ocr_error)) in enumerate(zip(group, outcomes)):
+                if isinstance(ocr_error, OCRCancelled): log(f"     OCR of {filename} cancelled."); continue
+                if ocr_error is not None:
+                    log_image_error(image_path, ocr_error, log)
+                    report_image_progress(progress_callback, image_path, position, False, seconds=per_image_time)
+                    error_count += 1
+                    continue
+                log(f"     OCR complete for {filename} in {per_image_time:.2f}s (batch average). Text length: {len(extracted_text)}")
+                saving.append((writer.submit(save_ocr_text, image_path, extracted_text, log, metrics, store, get_key_digest(loaded[1])),
+                               image_path, position, loaded[2] is not None, len(extracted_text), per_image_time, i in duplicates))
+                reap_writes()
+
+        reap_writes(wait_all=True)
+
+    return processed_count, error_count
+
+
+# --- Parallel OCR: state living inside each worker process ---
+# Each worker builds ONE easyocr.Reader in the pool initializer and reuses it
+# for every image it is handed, so models are loaded once per process, not per image.
+_worker_reader = None
+_worker_languages = None
+_worker_init_error = None
+_worker_cache = None
+_worker_preprocess = None
+_worker_collect_metrics = False
+_worker_cpu_mode = None
+_worker_tiling = None
+_worker_control = None
+_worker_collect_store_rows = False
+
+def get_torch_threads_per_worker(workers):
+    """Splits the machine's cores evenly between OCR workers (at least 1 thread each)."""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def _init_ocr_worker(languages, use_gpu, torch_threads, cache_path=None, preprocess=None, collect_metrics=False, cpu_mode=None, tiling=None, control=None,
+                     collect_store_rows=False):
+    """Worker process initializer: limits torch intra-op threads and loads this worker's Reader (and cache) once."""
+    global _worker_reader, _worker_languages, _worker_init_error, _worker_cache, _worker_preprocess, _worker_collect_metrics, _worker_cpu_mode, _worker_tiling, _worker_control
+    global _worker_collect_store_rows
+    _worker_control = control
+    _worker_collect_store_rows = collect_store_rows
+    if control is not None: signal.signal(signal.SIGINT, signal.SIG_IGN) # The parent turns Ctrl+C into control.cancel()
+    _worker_languages = languages
+    _worker_preprocess = preprocess
+    _worker_collect_metrics = collect_metrics
+    _worker_cpu_mode = cpu_mode
+    _worker_tiling = tiling
+    _worker_cache = open_ocr_cache(cache_path, languages, print, preprocess, cpu_mode, tiling) if cache_path else None
+    try:
+        torch = get_torch()
+        if torch is not None and torch_threads:
+            torch.set_num_threads(torch_threads)
+        if cpu_mode: cpu_mode = dict(cpu_mode, intra_op_threads=cpu_mode['intra_op_threads'] or torch_threads)
+        _worker_reader = create_reader(languages, use_gpu, verbose=False, cpu_mode=cpu_mode)
+    except Exception as e:
+        # Never raise from an initializer: the executor would only report a broken pool, without the reason.
+        _worker_init_error = f"{e}"
+
+
+def _ocr_worker_task(task):
+    """
+    Runs in a worker process.
+    Returns (image_path, saved_ok, cache_hit, log_messages, progress_records, stage_samples, init_error, cancelled, store_rows).
+    """
+    image_path, position = task
+    messages, records = [], []
+    samples = _StageSamples() if _worker_collect_metrics else None
+    store_rows = _StoreRows() if _worker_collect_store_rows else None
+    if _worker_init_error is not None:
+        return image_path, False, False, messages, records, samples, _worker_init_error, False, store_rows
+    if _worker_control is not None and not _worker_control.wait(): # Blocks while paused
+        return image_path, False, False, messages, records, samples, None, True, store_rows
+    hits_before = _worker_cache.hits if _worker_cache is not None else 0
+    try:
+        with timed_reader_stages(_worker_reader, samples), inference_context(_worker_cpu_mode):
+            saved = ocr_and_save_image(_worker_reader, image_path, _worker_languages, position, messages.append,
+                                       _worker_cache, _worker_preprocess, records.append, samples, _worker_tiling, store_rows, _worker_control)
+    except OCRCancelled:
+        return image_path, False, False, messages, records, samples, None, True, store_rows
+    cache_hit = _worker_cache is not None and _worker_cache.hits > hits_before
+    return image_path, saved, cache_hit, messages, records, samples, None, False, store_rows
+
+
+# --- Progress records: aggregate counters for the GUI, the CLI and the daemon ---
+class ProgressCounters:
+    """
+    Running totals built from perform_batch_ocr's progress records. Memory stays constant
+    however many images a run has: records are folded into counters, not kept.
+    """
+    def __init__(self):
+        self.total = self.pending = self.skipped = 0
+        self.processed = self.errors = self.cache_hits = self.near_duplicates = self.text_chars = self.cancelled = 0
+        self.start_time = None
+        self.elapsed = 0.0
+        self.finished = False
+
+    def update(self, record):
+        kind = record.get("type")
+        if kind == "start":
+            self.total, self.pending, self.skipped = record["total"], record["pending"], record["skipped"]
+            self.start_time = time.time()
+        elif kind == "image":
+            if record["saved"]: self.processed += 1
+            else: self.errors += 1
+            if record.get("cache_hit"): self.cache_hits += 1
+            if record.get("near_duplicate"): self.near_duplicates += 1
+            self.text_chars += record.get("text_length", 0)
+        elif kind == "finish":
+            self.processed, self.skipped, self.errors = record["processed"], record["skipped"], record["errors"]
+            self.cache_hits, self.elapsed, self.finished = record["cache_hits"], record["seconds"], True
+            self.near_duplicates = record.get("near_duplicates", self.near_duplicates)
+            self.cancelled = record.get("cancelled", 0)
+
+    @property
+    def done(self):
+        return self.processed + self.errors
+
+    @property
+    def fraction(self):
+        return self.done / self.pending if self.pending else (1.0 if self.finished else 0.0)
+
+    def elapsed_seconds(self):
+        if self.finished or self.start_time is None: return self.elapsed
+        return time.time() - self.start_time
+
+    def images_per_second(self):
+        elapsed = self.elapsed_seconds()
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        return (f"Images: {self.done}/{self.pending} done ({self.skipped} skipped) | Errors: {self.errors} | "
+                f"Cache hits: {self.cache_hits} | " + (f"Near-duplicates: {self.near_duplicates} | " if self.near_duplicates else "")
+                + (f"Cancelled: {self.cancelled} | " if self.cancelled else "")
+                + f"{self.images_per_second():.1f} img/s | {self.elapsed_seconds():.0f}s")
+
+
+# --- Run metrics: per-stage latency histograms, throughput, peak RSS, optional profiling ---
+@contextlib.contextmanager
+def stage_timer(metrics, stage):
+    """Times the with-block into the `stage` histogram of metrics (no-op when metrics is None)."""
+    if metrics is None:
+        yield
+        return
+    start_time = time.perf_counter()
+    try: yield
+    finally: metrics.observe(stage, time.perf_counter() - start_time)
+
+
+@contextlib.contextmanager
+def timed_reader_stages(reader, metrics):
+    """
+    Times EasyOCR's detection and recognition separately for the with-block by wrapping the
+    reader's detect/recognize methods, which readtext and readtext_batched call internally.
+    """
+    wrapped = []
+    if metrics is not None and reader is not None:
+        for stage in ("detect", "recognize"):
+            method = getattr(reader, stage, None)
+            if method is None: continue
+            def timed(*args, _method=method, _stage=stage, **kwargs):
+                with stage_timer(metrics, _stage): return _method(*args, **kwargs)
+            setattr(reader, stage, timed); wrapped.append(stage)
+    try: yield
+    finally:
+        for stage in wrapped: delattr(reader, stage) # Back to the class methods
+
+
+def get_peak_rss_bytes():
+    """Peak resident set size of (this process, largest finished child process) in bytes; None where unavailable."""
+    try: import resource # Not available on Windows
+    except ImportError: return None, None
+    scale = 1 if sys.platform == "darwin" else 1024 # ru_maxrss is bytes on macOS, KiB on Linux
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (Prometheus style): constant memory however many samples it sees."""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Last slot: above the largest bucket
+        self.count, self.sum, self.max = 0, 0.0, 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1; self.sum += seconds; self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (the maximum for the overflow bucket)."""
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= q * self.count: return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return 0.0
+
+    def to_dict(self):
+        cumulative, buckets = 0, {}
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n; buckets[str(bound)] = cumulative
+        buckets["+Inf"] = self.count
+        return {"count": self.count, "sum": round(self.sum, 6), "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+                "max": round(self.max, 6), "p50": round(self.quantile(0.5), 6), "p90": round(self.quantile(0.9), 6),
+                "p99": round(self.quantile(0.99), 6),
+                "buckets": buckets}
+
+
+class _StageSamples(list):
+    """Stand-in for RunMetrics inside worker processes: (stage, seconds) pairs sent back to the parent."""
+    def observe(self, stage, seconds):
+        self.append((stage, seconds))
+
+
+class _StoreRows(list):
+    """Stand-in for the OCRTextStore inside worker processes: (image_path, text, digest) rows sent back to the parent."""
+    def add(self, image_path, text=None, digest=None):
+        self.append((image_path, text, digest))
+
+
+class RunMetrics(ProgressCounters):
+    """
+    Instrumentation for one run, on top of the progress counters: a latency histogram per
+    stage (read, decode, preprocess, hash, detect, recognize, ocr, write, compile, and "image" for
+    read-to-text per image), images/s, chars/s and peak RSS. Thread-safe: the prefetch and
+    writer threads record stages concurrently. save() writes the JSON and Prometheus files
+    to output_dir. profile = "cprofile" or "torch" profiles the OCR loop (see profiling()).
+    """
+    def __init__(self, output_dir=None, profile=None):
+        super().__init__()
+        self.output_dir = output_dir
+        self.profile = profile
+        self.stages = {} # stage name -> LatencyHistogram
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None: histogram = self.stages[stage] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def update(self, record):
+        with self._lock: super().update(record)
+        if record.get("type") == "image" and record["saved"] and not (record.get("cache_hit") or record.get("near_duplicate")):
+            self.observe("image", record["seconds"])
+
+    def snapshot(self):
+        elapsed = self.elapsed_seconds()
+        peak_rss, peak_rss_children = get_peak_rss_bytes()
+        with self._lock: stages = {name: histogram.to_dict() for name, histogram in self.stages.items()}
+        return {
+            "time": round(time.time(), 3), "seconds": round(elapsed, 3),
+            "images": {"total": self.total, "pending": self.pending, "processed": self.processed, "skipped": self.skipped,
+                       "errors": self.errors, "cache_hits": self.cache_hits, "near_duplicates": self.near_duplicates},
+            "text_chars": self.text_chars,
+            "images_per_second": round(self.images_per_second(), 3),
+            "chars_per_second": round(self.text_chars / elapsed, 1) if elapsed > 0 else 0.0,
+            "peak_rss_bytes": peak_rss, "peak_rss_children_bytes": peak_rss_children,
+            "stages": stages,
+        }
+
+    def to_prometheus(self, snapshot=None):
+        """The snapshot in Prometheus text exposition format."""
+        snapshot = snapshot or self.snapshot()
+        lines = ["# HELP batch_ocr_stage_seconds Time spent in each OCR stage, per image (per run for compile).",
+                 "# TYPE batch_ocr_stage_seconds histogram"]
+        for stage, data in sorted(snapshot["stages"].items()):
+            for bound, cumulative in data["buckets"].items():
+                lines.append(f'batch_ocr_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'batch_ocr_stage_seconds_sum{{stage="{stage}"}} {data["sum"]}')
+            lines.append(f'batch_ocr_stage_seconds_count{{stage="{stage}"}} {data["count"]}')
+        lines += ["# HELP batch_ocr_images Images in the last run by result.", "# TYPE batch_ocr_images gauge"]
+        lines += [f'batch_ocr_images{{result="{key}"}} {value}' for key, value in snapshot["images"].items()]
+        gauges = [("run_seconds", "Wall time of the last run.", snapshot["seconds"]),
+                  ("text_chars", "Characters of OCR text produced by the last run.", snapshot["text_chars"]),
+                  ("images_per_second", "Images finished per second in the last run.", snapshot["images_per_second"]),
+                  ("chars_per_second", "OCR text characters per second in the last run.", snapshot["chars_per_second"]),
+                  ("peak_rss_bytes", "Peak resident memory of the OCR process.", snapshot["peak_rss_bytes"]),
+                  ("peak_rss_children_bytes", "Peak resident memory of the largest worker process.", snapshot["peak_rss_children_bytes"])]
+        for name, help_text, value in gauges:
+            if value is None: continue
+            lines += [f"# HELP batch_ocr_{name} {help_text}", f"# TYPE batch_ocr_{name} gauge", f"batch_ocr_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def log_summary(self, log):
+        snapshot = self.snapshot()
+        log(f"Metrics: {snapshot['images_per_second']:.2f} images/s, {snapshot['chars_per_second']:.0f} chars/s"
+            + (f", peak RSS {snapshot['peak_rss_bytes'] / 2**20:.0f} MiB" if snapshot['peak_rss_bytes'] else ""))
+        for stage, data in snapshot["stages"].items():
+            log(f"Metrics:   {stage:<10} n={data['count']:<6} mean={data['mean'] * 1000:8.1f}ms  p90<={data['p90'] * 1000:8.1f}ms  max={data['max'] * 1000:8.1f}ms")
+        return snapshot
+
+    def save(self, log):
+        """Writes the JSON and Prometheus files to output_dir (temp file + rename, so readers never see half a file)."""
+        if not self.output_dir: return None
+        snapshot = self.snapshot()
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            for filename, content in ((METRICS_JSON_FILENAME, json.dumps(snapshot, indent=2) + "\n"),
+                                      (METRICS_PROM_FILENAME, self.to_prometheus(snapshot))):
+                path = os.path.join(self.output_dir, filename)
+                with open(path + ".tmp", 'w', encoding='utf-8') as f: f.write(content)
+                os.replace(path + ".tmp", path)
+            log(f"Metrics: Saved {METRICS_JSON_FILENAME} and {METRICS_PROM_FILENAME} to: {os.path.abspath(self.output_dir)}")
+        except Exception as e:
+            log(f"!!! Error saving run metrics to '{self.output_dir}': {e} !!!")
+        return snapshot
+
+    @contextlib.contextmanager
+    def profiling(self, log, use_gpu=False):
+        """Profiles the with-block (the OCR loop) with cProfile or torch.profiler when self.profile is set."""
+        output_dir = self.output_dir or "."
+        if self.profile == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try: yield
+            finally:
+                profiler.disable()
+                path = os.path.join(output_dir, PROFILE_STATS_FILENAME)
+                top = io.StringIO()
+                pstats.Stats(profiler, stream=top).sort_stats("cumulative").print_stats(15)
+                log(f"Profile: cProfile of the OCR loop (top 15 by cumulative time):\n{top.getvalue().strip()}")
+                try: profiler.dump_stats(path); log(f"Profile: Saved {path} (open with: python -m pstats {path})")
+                except Exception as e: log(f"!!! Error saving profile '{path}': {e} !!!")
+        elif self.profile == "torch":
+            torch = get_torch()
+            if torch is None:
+                log("Warning: torch profiler requested but PyTorch is not installed; not profiling.")
+                yield
+                return
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if use_gpu: activities.append(torch.profiler.ProfilerActivity.CUDA)
+            with torch.profiler.profile(activities=activities, record_shapes=True) as profiler:
+                yield
+            path = os.path.join(output_dir, PROFILE_TRACE_FILENAME)
+            log(f"Profile: torch.profiler of the OCR loop (top 15 ops):\n{profiler.key_averages().table(sort_by='self_cpu_time_total', row_limit=15)}")
+            try: profiler.export_chrome_trace(path); log(f"Profile: Saved {path} (open in chrome://tracing or Perfetto)")
+            except Exception as e: log(f"!!! Error saving profile '{path}': {e} !!!")
+        else:
+            yield
+
+
+# --- MODIFIED: perform_batch_ocr uses unique txt filenames, optional worker pool ---
+def perform_batch_ocr(folder_path, languages=OCR_LANGUAGES, use_gpu=True, overwrite_mode=True, status_callback=None, workers=1, prefetch=DEFAULT_PREFETCH_IMAGES, cache_path=None, folder_index=None, reader=None, preprocess=None, batch_images=DEFAULT_OCR_BATCH_IMAGES, progress_callback=None, metrics=None, cpu_mode=None, dedup=None, tiling=None, text_store=None, order=DEFAULT_OCR_ORDER, priority=None, control=None, journal=None):
+    """
+    Performs OCR on images (sorted by mod time) using specified languages.
+    Saves output to unique .txt files (imagename.ext.txt).
+    Skips based on overwrite_mode.
+    With workers > 1, images are spread over a process pool where every worker
+    keeps its own persistent EasyOCR Reader and an equal share of torch threads.
+    With a single worker, `prefetch` images are read/decoded ahead of the model
+    and .txt files are written on a separate thread (see run_ocr_pipeline); batch_images > 1
+    additionally groups same-sized images into batched model calls (ignored with workers > 1).
+    With cache_path set, images whose bytes (and OCR settings) were seen before reuse
+    the cached text instead of running OCR (see OCRResultCache).
+    Pass a FolderIndex to reuse a snapshot built earlier in the same run (no rescan).
+    Pass an already initialized `reader` (e.g. from the OCR daemon) to skip loading the
+    models; it implies a single worker.
+    `preprocess` (a PREPROCESS_PRESETS name or options dict) downscales/cleans images
+    between decode and OCR; it is part of the cache key.
+    progress_callback receives structured records next to the text log (see ProgressCounters):
+      {"type": "start", "total": N, "pending": P, "skipped": S}
+      {"type": "image", "image": name, "position": "i/N", "saved": bool, "cache_hit": bool, "near_duplicate": bool, "text_length": n, "seconds": t}
+      {"type": "finish", "processed": ..., "skipped": ..., "errors": ..., "cache_hits": ..., "near_duplicates": ..., "cancelled": ..., "seconds": t}
+    Pass a RunMetrics as `metrics` to time every stage (and optionally profile the OCR loop);
+    saving the metrics files is left to the caller so it can include the compile step.
+    cpu_mode (True or a dict, see CPU_MODE_DEFAULTS) runs CPU Readers with explicit torch threading
+    and the OCR loop under torch.inference_mode(); ignored on GPU. (CPU Readers are int8-quantized
+    either way, that is EasyOCR's default; cpu_mode only makes it switchable.)
+    dedup (True, a Hamming threshold or a dict, see DEDUP_DEFAULTS) reuses the last OCR'd frame's
+    text for images whose perceptual hash is within the threshold (see NearDuplicateTracker).
+    It needs the images in order, so it only applies with a single worker.
+    tiling (True or a dict, see TILING_DEFAULTS) OCRs images over tiling['min_side'] in overlapping
+    strips with bounded memory, and every page of multi-page TIFFs into the same .txt file.
+    text_store (True for FOLDER/TEXT_STORE_FILENAME, or a path) keeps a searchable OCRTextStore of the
+    folder's text: saved images are added in bulk transactions and the store is synced with the
+    folder index after the run (so skipped images are searchable too). An already open
+    OCRTextStore is only added to and flushed; syncing and closing it is left to the caller.
+    `order` (an OCR_ORDER_POLICIES name or a key function on ImageEntry, with `priority` for
+    "priority") only changes the processing order: .txt files and the compile stay in mtime order.
+    An OCRRunControl as `control` lets another thread pause/resume or cancel the run; a cancelled
+    run returns OCR_CANCELLED_MESSAGE as its error_message (the images done so far are kept).
+    journal (True for FOLDER/JOURNAL_FILENAME, or a path) records every finished image in an OCRJournal:
+    if the run is interrupted, the next run with the same settings skips the images it finished
+    (even in overwrite mode) and only OCRs the rest. Pass an open OCRJournal to manage it yourself.
+    Returns (processed_count, skipped_count, error_count, error_message).
+    """
+    def log(msg):
+        if status_callback:
+            try: status_callback(msg)
+            except Exception as e: print(f"Error in status_callback: {e}")
+
+    if folder_index is None:
+        log(f"OCR Task: Scanning folder for images (sorted by modification time): {folder_path}")
+        folder_index, error = build_folder_index(folder_path)
+        if error: return 0, 0, 0, error
+    else:
+        log(f"OCR Task: Using folder index snapshot (sorted by modification time): {folder_path}")
+    written = set() if text_store and not isinstance(text_store, OCRTextStore) else None # Names whose .txt this run saved (store sync)
+    with run_text_store(text_store, folder_path, folder_index, written, log, metrics) as store, \
+         run_journal(journal, folder_path, log) as run_journal_file:
+        result = _perform_batch_ocr(
+            folder_path, languages=languages, use_gpu=use_gpu, overwrite_mode=overwrite_mode, status_callback=status_callback,
+            workers=workers, prefetch=prefetch, cache_path=cache_path, folder_index=folder_index, reader=reader, preprocess=preprocess,
+            batch_images=batch_images, progress_callback=progress_callback, metrics=metrics, cpu_mode=cpu_mode, dedup=dedup,
+            tiling=tiling, text_store=store, order=order, priority=priority, control=control, journal=run_journal_file, written=written)
+        if run_journal_file is not None and run_journal_file is not journal and result[3] is None: run_journal_file.finish(result[0], result[2])
+    return result
+
+
+@contextlib.contextmanager
+def run_text_store(text_store, folder_path, folder_index, written, log, metrics=None):
+    """
+    perform_batch_ocr's text store: an open OCRTextStore is used as is (its owner syncs and closes it).
+    True or a path opens the store for the run; afterwards it is synced with the run's folder index plus
+    the `written` names (no rescan, see OCRTextStore.sync) and closed.
+    """
+    if isinstance(text_store, OCRTextStore) or not text_store:
+        yield text_store or None
+        return
+    store = open_text_store(text_store, folder_path, log, metrics)
+    try: yield store
+    finally:
+        if store is not None:
+            try:
+                store.sync(folder_index, log, written=written)
+                store.close()
+            except Exception as e: log(f"!!! Error updating text store '{store.store_path}': {e} !!!")
+
+
+@contextlib.contextmanager
+def run_journal(journal, folder_path, log):
+    """perform_batch_ocr's journal: an open OCRJournal is used as is; True or a path opens one for the run and closes it afterwards."""
+    if isinstance(journal, OCRJournal) or not journal:
+        yield journal or None
+        return
+    journal = OCRJournal(get_journal_path(folder_path, journal))
+    try: yield journal
+    finally:
+        try: journal.close()
+        except OSError as e: log(f"Warning: Could not close the journal '{journal.path}': {e}")
+
+
+def _perform_batch_ocr(folder_path, *, languages, use_gpu, overwrite_mode, status_callback, workers, prefetch, cache_path, folder_index,
+                       reader, preprocess, batch_images, progress_callback, metrics, cpu_mode, dedup, tiling, text_store, order, priority,
+                       control, journal, written):
+    """The body of perform_batch_ocr, with the text store and journal already opened (or None) and a folder index."""
+    def log(msg):
+        if status_callback:
+            try: status_callback(msg)
+            except Exception as e: print(f"Error in status_callback: {e}")
+
+    journaled_entries = {} # name -> ImageEntry, to journal finished images with their size/mtime
+
+    def progress(record):
+        if written is not None and record.get("type") == "image" and record["saved"]: written.add(record["image"])
+        if journal is not None and record.get("type") == "image" and record["saved"] and record["image"] in journaled_entries:
+            entry = journaled_entries[record["image"]]
+            try: journal.record_done(entry.name, entry.size, entry.mtime)
+            except (OSError, ValueError) as e: log(f"Warning: Could not write to the journal '{journal.path}': {e}")
+        if metrics is not None: metrics.update(record)
+        if progress_callback:
+            try: progress_callback(record)
+            except Exception as e: print(f"Error in progress_callback: {e}")
+
+    image_files, error = find_image_files(folder_path, folder_index)
+
+    if error: return 0, 0, 0, error
+    if not image_files: return 0, 0, 0, "No image files found in the specified folder."
+
+    log(f"OCR Task: Found {len(image_files)} image file(s). Processing oldest first.")
+    try: preprocess = resolve_preprocess(preprocess)
+    except ValueError as e: return 0, 0, 0, str(e)
+    if preprocess: log(f"OCR Task: Preprocessing images before OCR: {preprocess}")
+    try: cpu_mode = resolve_cpu_mode(cpu_mode)
+    except ValueError as e: return 0, 0, 0, str(e)
+    if cpu_mode and use_gpu: log("OCR Task: CPU mode ignored, running on GPU."); cpu_mode = None
+    try: dedup = resolve_dedup(dedup)
+    except ValueError as e: return 0, 0, 0, str(e)
+    try: tiling = resolve_tiling(tiling)
+    except ValueError as e: return 0, 0, 0, str(e)
+    if tiling: log(f"OCR Task: Tiled mode for huge images and multi-page TIFFs: {tiling}")
+    try: order_key = resolve_ocr_order(order, priority)
+    except ValueError as e: return 0, 0, 0, str(e)
+
+    processed_count, error_count, skipped_count = 0, 0, 0
+
+    # .txt status comes from the index's directory listing (no per-file exists() probes)
+    ocr_needed = overwrite_mode or not all(entry.has_txt for entry in folder_index.entries)
+
+    if not ocr_needed and not overwrite_mode:
+        log("OCR Task: All images seem to have existing unique .txt files and overwrite is OFF. Skipping OCR.")
+        skipped_count = len(image_files)
+        return 0, skipped_count, 0, None
+
+    finished_before = {}
+    if journal is not None:
+        settings = dict(get_ocr_settings_fingerprint(languages, preprocess, cpu_mode, tiling), dedup=dedup)
+        try: finished_before = journal.begin(settings, overwrite_mode, log)
+        except OSError as e: return 0, 0, 0, f"Could not open the journal '{journal.path}': {e}"
+        journaled_entries.update((entry.name, entry) for entry in folder_index.entries)
+
+    # --- Decide which images need OCR (skips are logged up front, in mod-time order) ---
+    pending, pending_entries = [], []
+    for i, entry in enumerate(folder_index.entries):
+        image_path = entry.path
+        position = f"{i+1}/{len(image_files)}"
+        if not overwrite_mode and entry.has_txt:
+            log(f"---> Skipping ({position}): {entry.name} (using existing '{get_unique_txt_path(entry.name)}')")
+            skipped_count += 1
+            continue
+        if finished_before.get(entry.name) == (entry.size, entry.mtime):
+            log(f"---> Skipping ({position}): {entry.name} (finished before the interruption)")
+            skipped_count += 1
+            continue
+        pending.append((image_path, position)); pending_entries.append(entry)
+    if order_key is not None:
+        # Stable sort: equal keys stay oldest first. Positions keep naming each image's place in mtime order.
+        pending = [item for _, item in sorted(zip(pending_entries, pending), key=lambda pair: order_key(pair[0]))]
+        log(f"OCR Task: Processing order: {('priority' if priority else order) if isinstance(order, str) else 'custom'}"
+            + (f" ({len(priority)} prioritized image(s) first)" if priority else "") + "; compiled output stays in mtime order.")
+
+    workers = 1 if reader is not None else max(1, min(int(workers or 1), len(pending)))
+    cache_hits = near_duplicates = cancelled = 0
+    if dedup and workers > 1: log("Warning: Near-duplicate detection needs the images in order; ignored with more than 1 worker."); dedup = None
+    elif dedup: log(f"OCR Task: Reusing text for near-duplicate frames: {dedup}")
+    progress({"type": "start", "total": len(image_files), "pending": len(pending), "skipped": skipped_count})
+
+    if workers > 1:
+        torch_threads = get_torch_threads_per_worker(workers)
+        log(f"OCR Task: Starting {workers} worker processes for languages: {languages} (GPU: {use_gpu}, torch threads/worker: {torch_threads})")
+        if metrics is not None and metrics.profile: log("Warning: Profiling only covers a single OCR process; run with 1 worker to profile the OCR loop.")
+        total_start_time = time.time()
+        # 'spawn' avoids forking a process that already runs Tk and torch threads.
+        ctx = multiprocessing.get_context("spawn")
+        try:
+            # ProcessPoolExecutor rather than multiprocessing.Pool: a worker that dies (OOM kill, crash in native code)
+            # breaks the executor and its pending results raise, where a Pool would wait for them forever.
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_ocr_worker,
+                                                        initargs=(languages, use_gpu, torch_threads, cache_path, preprocess, metrics is not None, cpu_mode, tiling, control, text_store is not None)) as pool:
+                tasks, in_flight = iter(pending), set()
+                while True:
+                    while len(in_flight) < workers * 2: # Only a few tasks queued ahead; results are handled in completion order
+                        task = next(tasks, None)
+                        if task is None: break
+                        in_flight.add(pool.submit(_ocr_worker_task, task))
+                    if not in_flight: break
+                    finished, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in finished:
+                        image_path, saved, cache_hit, messages, records, samples, init_error, image_cancelled, store_rows = future.result()
+                        if init_error is not None:
+                            pool.shutdown(wait=False, cancel_futures=True)
+                            err_msg = f"Error initializing EasyOCR in worker process: {init_error}\nCheck dependencies (PyTorch, CUDA if using GPU)."
+                            log(f"!!! {err_msg} !!!")
+                            return processed_count, skipped_count, error_count, err_msg
+                        for msg in messages: log(msg)
+                        for stage, seconds in samples or (): metrics.observe(stage, seconds)
+                        for record in records: progress(record)
+                        if image_cancelled: continue
+                        if cache_hit: cache_hits += 1
+                        if saved: processed_count += 1
+                        else: error_count += 1
+                        for row in store_rows or (): text_store.add(*row) # Text and digest come from the worker, nothing is read again
+        except concurrent.futures.BrokenExecutor:
+            err_msg = "An OCR worker process died unexpectedly (killed, e.g. for running out of memory, or crashed in native code)."
+            log(f"!!! {err_msg} !!!")
+            return processed_count, skipped_count, error_count, err_msg
+        except Exception as e:
+            err_msg = f"Error in OCR worker pool: {e}"
+            log(f"!!! {err_msg} !!!")
+            return processed_count, skipped_count, error_count, err_msg
+    else:
+        if reader is not None:
+            log(f"OCR Task: Using already initialized EasyOCR reader for languages: {languages}")
+        else:
+            log(f"OCR Task: Initializing EasyOCR for languages: {languages} (GPU: {use_gpu})")
+            try:
+                reader = create_reader(languages, use_gpu, cpu_mode=cpu_mode, log=log)
+                log("OCR Task: EasyOCR initialized successfully.")
+            except Exception as e:
+                err_msg = f"Error initializing EasyOCR: {e}\nCheck dependencies (PyTorch, CUDA if using GPU)."
+                log(f"!!! {err_msg} !!!")
+                return 0, 0, 0, err_msg
+
+        total_start_time = time.time()
+
+        ocr_cache = open_ocr_cache(cache_path, languages, log, preprocess, cpu_mode, tiling)
+        tracker = NearDuplicateTracker(dedup, metrics) if dedup else None
+        try:
+            with (metrics.profiling(log, use_gpu) if metrics is not None else contextlib.nullcontext()), \
+                 timed_reader_stages(reader, metrics), inference_context(cpu_mode):
+                processed_count, error_count = run_ocr_pipeline(reader, pending, languages, log, prefetch=prefetch,
+                                                                ocr_cache=ocr_cache, preprocess=preprocess, batch_images=batch_images,
+                                                                progress_callback=progress if (progress_callback or metrics is not None or journal is not None or written is not None) else None,
+                                                                metrics=metrics, dedup=tracker, tiling=tiling, store=text_store,
+                                                                control=control)
+        finally:
+            if ocr_cache is not None:
+                cache_hits = ocr_cache.hits
+                ocr_cache.close()
+            if tracker is not None: near_duplicates = tracker.reused
+
+    if text_store is not None: text_store.flush()
+    if control is not None and control.cancelled:
+        cancelled = len(pending) - processed_count - error_count
+        log(f"OCR Task: Cancelled. {cancelled} image(s) were not processed; .txt files of finished images are kept.")
+    total_elapsed_time = time.time() - total_start_time
+    summary = f"OCR Task Finished. Processed: {processed_count}, Skipped: {skipped_count}, Errors: {error_count}, Time: {total_elapsed_time:.2f}s"
+    log(summary)
+    if cache_path: log(f"OCR Task: {cache_hits} of {len(pending)} image(s) reused cached OCR text.")
+    if dedup: log(f"OCR Task: {near_duplicates} of {len(pending)} image(s) reused a near-duplicate frame's OCR text.")
+    progress({"type": "finish", "processed": processed_count, "skipped": skipped_count, "errors": error_count,
+              "cache_hits": cache_hits, "near_duplicates": near_duplicates, "cancelled": cancelled, "seconds": round(total_elapsed_time, 3)})
+    if metrics is not None: metrics.log_summary(log)
+
+    return processed_count, skipped_count, error_count, OCR_CANCELLED_MESSAGE if cancelled else None
+
+
+def format_compile_separator(unique_txt_filename, is_first):
+    """Separator written before each source file's content in the compiled output."""
+    leading_newlines = "" if is_first else "\n\n"
+    return f"{leading_newlines}{'=' * 60}\n=== Source File: {unique_txt_filename} ===\n{'=' * 60}\n\n"
+
+
+def format_compile_error_marker(unique_txt_filename, error):
+    """Marker written to the compiled output when a source file can't be read."""
+    return f"\n\n{'!' * 60}\n!!! Error processing file: {unique_txt_filename} - {error} !!!\n{'!' * 60}\n\n"
+
+
+def report_compile_result(compiled_count, total_expected, error_in_compilation, output_file, log):
+    """Logs the compile summary and returns (compiled_count, error_message)."""
+    summary = f"Compile Task Finished. Compiled content from {compiled_count}/{total_expected} existing source file(s) into:"
+    log(summary)
+    log(os.path.abspath(output_file))
+
+    if compiled_count == 0 and total_expected > 0: log("Compile Task: Warning - No unique .txt files were available for compilation.")
+    if error_in_compilation:
+         log("Compile Task: Completed, but one or more source .txt files could not be read/processed.")
+         return compiled_count, "Compilation completed with errors reading source files (check log)."
+    else:
+         if compiled_count < total_expected: log(f"Compile Task: Note - {total_expected - compiled_count} expected unique .txt file(s) were not found.")
+         return compiled_count, None # Success
+
+
+# --- MODIFIED: compile_text_files reads unique txt filenames ---
+def compile_text_files(input_folder, output_file, status_callback=None, folder_index=None, incremental=False):
+    """
+    Compiles unique .txt files (imagename.ext.txt) based on the modification time
+    of their corresponding image files (oldest first).
+    Includes a separator with the unique source filename before each file's content.
+    Pass the FolderIndex used for OCR to compile in exactly the same order without rescanning.
+    With incremental=True, see compile_text_files_incremental (byte-identical output).
+    Returns (compiled_count, error_message).
+    """
+    if incremental:
+        return compile_text_files_incremental(input_folder, output_file, status_callback, folder_index)
+
+    def log(msg):
+        if status_callback:
+            try: status_callback(msg)
+            except Exception as e: print(f"Error in status_callback: {e}")
+
+    log(f"Compile Task: Starting Text Compilation")
+    log(f"Compile Task: Finding images sorted by modification time in: {input_folder}")
+
+    # --- Step 1: Get the correctly time-sorted list of IMAGE files ---
+    image_files, error = find_image_files(input_folder, folder_index)
+
+    if error:
+        err_msg = f"Compile Task: Error finding image files needed for ordering: {error}"
+        log(f"!!! {err_msg} !!!")
+        return 0, err_msg
+    if not image_files:
+        msg = "Compile Task: No image files found. Nothing to compile."
+        log(msg)
+        return 0, None
+
+    log(f"Compile Task: Found {len(image_files)} images. Will compile corresponding unique .txt files in this order (oldest first).")
+
+    # --- Step 2: Iterate through SORTED image list and process corresponding UNIQUE .txt files ---
+    compiled_count = 0
+    error_in_compilation = False
+    output_base_name = os.path.basename(output_file) # To avoid compiling itself
+
+    try:
+        with open(output_file, 'w', encoding='utf-8') as outfile:
+            for i, image_path in enumerate(image_files):
+                image_filename = os.path.basename(image_path)
+                # --- Construct the expected UNIQUE .txt file path ---
+                unique_txt_filepath = get_unique_txt_path(image_path)
+                unique_txt_filename = os.path.basename(unique_txt_filepath)
+
+                # Skip if the txt file happens to be the compilation target itself (unlikely now)
+                if unique_txt_filename == output_base_name:
+                    log(f"  Skipping '{unique_txt_filename}' as it is the compilation target file.")
+                    continue
+
+                log(f"  Checking for unique .txt file ({i+1}/{len(image_files)}): '{unique_txt_filename}' (from image '{image_filename}')")
+
+                # Open directly instead of probing with isfile(): a missing file costs the same single syscall
+                try:
+                    with open(unique_txt_filepath, 'r', encoding='utf-8') as infile:
+                        log(f"    Reading content from: '{unique_txt_filename}'")
+                        content = infile.read().strip()
+                    log(f"    Read {len(content)} characters.")
+
+                    # --- Use the UNIQUE .txt filename in the separator ---
+                    separator = format_compile_separator(unique_txt_filename, is_first=(compiled_count == 0))
+
+                    log(f"    Writing separator and content for '{unique_txt_filename}' to output.")
+                    outfile.write(separator)
+                    if content:
+                        outfile.write(content)
+                    else:
+                        log(f"    Note: Source file '{unique_txt_filename}' was empty.")
+                    compiled_count += 1
+
+                except (FileNotFoundError, IsADirectoryError):
+                    # Corresponding unique .txt file does not exist
+                    log(f"    Skipping: Corresponding unique file '{unique_txt_filename}' not found for image '{image_filename}'.")
+                except Exception as e:
+                    error_in_compilation = True
+                    log(f"    !!! Warning: Could not read or process file '{unique_txt_filename}'. Error: {e} !!!")
+                    error_marker = format_compile_error_marker(unique_txt_filename, e)
+                    try: outfile.write(error_marker); log(f"    Wrote error marker to output for '{unique_txt_filename}'.")
+                    except Exception as write_err: log(f"    !!! Additionally failed to write error marker to output file: {write_err} !!!")
+
+
+        # --- Compilation Loop Finished ---
+        return report_compile_result(compiled_count, len(image_files), error_in_compilation, output_file, log)
+
+    except IOError as e: # Error writing the main output file
+        err_msg = f"Compile Task: Critical Error writing to output file '{output_file}': {e}"
+        log(f"!!! {err_msg} !!!"); return compiled_count, err_msg
+    except Exception as e: # Other unexpected errors
+        err_msg = f"Compile Task: An unexpected critical error occurred during compilation: {e}"
+        log(f"!!! {err_msg} !!!"); log(traceback.format_exc())
+        return compiled_count, err_msg
+
+
+# --- Incremental compile: sidecar segment index + bulk span copies ---
+
+def to_output_bytes(text):
+    """Encodes text exactly like the text-mode writer of compile_text_files (utf-8, platform newlines)."""
+    if os.linesep != "\n": text = text.replace("\n", os.linesep)
+    return text.encode('utf-8')
+
+
+def copy_file_span(src_file, dst_file, offset, length):
+    """
+    Appends `length` bytes starting at `offset` of src_file to the end of dst_file.
+    Uses os.copy_file_range (zero-copy, in-kernel) where available, else a chunked read/write.
+    """
+    dst_file.flush()
+    copied = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            os.lseek(dst_file.fileno(), 0, os.SEEK_END)
+            while copied < length:
+                n = os.copy_file_range(src_file.fileno(), dst_file.fileno(), length - copied, offset + copied)
+                if n == 0: break
+                copied += n
+        except OSError:
+            pass # e.g. unsupported filesystem: finish with the portable loop below
+    dst_file.seek(0, os.SEEK_END) # Resync the buffered writer with the fd position
+    src_file.seek(offset + copied)
+    while copied < length:
+        chunk = src_file.read(min(1024 * 1024, length - copied))
+        if not chunk: raise IOError("Compiled output is shorter than its segment index says")
+        dst_file.write(chunk)
+        copied += len(chunk)
+
+
+def load_compile_segment_index(output_file):
+    """
+    Returns the segment list recorded for output_file, or None if the sidecar is missing,
+    unreadable, or the output was changed since it was written (size/mtime mismatch).
+    Each segment is [txt_name, src_size, src_mtime_ns, body_offset, body_length].
+    """
+    try:
+        with open(output_file + COMPILE_SEGMENT_INDEX_SUFFIX, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        st = os.stat(output_file)
+        if data.get("version") != 1 or data.get("linesep") != os.linesep: return None
+        if data["output_size"] != st.st_size or data["output_mtime_ns"] != st.st_mtime_ns: return None
+        return data["segments"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_compile_segment_index(output_file, segments):
+    """Writes the sidecar atomically, stamped with the output's current size and mtime."""
+    st = os.stat(output_file)
+    index_path = output_file + COMPILE_SEGMENT_INDEX_SUFFIX
+    data = {"version": 1, "linesep": os.linesep, "output_size": st.st_size,
+            "output_mtime_ns": st.st_mtime_ns, "segments": segments}
+    with open(index_path + ".tmp", 'w', encoding='utf-8') as f: json.dump(data, f)
+    os.replace(index_path + ".tmp", index_path)
+
+
+def compile_text_files_incremental(input_folder, output_file, status_callback=None, folder_index=None):
+    """
+    Incremental variant of compile_text_files; the output is byte-identical to a full compile.
+    A sidecar (output_file + COMPILE_SEGMENT_INDEX_SUFFIX) records, per compiled segment, the
+    source .txt name, size and mtime and where its body sits in the output. On the next run:
+    - sources are stat'ed (not read) and compared to the sidecar in compile order;
+    - if all recorded segments are unchanged, new segments are appended in place;
+    - otherwise the file is rebuilt from the first changed position: the unchanged prefix and
+      every run of unchanged segments after it are copied in bulk from the old output
+      (copy_file_range), and only new/changed sources are read.
+    Falls back to a full rebuild when the sidecar is missing or the output was modified.
+    Returns (compiled_count, error_message).
+    """
+    def log(msg):
+        if status_callback:
+            try: status_callback(msg)
+            except Exception as e: print(f"Error in status_callback: {e}")
+
+    log("Compile Task: Starting Incremental Text Compilation")
+    log(f"Compile Task: Finding images sorted by modification time in: {input_folder}")
+
+    image_files, error = find_image_files(input_folder, folder_index)
+    if error:
+        err_msg = f"Compile Task: Error finding image files needed for ordering: {error}"
+        log(f"!!! {err_msg} !!!")
+        return 0, err_msg
+    if not image_files:
+        log("Compile Task: No image files found. Nothing to compile.")
+        return 0, None
+
+    # --- Step 1: Current sources in compile order (one stat per .txt, nothing read yet) ---
+    output_base_name = os.path.basename(output_file) # To avoid compiling itself
+    sources = [] # (txt_name, txt_path, size, mtime_ns)
+    for image_path in image_files:
+        txt_path = get_unique_txt_path(image_path)
+        txt_name = os.path.basename(txt_path)
+        if txt_name == output_base_name: continue
+        try: st = os.stat(txt_path)
+        except FileNotFoundError: continue
+        except OSError: sources.append((txt_name, txt_path, -1, -1)); continue # Never matches: gets re-read (and reported)
+        if stat.S_ISREG(st.st_mode): sources.append((txt_name, txt_path, st.st_size, st.st_mtime_ns))
+
+    log(f"Compile Task: Found {len(image_files)} images, {len(sources)} existing unique .txt file(s).")
+
+    # --- Step 2: Compare against the sidecar ---
+    old_segments = load_compile_segment_index(output_file) or []
+    if not old_segments and os.path.exists(output_file + COMPILE_SEGMENT_INDEX_SUFFIX):
+        log("Compile Task: Segment index is stale (output changed since last compile). Rebuilding fully.")
+    source_keys = [(txt_name, size, mtime_ns) for txt_name, txt_path, size, mtime_ns in sources]
+    first_changed = 0
+    while (first_changed < min(len(old_segments), len(sources))
+           and tuple(old_segments[first_changed][:3]) == source_keys[first_changed]):
+        first_changed += 1
+    old_by_key = {tuple(seg[:3]): (j, seg) for j, seg in enumerate(old_segments)}
+    append_only = bool(old_segments) and first_changed == len(old_segments)
+    lead_bytes = len(to_output_bytes("\n\n"))
+
+    compiled_count, error_in_compilation, copied_segments = 0, False, 0
+    new_segments = []
+    tmp_path = output_file + ".tmp"
+    old_file = None
+
+    try:
+        if append_only:
+            # Everything recorded is still valid: keep the file and append after the last segment.
+            log(f"Compile Task: {first_changed} segment(s) unchanged; appending {len(sources) - first_changed} new segment(s).")
+            outfile = open(output_file, 'r+b')
+            last = old_segments[-1]
+            outfile.seek(last[3] + last[4]); outfile.truncate()
+            new_segments = list(old_segments)
+            compiled_count = copied_segments = first_changed
+        else:
+            if old_segments: log(f"Compile Task: {first_changed} leading segment(s) unchanged; rewriting from position {first_changed + 1}.")
+            outfile = open(tmp_path, 'wb')
+            old_file = open(output_file, 'rb') if old_segments else None
+
+        with outfile:
+            pos = outfile.tell()
+            run = None # [old_start_offset, old_end_offset, last_old_index] of unchanged segments to copy in one go
+
+            def flush_run():
+                nonlocal run, pos
+                if run is None: return
+                copy_file_span(old_file, outfile, run[0], run[1] - run[0])
+                pos += run[1] - run[0]
+                run = None
+
+            for k in range(compiled_count, len(sources)):
+                txt_name, txt_path, size, mtime_ns = sources[k]
+                lead = 0 if compiled_count == 0 else lead_bytes
+                old = old_by_key.get(source_keys[k]) if old_file is not None else None
+                if old is not None:
+                    j, seg = old
+                    if run is not None and run[2] == j - 1:
+                        run[1], run[2] = seg[3] + seg[4], j # Also adjacent in the old file: extend (covers the "\n\n" between)
+                    else:
+                        flush_run()
+                        if lead: outfile.write(to_output_bytes("\n\n")); pos += lead
+                        run = [seg[3], seg[3] + seg[4], j]
+                    new_segments.append([txt_name, size, mtime_ns, pos + (seg[3] - run[0]), seg[4]])
+                    compiled_count += 1; copied_segments += 1
+                    continue
+
+                flush_run()
+                try:
+                    with open(txt_path, 'r', encoding='utf-8') as infile:
+                        content = infile.read().strip()
+                    log(f"    Writing separator and content for '{txt_name}' to output.")
+                    body = to_output_bytes(format_compile_separator(txt_name, is_first=True) + content)
+                    if lead: outfile.write(to_output_bytes("\n\n"))
+                    outfile.write(body)
+                    new_segments.append([txt_name, size, mtime_ns, pos + lead, len(body)])
+                    pos += lead + len(body)
+                    compiled_count += 1
+                except FileNotFoundError:
+                    log(f"    Skipping: Corresponding unique file '{txt_name}' disappeared before it could be read.")
+                except Exception as e:
+                    error_in_compilation = True # Error markers aren't indexed: the next run rebuilds fully
+                    log(f"    !!! Warning: Could not read or process file '{txt_name}'. Error: {e} !!!")
+                    marker = to_output_bytes(format_compile_error_marker(txt_name, e))
+                    outfile.write(marker); pos += len(marker)
+            flush_run()
+            outfile.truncate()
+
+        if old_file is not None: old_file.close(); old_file = None
+        if not append_only: os.replace(tmp_path, output_file)
+
+        if error_in_compilation:
+            try: os.remove(output_file + COMPILE_SEGMENT_INDEX_SUFFIX)
+            except FileNotFoundError: pass
+        else:
+            save_compile_segment_index(output_file, new_segments)
+        log(f"Compile Task: Reused {copied_segments} unchanged segment(s) without re-reading their sources; read {compiled_count - copied_segments}.")
+        return report_compile_result(compiled_count, len(image_files), error_in_compilation, output_file, log)
+
+    except IOError as e: # Error writing the main output file
+        err_msg = f"Compile Task: Critical Error writing to output file '{output_file}': {e}"
+        log(f"!!! {err_msg} !!!"); return compiled_count, err_msg
+    except Exception as e: # Other unexpected errors
+        err_msg = f"Compile Task: An unexpected critical error occurred during compilation: {e}"
+        log(f"!!! {err_msg} !!!"); log(traceback.format_exc())
+        return compiled_count, err_msg
+    finally:
+        if old_file is not None: old_file.close()
+        if os.path.exists(tmp_path) and not append_only:
+            try: os.remove(tmp_path) # Only left behind if the rebuild failed
+            except OSError: pass
+
+
+# ==============================================================================
+# --- FULL RUN (OCR + COMPILE) ---
+# ==============================================================================
+
+def run_ocr_and_compile(folder_path, overwrite_mode=True, status_callback=None, use_gpu=None,
+                        languages=OCR_LANGUAGES, workers=DEFAULT_OCR_WORKERS, cache_path=None,
+                        folder_index=None, output_file=None, incremental=DEFAULT_INCREMENTAL_COMPILE,
+                        preprocess=None, batch_images=DEFAULT_OCR_BATCH_IMAGES, progress_callback=None, metrics=None,
+                        cpu_mode=None, dedup=None, tiling=None, text_store=None, order=DEFAULT_OCR_ORDER, priority=None, control=None,
+                        journal=DEFAULT_USE_JOURNAL):
+    """
+    The GUI's "Batch OCR and Compile" job: perform_batch_ocr, then compile_text_files,
+    both over the same folder snapshot. use_gpu=None auto-detects CUDA.
+    With an OCRRunControl as `control` the run can be paused or cancelled; a cancelled run
+    skips the compile step and returns False. With `journal` (on by default here), an interrupted
+    run is resumed by the next call with the same settings (see OCRJournal).
+    progress_callback gets perform_batch_ocr's structured progress records. With a RunMetrics
+    as `metrics`, the compile step is timed too and the metrics files are saved at the end.
+    Returns True if everything succeeded, False if it finished with file errors.
+    Raises Exception if a step fails critically.
+    """
+    def log(msg):
+        if status_callback:
+            try: status_callback(msg)
+            except Exception as e: print(f"Error in status_callback: {e}")
+
+    overall_success = True
+    if folder_index is None:
+        folder_index, index_error = build_folder_index(folder_path)
+        if index_error: raise Exception(f"OCR Step Failed Critically: {index_error}")
+
+    # Step 1: OCR
+    if use_gpu is None: use_gpu = detect_gpu(log)
+    ocr_processed, ocr_skipped, ocr_errors, ocr_msg = perform_batch_ocr(
+        folder_path, languages=languages, use_gpu=use_gpu,
+        overwrite_mode=overwrite_mode, status_callback=log, workers=workers,
+        cache_path=cache_path, folder_index=folder_index, preprocess=preprocess, batch_images=batch_images,
+        progress_callback=progress_callback, metrics=metrics, cpu_mode=cpu_mode, dedup=dedup, tiling=tiling,
+        text_store=text_store, order=order, priority=priority, control=control, journal=journal
+    )
+    if ocr_msg == OCR_CANCELLED_MESSAGE:
+        log("OCR Task: Run cancelled; the compiled file was not updated.")
+        if metrics is not None: metrics.save(log)
+        return False
+    if ocr_msg and not ("No image files found" in ocr_msg): raise Exception(f"OCR Step Failed Critically: {ocr_msg}")
+    if ocr_errors > 0: log(f"Warning: OCR process completed with {ocr_errors} file errors.")
+    if ocr_processed == 0 and ocr_skipped == 0 and ocr_errors == 0 : log("OCR Task: No images were processed, skipped, or errored.")
+
+    # Step 2: Compile
+    output_filename = output_file or os.path.join(folder_path, DEFAULT_COMPILED_FILENAME)
+    with stage_timer(metrics, "compile"):
+        compile_count, compile_msg = compile_text_files(
+            folder_path, output_filename, status_callback=log, folder_index=folder_index,
+            incremental=incremental
+        )
+    if metrics is not None: metrics.save(log)
+    if compile_msg and not ("Compilation completed with errors" in compile_msg or "No .txt files found" in compile_msg): raise Exception(f"Compilation Step Failed Critically: {compile_msg}")
+    if compile_msg and "Compilation completed with errors" in compile_msg: log(f"Warning: {compile_msg}"); overall_success = False
+    if compile_msg and "No .txt files found" in compile_msg: log("Info: Compilation found no .txt files to combine.")
+    return overall_success
+
+
+# ==============================================================================
+# --- WATCH MODE (continuous OCR of newly arriving images) ---
+# ==============================================================================
+
+class FolderWatcher:
+    """
+    Reports which names changed in one folder (not recursive).
+    Uses Linux inotify through ctypes (no extra dependency) when available; otherwise polls:
+    every poll_interval the caller rescans the folder and re-stats each image, so in-place
+    edits (which leave the directory's own mtime alone) are noticed within one poll.
+    wait(timeout) returns a set of changed names, or None when the caller has to rescan the folder.
+    """
+    IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE, IN_Q_OVERFLOW = 0x2, 0x8, 0x40, 0x80, 0x100, 0x200, 0x4000
+    EVENT_HEADER = struct.Struct("iIII") # struct inotify_event: wd, mask, cookie, len (name follows)
+
+    def __init__(self, folder_path, poll_interval=DEFAULT_WATCH_POLL_SECONDS, use_inotify=True):
+        self.folder_path = os.path.abspath(folder_path)
+        self.poll_interval = poll_interval
+        self.fd = self._open_inotify() if use_inotify else None
+        self.mode = "inotify" if self.fd is not None else "polling"
+
+    def _open_inotify(self):
+        if not sys.platform.startswith("linux"): return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0: return None
+            mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+            if libc.inotify_add_watch(fd, os.fsencode(self.folder_path), mask) < 0:
+                os.close(fd); return None
+            return fd
+        except (OSError, AttributeError): # No libc / no inotify symbols
+            return None
+
+    def wait(self, timeout):
+        if self.fd is None:
+            time.sleep(max(0.0, min(timeout, self.poll_interval)))
+            return None
+        if not select.select([self.fd], [], [], max(0.0, timeout))[0]: return set()
+        try: data = os.read(self.fd, 256 * 1024)
+        except BlockingIOError: return set()
+        names, offset = set(), 0
+        while offset + self.EVENT_HEADER.size <= len(data):
+            _, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            if mask & self.IN_Q_OVERFLOW: return None # Events were dropped: rescan
+            name = data[offset:offset + length].split(b"\0", 1)[0]
+            offset += length
+            if name: names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        if self.fd is not None: os.close(self.fd); self.fd = None
+
+
+def list_image_names(folder_path):
+    """Names of the image files in the folder (one scandir, no stat)."""
+    with os.scandir(folder_path) as it:
+        return {entry.name for entry in it if os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS}
+
+
+def watch_folder(folder_path, languages=OCR_LANGUAGES, use_gpu=None, status_callback=None, output_file=None, compile_output=True,
+                 settle_seconds=DEFAULT_WATCH_SETTLE_SECONDS, poll_interval=DEFAULT_WATCH_POLL_SECONDS, use_inotify=True,
+                 stop_event=None, reader=None, cache_path=None, preprocess=None, progress_callback=None, cpu_mode=None,
+                 dedup=None, tiling=None, text_store=None):
+    """
+    Watch mode: OCRs images as they arrive, with one Reader loaded for the whole session.
+    Starts with a normal pass (images without a .txt, then an incremental compile). After that,
+    new or modified images reported by FolderWatcher wait until they have been unchanged for
+    settle_seconds (the capture process may still be writing them), then only those go through
+    perform_batch_ocr and the incremental compile appends their text to the compiled file
+    (and the text store, see text_store in perform_batch_ocr).
+    progress_callback also gets {"type": "watch", "images": n, "processed": ..., "errors": ..., "seconds": t, "latency": t}
+    per cycle, latency being the time from the oldest image's last write to its text being compiled.
+    Runs until stop_event (a threading.Event) is set or KeyboardInterrupt.
+    Returns (processed_count, error_count, error_message).
+    """
+    def log(msg):
+        if status_callback:
+            try: status_callback(msg)
+            except Exception as e: print(f"Error in status_callback: {e}")
+
+    def progress(record):
+        if progress_callback:
+            try: progress_callback(record)
+            except Exception as e: print(f"Error in progress_callback: {e}")
+
+    folder_path = os.path.abspath(folder_path)
+    folder_index, error = build_folder_index(folder_path)
+    if error: return 0, 0, error
+    output_file = output_file or os.path.join(folder_path, DEFAULT_COMPILED_FILENAME)
+    if use_gpu is None: use_gpu = detect_gpu(log)
+    try: cpu_mode = None if use_gpu else resolve_cpu_mode(cpu_mode)
+    except ValueError as e: return 0, 0, str(e)
+    if reader is None:
+        log(f"Watch: Initializing EasyOCR for languages: {languages} (GPU: {use_gpu}); it stays loaded until the watch stops.")
+        try: reader = create_reader(languages, use_gpu, cpu_mode=cpu_mode, log=log)
+        except Exception as e:
+            err_msg = f"Error initializing EasyOCR: {e}\nCheck dependencies (PyTorch, CUDA if using GPU)."
+            log(f"!!! {err_msg} !!!")
+            return 0, 0, err_msg
+    store = text_store if isinstance(text_store, OCRTextStore) else open_text_store(text_store, folder_path, log)
+    entries = {entry.name: entry for entry in folder_index.entries} # Known images (compile order comes from here)
+    processed_total = errors_total = 0
+
+    def ocr_and_compile(index, on_progress=progress_callback):
+        processed, _, errors, ocr_msg = perform_batch_ocr(
+            folder_path, languages=languages, use_gpu=use_gpu, overwrite_mode=False, status_callback=log,
+            cache_path=cache_path, folder_index=index, reader=reader, preprocess=preprocess,
+            progress_callback=on_progress, cpu_mode=cpu_mode, dedup=dedup, tiling=tiling, text_store=store)
+        if ocr_msg and "No image files found" not in ocr_msg: return processed, errors, ocr_msg
+        if compile_output:
+            compile_index = FolderIndex(folder_path, sorted(entries.values(), key=folder_order_key))
+            _, compile_msg = compile_text_files(folder_path, output_file, status_callback=log, folder_index=compile_index, incremental=True)
+            if compile_msg and "No image files found" not in compile_msg: log(f"Warning: {compile_msg}")
+        return processed, errors, None
+
+    watcher = None
+    try:
+        watcher = FolderWatcher(folder_path, poll_interval, use_inotify) # Before the catch-up: images arriving during it are reported too
+        saved_names = set() # Images the catch-up saved a .txt for: their has_txt in folder_index is stale
+        def catch_up_progress(record):
+            if record.get("type") == "image" and record["saved"]: saved_names.add(record["image"])
+            if progress_callback: progress_callback(record)
+        processed_total, errors_total, err_msg = ocr_and_compile(folder_index, catch_up_progress) # Catch up with what is already there
+        if err_msg: return processed_total, errors_total, err_msg
+        if store is not None: store.sync(folder_index, log, written=saved_names)
+        log(f"Watch: Watching {folder_path} ({watcher.mode}, settle time {settle_seconds}s). Press Ctrl+C to stop.")
+        pending = {} # name -> (size, mtime) of new/changed images that are not settled yet
+        recent = {} # name -> mtime of images OCR'd lately, re-checked every cycle in case their writer wasn't done
+        first_cycle = True # Rescans: images that arrived between the folder scan and the watcher's start
+        while not (stop_event is not None and stop_event.is_set()):
+            changed = None if first_cycle else watcher.wait(min(poll_interval, settle_seconds / 2) if pending else poll_interval)
+            first_cycle = False
+            if changed is None: changed = list_image_names(folder_path) | set(entries) # Rescan (also notices deletions)
+            removed, now = False, time.time()
+            recent = {name: mtime for name, mtime in recent.items() if now - mtime < WATCH_RECENT_SECONDS}
+            for name in changed | set(pending) | set(recent):
+                if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS: continue
+                try: st = os.stat(os.path.join(folder_path, name))
+                except FileNotFoundError:
+                    pending.pop(name, None)
+                    removed = entries.pop(name, None) is not None or removed
+                    continue
+                except OSError: continue
+                known = entries.get(name)
+                if not stat.S_ISREG(st.st_mode) or (known is not None and (known.size, known.mtime) == (st.st_size, st.st_mtime)): continue
+                pending[name] = (st.st_size, st.st_mtime) # Re-stat'ed every cycle until it settles
+            ready = sorted((ImageEntry(name, os.path.join(folder_path, name), size, mtime, False)
+                            for name, (size, mtime) in pending.items() if size > 0 and now - mtime >= settle_seconds),
+                           key=folder_order_key)
+            if removed:
+                log("Watch: Image(s) removed from the folder.")
+                if store is not None: store.sync(build_folder_index(folder_path)[0] or folder_index, log)
+            if not ready:
+                if removed and compile_output: ocr_and_compile(FolderIndex(folder_path, []))
+                continue
+            for entry in ready:
+                pending.pop(entry.name)
+                entries[entry.name] = entry
+                recent[entry.name] = entry.mtime
+            log(f"Watch: {len(ready)} new or changed image(s) settled; running OCR.")
+            start_time = time.time()
+            processed, errors, err_msg = ocr_and_compile(FolderIndex(folder_path, ready))
+            if err_msg: return processed_total + processed, errors_total + errors, err_msg
+            processed_total += processed; errors_total += errors
+            finished = time.time()
+            latency = finished - ready[0].mtime
+            log(f"Watch: {processed} image(s) OCR'd{' and compiled' if compile_output else ''} in {finished - start_time:.2f}s "
+                f"({latency:.2f}s after the oldest one was written).")
+            progress({"type": "watch", "images": len(ready), "processed": processed, "errors": errors,
+                      "seconds": round(finished - start_time, 3), "latency": round(latency, 3)})
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if watcher is not None: watcher.close()
+        if store is not None and store is not text_store: store.close()
+    log(f"Watch: Stopped. Processed: {processed_total}, Errors: {errors_total}")
+    return processed_total, errors_total, None
+
+
+# ==============================================================================
+# --- SHARDED MODE (several machines OCR one shared folder) ---
+# ==============================================================================
+
+class ShardLeases:
+    """
+    Lease files of one sharded run, in a run directory on the shared folder:
+      run.json            the plan: chunks of image names, OCR settings and overwrite mode (written once by the node that starts the run)
+      c<i>.g<n>.lease     node claim of chunk i; n is the generation, a dead node's lease is taken over by creating generation n+1
+      c<i>.done           chunk i is finished
+      compile.g<n>.lease  claim of the final compile pass;  complete: the run is over
+    Claims are exclusive creates (O_EXCL), so two nodes never both get the same generation of a lease.
+    The holder's heartbeat thread touches its lease every lease_seconds/4; a lease whose mtime is older
+    than lease_seconds belongs to a dead node. Clocks of the nodes (and the file server) should be
+    NTP-synced to well within lease_seconds.
+    """
+    def __init__(self, run_dir, node_id, lease_seconds, log):
+        self.run_dir = run_dir
+        self.node_id = node_id
+        self.lease_seconds = lease_seconds
+        self.log = log
+        self._held = {} # lease path -> path of the next generation (exists once another node took the lease over)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def path(self, name):
+        return os.path.join(self.run_dir, name)
+
+    def scan(self):
+        """Returns ({key: (generation, mtime)} of the newest lease per chunk that isn't done, set of done keys)."""
+        leases, done = {}, set()
+        with os.scandir(self.run_dir) as it:
+            lease_entries = []
+            for dir_entry in it:
+                key, _, rest = dir_entry.name.partition(".")
+                if rest == "done": done.add(key)
+                elif rest.startswith("g") and rest.endswith(".lease"): lease_entries.append((key, int(rest[1:-6]), dir_entry))
+        for key, generation, dir_entry in lease_entries:
+            if key in done or generation < leases.get(key, (-1, 0))[0]: continue
+            try: leases[key] = (generation, dir_entry.stat().st_mtime)
+            except FileNotFoundError: pass
+        return leases, done
+
+    def is_live(self, lease):
+        return lease is not None and time.time() - lease[1] < self.lease_seconds
+
+    def try_claim(self, key, lease):
+        """Claims `key` given its newest lease from scan() (None: never claimed). Returns the lease path, or None if another node holds it."""
+        if self.is_live(lease): return None
+        generation = 0 if lease is None else lease[0] + 1
+        lease_path = self.path(f"{key}.g{generation}.lease")
+        try: fd = os.open(lease_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError: return None # Another node was faster
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({"node": self.node_id, "host": socket.gethostname(), "pid": os.getpid(), "time": time.time()}, f)
+        with self._lock: self._held[lease_path] = self.path(f"{key}.g{generation + 1}.lease")
+        return lease_path
+
+    def is_done(self, key):
+        return os.path.exists(self.path(f"{key}.done"))
+
+    def release(self, lease_path, done_key=None):
+        """Drops a held lease. With done_key, first marks that chunk (or "complete") as finished; otherwise the lease expires at once."""
+        with self._lock: self._held.pop(lease_path, None)
+        if done_key is not None:
+            with open(self.path(done_key if done_key == "complete" else f"{done_key}.done"), 'w', encoding='utf-8') as f:
+                json.dump({"node": self.node_id, "time": time.time()}, f)
+        else:
+            try: os.utime(lease_path, (0, 0)) # Expired: the next node to look takes it over
+            except OSError: pass
+
+    def start(self):
+        self._thread = threading.Thread(target=self._heartbeat, name="ocr-shard-heartbeat", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None: self._thread.join()
+
+    def _heartbeat(self):
+        warned = set()
+        while not self._stop.wait(self.lease_seconds / 4):
+            with self._lock: held = list(self._held.items())
+            for lease_path, next_path in held:
+                try: os.utime(lease_path, None)
+                except OSError as e: self.log(f"Warning: Could not renew lease '{lease_path}': {e}")
+                if lease_path not in warned and os.path.exists(next_path):
+                    warned.add(lease_path)
+                    self.log(f"Warning: Lease '{os.path.basename(lease_path)}' was taken over by another node (heartbeat too late); "
+                             "both nodes may OCR its images.")
+
+
+def read_shard_plan(run_dir):
+    """Returns the run.json plan of a sharded run, or None while it hasn't been written."""
+    try:
+        with open(os.path.join(run_dir, "run.json"), 'r', encoding='utf-8') as f: return json.load(f)
+    except (FileNotFoundError, ValueError): return None
+
+
+def join_sharded_run(shard_dir, folder_index, settings, overwrite_mode, chunk_images, order_key, node_id, lease_seconds, log):
+    """
+    Joins the newest unfinished sharded run in shard_dir (run-<n> subdirectories) if it has the same
+    settings and overwrite mode, or starts run-<n+1> with a plan made from this node's folder index
+    (images that need OCR, in processing order, cut into chunks of chunk_images).
+    Returns (ShardLeases, plan, error_msg).
+    """
+    settings = json.loads(json.dumps(settings)) # Same shape as read back from run.json
+    os.makedirs(shard_dir, exist_ok=True)
+    while True:
+        runs = sorted(int(name[4:]) for name in os.listdir(shard_dir) if name.startswith("run-") and name[4:].isdigit())
+        number = runs[-1] if runs else -1
+        if number >= 0:
+            run_dir = os.path.join(shard_dir, f"run-{number}")
+            leases = ShardLeases(run_dir, node_id, lease_seconds, log)
+            plan = read_shard_plan(run_dir)
+            if plan is None and time.time() - os.stat(run_dir).st_mtime < lease_seconds:
+                time.sleep(0.2); continue # The node that started it is still writing the plan
+            if plan is not None and not os.path.exists(leases.path("complete")):
+                if plan["settings"] == settings and plan["overwrite"] == overwrite_mode:
+                    log(f"Shard: Joining run {number} started by {plan['node']} ({len(plan['chunks'])} chunk(s)).")
+                    return leases, plan, None
+                if time.time() - plan["time"] < lease_seconds or any(leases.is_live(lease) for lease in leases.scan()[0].values()):
+                    return None, None, (f"Another sharded run with different settings or overwrite mode is in progress in {run_dir}. "
+                                        "Wait for it to finish, or use the same settings to join it.")
+                log(f"Shard: Run {number} was abandoned with different settings; starting a new run.")
+        run_dir = os.path.join(shard_dir, f"run-{number + 1}")
+        try: os.mkdir(run_dir)
+        except FileExistsError: continue # Another node started it first: join that one
+        entries = [entry for entry in folder_index.entries if overwrite_mode or not entry.has_txt]
+        if order_key is not None: entries.sort(key=order_key)
+        names = [entry.name for entry in entries]
+        plan = {"version": 1, "node": node_id, "time": time.time(), "settings": settings, "overwrite": overwrite_mode,
+                "chunks": [names[i:i + chunk_images] for i in range(0, len(names), chunk_images)]}
+        tmp_path = os.path.join(run_dir, f"run.json.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(plan, f)
+        os.replace(tmp_path, os.path.join(run_dir, "run.json")) # Only this node writes into the directory it created
+        for old in runs[:-1]: shutil.rmtree(os.path.join(shard_dir, f"run-{old}"), ignore_errors=True) # Keep the last one for stragglers
+        log(f"Shard: Started run {number + 1}: {len(names)} image(s) to OCR in {len(plan['chunks'])} chunk(s) of up to {chunk_images}.")
+        return ShardLeases(run_dir, node_id, lease_seconds, log), plan, None
+
+
+def get_shard_dir(folder_path, shard=True):
+    """Lease directory of a folder: shard=True means FOLDER/SHARD_DIRNAME, a string is used as the path."""
+    return shard if isinstance(shard, str) else os.path.join(os.path.abspath(folder_path), SHARD_DIRNAME)
+
+
+def run_sharded_ocr(folder_path, languages=OCR_LANGUAGES, use_gpu=None, overwrite_mode=True, status_callback=None, output_file=None,
+                    compile_output=True, incremental=DEFAULT_INCREMENTAL_COMPILE, shard_dir=None, node_id=None,
+                    chunk_images=DEFAULT_SHARD_CHUNK_IMAGES, lease_seconds=DEFAULT_SHARD_LEASE_SECONDS, reader=None,
+                    prefetch=DEFAULT_PREFETCH_IMAGES, cache_path=None, preprocess=None, batch_images=DEFAULT_OCR_BATCH_IMAGES,
+                    progress_callback=None, cpu_mode=None, dedup=None, tiling=None, text_store=None, order=DEFAULT_OCR_ORDER,
+                    priority=None, control=None):
+    """
+    Sharded mode: one node of several (machines, or processes on one machine) that OCR the same
+    shared folder together. Start it with the same settings on every node.
+    The first node writes the run's plan (the images that need OCR, cut into chunks of chunk_images)
+    to shard_dir (default FOLDER/SHARD_DIRNAME); every node then claims chunks through lease files
+    (see ShardLeases) and OCRs them with perform_batch_ocr and its own Reader. Chunks of a node
+    that stops renewing its lease (crash, power loss) are taken over after lease_seconds. Once all
+    chunks are done, exactly one node runs compile_text_files (and syncs the text store); the other
+    nodes wait for it, so they can take the compile over too if that node dies.
+    A node joining later with the same settings helps with what is left; after a finished run the
+    next one starts over. With an OCRRunControl as `control` a node can be cancelled; its current
+    chunk is released for the other nodes.
+    progress_callback also gets {"type": "chunk", "chunk": i, "chunks": n, "processed": ..., "errors": ..., "taken_over": bool}.
+    Returns (processed_count, error_count, error_message) for this node.
+    """
+    def log(msg):
+        if status_callback:
+            try: status_callback(msg)
+            except Exception as e: print(f"Error in status_callback: {e}")
+
+    def progress(record):
+        if progress_callback:
+            try: progress_callback(record)
+            except Exception as e: print(f"Error in progress_callback: {e}")
+
+    folder_path = os.path.abspath(folder_path)
+    folder_index, error = build_folder_index(folder_path)
+    if error: return 0, 0, error
+    output_file = output_file or os.path.join(folder_path, DEFAULT_COMPILED_FILENAME)
+    node_id = node_id or f"{socket.gethostname()}-{os.getpid()}"
+    if use_gpu is None: use_gpu = detect_gpu(log)
+    try:
+        preprocess, dedup, tiling = resolve_preprocess(preprocess), resolve_dedup(dedup), resolve_tiling(tiling)
+        cpu_mode = None if use_gpu else resolve_cpu_mode(cpu_mode)
+        order_key = resolve_ocr_order(order, priority)
+    except ValueError as e: return 0, 0, str(e)
+    settings = dict(get_ocr_settings_fingerprint(languages, preprocess, cpu_mode, tiling), dedup=dedup)
+    shard_dir = get_shard_dir(folder_path, shard_dir or True)
+    try: leases, plan, error = join_sharded_run(shard_dir, folder_index, settings, overwrite_mode, max(1, chunk_images),
+                                                order_key, node_id, lease_seconds, log)
+    except OSError as e: return 0, 0, f"Could not use the shard directory '{shard_dir}': {e}"
+    if error: return 0, 0, error
+
+    chunks = plan["chunks"]
+    entries = {entry.name: entry for entry in folder_index.entries}
+    processed_total = errors_total = 0
+    poll_seconds = min(SHARD_POLL_SECONDS, lease_seconds / 4)
+    log(f"Shard: Node {node_id} working in {leases.run_dir} (lease {lease_seconds}s).")
+    leases.start()
+    try:
+        while not (control is not None and control.cancelled):
+            lease_state, done = leases.scan()
+            if os.path.exists(leases.path("complete")): break
+            remaining = [i for i in range(len(chunks)) if f"c{i}" not in done]
+            claimed = False
+            for i in remaining:
+                if control is not None and not control.wait(): break
+                lease_path = leases.try_claim(f"c{i}", lease_state.get(f"c{i}"))
+                if lease_path is None: continue
+                if leases.is_done(f"c{i}"): leases.release(lease_path); continue # Its late owner finished it after all
+                claimed, taken_over = True, f"c{i}" in lease_state
+                if taken_over: log(f"Shard: Taking over chunk {i + 1}/{len(chunks)} (its node stopped or released it).")
+                else: log(f"Shard: Claimed chunk {i + 1}/{len(chunks)}.")
+                if taken_over or any(name not in entries for name in chunks[i]):
+                    fresh_index, _ = build_folder_index(folder_path) # .txt files the dead node already wrote / images newer than our scan
+                    if fresh_index is not None: entries = {entry.name: entry for entry in fresh_index.entries}
+                chunk_index = FolderIndex(folder_path, sorted((entries[name] for name in chunks[i] if name in entries), key=folder_order_key))
+                if reader is None:
+                    log(f"Shard: Initializing EasyOCR for languages: {languages} (GPU: {use_gpu}); it stays loaded for all chunks.")
+                    try: reader = create_reader(languages, use_gpu, cpu_mode=cpu_mode, log=log)
+                    except Exception as e:
+                        leases.release(lease_path)
+                        err_msg = f"Error initializing EasyOCR: {e}\nCheck dependencies (PyTorch, CUDA if using GPU)."
+                        log(f"!!! {err_msg} !!!")
+                        return processed_total, errors_total, err_msg
+                processed, _, errors, ocr_msg = perform_batch_ocr(
+                    folder_path, languages=languages, use_gpu=use_gpu, overwrite_mode=overwrite_mode, status_callback=log,
+                    prefetch=prefetch, cache_path=cache_path, folder_index=chunk_index, reader=reader, preprocess=preprocess,
+                    batch_images=batch_images, progress_callback=progress_callback, cpu_mode=cpu_mode, dedup=dedup, tiling=tiling,
+                    control=control)
+                processed_total += processed; errors_total += errors
+                if ocr_msg and "No image files found" not in ocr_msg:
+                    leases.release(lease_path)
+                    if ocr_msg == OCR_CANCELLED_MESSAGE: break
+                    return processed_total, errors_total, ocr_msg
+                leases.release(lease_path, f"c{i}")
+                progress({"type": "chunk", "chunk": i + 1, "chunks": len(chunks), "processed": processed, "errors": errors, "taken_over": taken_over})
+            if claimed or (control is not None and control.cancelled): continue
+            if not remaining: # Everything is OCR'd: one node compiles
+                lease_path = leases.try_claim("compile", lease_state.get("compile"))
+                if lease_path is not None:
+                    if not os.path.exists(leases.path("complete")): finish_sharded_run(folder_path, output_file, compile_output, incremental, text_store, log)
+                    leases.release(lease_path, "complete")
+                    break
+            elif not any(leases.is_live(lease_state.get(f"c{i}")) for i in remaining): continue # A lease just expired: take it over
+            time.sleep(poll_seconds) # Other nodes still hold chunks (or the compile): wait for them
+    except OSError as e:
+        return processed_total, errors_total, f"Error using the shard directory '{leases.run_dir}': {e}"
+    finally:
+        leases.stop()
+    if control is not None and control.cancelled:
+        log(f"Shard: Node {node_id} cancelled; its unfinished chunk is left to the other nodes.")
+        return processed_total, errors_total, OCR_CANCELLED_MESSAGE
+    log(f"Shard: Run complete. This node processed: {processed_total}, Errors: {errors_total}")
+    return processed_total, errors_total, None
+
+
+def finish_sharded_run(folder_path, output_file, compile_output, incremental, text_store, log):
+    """The one compile pass of a sharded run, over a fresh listing of the folder (every node's .txt files)."""
+    folder_index, error = build_folder_index(folder_path)
+    if error: log(f"!!! {error} !!!"); return
+    store = open_text_store(text_store, folder_path, log)
+    if store is not None:
+        try: store.sync(folder_index, log)
+        finally: store.close()
+    if not compile_output: return
+    log("Shard: All chunks are done; compiling.")
+    _, compile_msg = compile_text_files(folder_path, output_file, status_callback=log, folder_index=folder_index, incremental=incremental)
+    if compile_msg and "No .txt files found" not in compile_msg: log(f"Warning: {compile_msg}")
+
+
+# ==============================================================================
+# --- OCR DAEMON (warm Readers shared across jobs) ---
+# ==============================================================================
+
+class ReaderPool:
+    """
+    Initialized EasyOCR Readers kept alive between jobs, keyed by (languages, use_gpu).
+    At most max_per_key Readers exist per key; extra jobs wait for one to be released.
+    reader_factory(languages, use_gpu) builds a Reader (swap it for a stand-in in tests).
+    """
+    def __init__(self, reader_factory=create_reader, max_per_key=1):
+        self.reader_factory = reader_factory
+        self.max_per_key = max(1, max_per_key)
+        self._idle = collections.defaultdict(list)
+        self._created = collections.Counter()
+        self._cond = threading.Condition()
+
+    def acquire(self, languages, use_gpu):
+        key = (tuple(languages), bool(use_gpu))
+        with self._cond:
+            while not self._idle[key] and self._created[key] >= self.max_per_key:
+                self._cond.wait()
+            if self._idle[key]: return self._idle[key].pop()
+            self._created[key] += 1 # Reserve the slot, build outside the lock (takes seconds)
+        try:
+            return self.reader_factory(list(languages), use_gpu)
+        except Exception:
+            with self._cond:
+                self._created[key] -= 1
+                self._cond.notify_all()
+            raise
+
+    def release(self, languages, use_gpu, reader):
+        with self._cond:
+            self._idle[(tuple(languages), bool(use_gpu))].append(reader)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return [{"languages": list(key[0]), "gpu": key[1], "readers": count, "idle": len(self._idle[key])}
+                    for key, count in self._created.items() if count]
+
+
+class OCRService:
+    """
+    Transport-independent job runner behind the daemon: every job borrows a warm Reader
+    from the ReaderPool, so models are loaded once per daemon instead of once per job.
+    Jobs are JSON-compatible dicts:
+      {"op": "run", "folder": ..., "overwrite": bool, "compile": bool, "output": ..., "incremental": bool, "metrics_dir": ...}
+      {"op": "images", "images": [path, ...], "return_text": bool}
+      {"op": "ping"}
+    A "run" job's "output", "metrics_dir" and "store" path must be inside its folder or one of allowed_paths.
+    Any job may set "languages", "preprocess" (preset name or options dict), "batch_images", "dedup" and "tiling";
+    "run" jobs may also set "store" (true or a store path, see perform_batch_ocr's text_store), "order", "priority" and "journal"
+    (default DEFAULT_USE_JOURNAL). handle_job returns a JSON-compatible result dict with "ok".
+    cpu_mode applies to the whole daemon, since it decides how its Readers are built.
+    """
+    def __init__(self, languages=OCR_LANGUAGES, use_gpu=False, readers_per_key=1,
+                 cache_path=None, prefetch=DEFAULT_PREFETCH_IMAGES, reader_factory=create_reader, preprocess=None,
+                 batch_images=DEFAULT_OCR_BATCH_IMAGES, cpu_mode=None, dedup=None, tiling=None, text_store=None, allowed_paths=None):
+        self.languages = list(languages)
+        self.use_gpu = use_gpu
+        self.cache_path = cache_path
+        self.prefetch = prefetch
+        self.preprocess = preprocess
+        self.batch_images = batch_images
+        self.dedup = dedup
+        self.tiling = tiling
+        self.text_store = text_store
+        self.allowed_paths = list(allowed_paths or [])
+        self.cpu_mode = None if use_gpu else resolve_cpu_mode(cpu_mode)
+        if self.cpu_mode:
+            build_reader = reader_factory
+            reader_factory = lambda languages, use_gpu: build_reader(languages, use_gpu, cpu_mode=self.cpu_mode, log=print)
+        self.pool = ReaderPool(reader_factory, readers_per_key)
+        self.jobs_served = 0
+        self._jobs_lock = threading.Lock()
+
+    def preload(self, languages=None):
+        """Builds (and parks) a Reader up front so the first job doesn't pay for model loading."""
+        languages = list(languages or self.languages)
+        self.pool.release(languages, self.use_gpu, self.pool.acquire(languages, self.use_gpu))
+
+    def handle_job(self, job, status_callback=None, progress_callback=None):
+        def log(msg):
+            if status_callback:
+                try: status_callback(msg)
+                except Exception as e: print(f"Error in status_callback: {e}")
+
+        op = job.get("op", "run")
+        if op == "ping":
+            return {"ok": True, "jobs_served": self.jobs_served, "readers": self.pool.stats()}
+        if op not in ("run", "images"):
+            return {"ok": False, "error": f"Unknown job op: {op}"}
+
+        languages = list(job.get("languages") or self.languages)
+        log(f"Daemon: Job '{op}' waiting for a warm reader ({'/'.join(languages)})")
+        try:
+            reader = self.pool.acquire(languages, self.use_gpu)
+        except Exception as e:
+            err_msg = f"Error initializing EasyOCR: {e}\nCheck dependencies (PyTorch, CUDA if using GPU)."
+            log(f"!!! {err_msg} !!!")
+            return {"ok": False, "error": err_msg}
+        try:
+            if op == "run": result = self._run_folder_job(job, reader, languages, log, progress_callback)
+            else: result = self._run_images_job(job, reader, languages, log, progress_callback)
+        finally:
+            self.pool.release(languages, self.use_gpu, reader)
+            with self._jobs_lock: self.jobs_served += 1
+        return result
+
+    def _run_folder_job(self, job, reader, languages, log, progress_callback=None):
+        folder_path = job["folder"]
+        for key in ("output", "metrics_dir", "store"):
+            path = job.get(key)
+            if isinstance(path, str) and not is_path_inside(path, [folder_path] + self.allowed_paths):
+                return {"ok": False, "error": f"The job's {key} '{path}' is outside its folder (start the daemon with --allow-path to permit it)."}
+        folder_index, index_error = build_folder_index(folder_path)
+        if index_error: return {"ok": False, "error": index_error}
+        metrics = RunMetrics(job["metrics_dir"]) if job.get("metrics_dir") else None
+        processed, skipped, errors, ocr_msg = perform_batch_ocr(
+            folder_path, languages=languages, use_gpu=self.use_gpu, overwrite_mode=bool(job.get("overwrite", False)),
+            status_callback=log, prefetch=self.prefetch, cache_path=self.cache_path,
+            preprocess=job.get("preprocess", self.preprocess), batch_images=int(job.get("batch_images", self.batch_images)),
+            folder_index=folder_index, reader=reader, progress_callback=progress_callback, metrics=metrics,
+            cpu_mode=self.cpu_mode, dedup=job.get("dedup", self.dedup), tiling=job.get("tiling", self.tiling),
+            text_store=job.get("store", self.text_store), order=job.get("order", DEFAULT_OCR_ORDER), priority=job.get("priority"),
+            journal=job.get("journal", DEFAULT_USE_JOURNAL))
+        result = {"processed": processed, "skipped": skipped, "errors": errors, "ocr_error": ocr_msg}
+        if ocr_msg and "No image files found" not in ocr_msg:
+            result.update(ok=False, error=ocr_msg); return result
+        if job.get("compile", True):
+            output_file = job.get("output") or os.path.join(folder_path, DEFAULT_COMPILED_FILENAME)
+            with stage_timer(metrics, "compile"):
+                compiled_count, compile_msg = compile_text_files(folder_path, output_file, status_callback=log,
+                                                                 folder_index=folder_index,
+                                                                 incremental=job.get("incremental", DEFAULT_INCREMENTAL_COMPILE))
+            result.update(compiled=compiled_count, compile_error=compile_msg, output=os.path.abspath(output_file))
+        if metrics is not None: result["metrics"] = metrics.save(log)
+        result["ok"] = errors == 0 and not result.get("compile_error")
+        return result
+
+    def _run_images_job(self, job, reader, languages, log, progress_callback=None):
+        images = [os.path.abspath(path) for path in job.get("images", [])]
+        try:
+            preprocess = resolve_preprocess(job.get("preprocess", self.preprocess))
+            tiling = resolve_tiling(job.get("tiling", self.tiling))
+        except ValueError as e: return {"ok": False, "error": str(e)}
+        results, ok = [], True
+        for i, image_path in enumerate(images):
+            with inference_context(self.cpu_mode):
+                saved = ocr_and_save_image(reader, image_path, languages, f"{i+1}/{len(images)}", log, preprocess=preprocess,
+                                           progress_callback=progress_callback, tiling=tiling)
+            item = {"image": image_path, "saved": saved}
+            if saved and job.get("return_text"):
+                with open(get_unique_txt_path(image_path), 'r', encoding='utf-8') as f: item["text"] = f.read()
+            results.append(item); ok = ok and saved
+        return {"ok": ok, "images": results}
+
+
+class _DaemonRequestHandler(socketserver.StreamRequestHandler):
+    """One JSON job per connection; streams {"event": "log"/"progress"} lines, then one {"event": "result"} line."""
+    def handle(self):
+        send_lock = threading.Lock() # The pipeline's writer thread logs too
+        def send(obj):
+            with send_lock:
+                try: self.wfile.write((json.dumps(obj) + "\n").encode('utf-8')); self.wfile.flush()
+                except OSError: pass # Client went away; let the job finish anyway
+        try:
+            job = json.loads(self.rfile.readline(DAEMON_MAX_REQUEST_BYTES).decode('utf-8'))
+            if not self.server.check_token(job.pop("token", None)):
+                send({"event": "result", "ok": False, "error": f"Missing or wrong daemon token (see {self.server.token_path})."})
+                return
+            if job.get("op") == "shutdown":
+                send({"event": "result", "ok": True})
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+            result = self.server.service.handle_job(job, lambda msg: send({"event": "log", "message": str(msg)}),
+                                                    lambda record: send({"event": "progress", "record": record}))
+        except Exception as e:
+            result = {"ok": False, "error": f"Daemon error: {e}"}
+        send({"event": "result", **result})
+
+
+class OCRDaemonServer(socketserver.ThreadingTCPServer):
+    """
+    Local TCP server (127.0.0.1 by default) around an OCRService.
+    Every start writes a new random token to token_path (default: get_daemon_token_path(port)), a file only
+    the user can read; jobs without it are refused, so other local users can't run jobs or shut the daemon down.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, service, host=DEFAULT_DAEMON_HOST, port=DEFAULT_DAEMON_PORT, token_path=None):
+        super().__init__((host, port), _DaemonRequestHandler)
+        self.service = service
+        self.token = secrets.token_hex(32)
+        self.token_path = token_path or get_daemon_token_path(self.server_address[1])
+        try: write_private_file(self.token_path, self.token)
+        except OSError:
+            self.server_close()
+            raise
+
+    def check_token(self, token):
+        return isinstance(token, str) and hmac.compare_digest(token, self.token)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            with open(self.token_path, 'r', encoding='utf-8') as f: ours = f.read().strip() == self.token
+            if ours: os.remove(self.token_path) # A newer daemon on the same port may have replaced it
+        except OSError: pass
+
+
+def get_daemon_token_path(port):
+    return os.path.join(DAEMON_TOKEN_DIR, f"daemon-{port}.token")
+
+
+def write_private_file(path, text):
+    """Writes `text` to `path` readable and writable by the current user only (0600; on Windows the profile folder's ACL applies)."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        os.chmod(temp_path, 0o600) # In case a stale temp file already existed with other permissions
+        with os.fdopen(fd, 'w', encoding='utf-8') as f: f.write(text)
+        os.replace(temp_path, path)
+    except OSError:
+        try: os.remove(temp_path)
+        except OSError: pass
+        raise
+
+
+def read_daemon_token(port):
+    """The running daemon's token for `port`, or None if there is no token file (no daemon, or another user's)."""
+    try:
+        with open(get_daemon_token_path(port), 'r', encoding='utf-8') as f: return f.read().strip()
+    except OSError: return None
+
+
+def is_path_inside(path, roots):
+    """True if `path` (after resolving symlinks and '..') is one of `roots` or inside one of them."""
+    path = os.path.normcase(os.path.realpath(path))
+    for root in roots:
+        root = os.path.normcase(os.path.realpath(root))
+        try:
+            if os.path.commonpath([path, root]) == root: return True
+        except ValueError: pass # Different drives (Windows)
+    return False
+
+
+class OCRDaemonClient:
+    """
+    Submits jobs to a running OCRDaemonServer. submit() streams log lines to status_callback and progress records to progress_callback.
+    The token is read from the daemon's token file for `port` unless given.
+    """
+    def __init__(self, host=DEFAULT_DAEMON_HOST, port=DEFAULT_DAEMON_PORT, timeout=None, token=None):
+        self.host, self.port, self.timeout, self.token = host, port, timeout, token
+
+    def submit(self, job, status_callback=None, progress_callback=None):
+        token = self.token if self.token is not None else read_daemon_token(self.port)
+        with socket.create_connection((self.host, self.port), timeout=self.timeout) as sock:
+            sock.sendall((json.dumps(dict(job, token=token)) + "\n").encode('utf-8'))
+            with sock.makefile('r', encoding='utf-8') as stream:
+                for line in stream:
+                    event = json.loads(line)
+                    if event.get("event") == "log":
+                        if status_callback: status_callback(event.get("message", ""))
+                    elif event.get("event") == "progress":
+                        if progress_callback: progress_callback(event["record"])
+                    elif event.get("event") == "result":
+                        event.pop("event"); return event
+        return {"ok": False, "error": "Daemon closed the connection without a result."}
+
+    def is_available(self, timeout=0.5):
+        try: return OCRDaemonClient(self.host, self.port, timeout, self.token).submit({"op": "ping"}).get("ok", False)
+        except (OSError, ValueError): return False
+
+
+class LocalOCRClient:
+    """
+    In-process stand-in for OCRDaemonClient (same submit() API, no sockets).
+    Jobs are round-tripped through JSON so they stay wire-compatible.
+    """
+    def __init__(self, service):
+        self.service = service
+
+    def submit(self, job, status_callback=None, progress_callback=None):
+        return json.loads(json.dumps(self.service.handle_job(json.loads(json.dumps(job)), status_callback, progress_callback)))
+
+    def is_available(self, timeout=None):
+        return True
+
+
+def parse_daemon_address(address):
+    """'host:port', ':port' or 'port' -> (host, port), defaulting to the local daemon."""
+    if not address: return DEFAULT_DAEMON_HOST, DEFAULT_DAEMON_PORT
+    host, _, port = str(address).rpartition(":")
+    return host or DEFAULT_DAEMON_HOST, int(port)
+
+
+# ==============================================================================
+# --- HEADLESS COMMAND LINE ---
+# ==============================================================================
+
+_console_lock = threading.Lock() # Pipeline/writer threads log concurrently with progress events
+
+def make_console_callback(jsonl=False, quiet=False, stream=None):
+    """
+    status_callback for headless runs. Plain text lines, or one JSON object per line
+    ({"event": "log", "time": ..., "message": ...}) when jsonl is set.
+    """
+    stream = stream or sys.stdout
+    def callback(message):
+        if quiet: return
+        with _console_lock:
+            if jsonl: stream.write(json.dumps({"event": "log", "time": round(time.time(), 3), "message": str(message)}) + "\n")
+            else: stream.write(f"{message}\n")
+            stream.flush()
+    return callback
+
+
+def emit_event(event, jsonl=False, stream=None, **fields):
+    """Writes a machine-readable event line (jsonl) or a short human summary line."""
+    stream = stream or sys.stdout
+    with _console_lock:
+        if jsonl: stream.write(json.dumps({"event": event, "time": round(time.time(), 3), **fields}) + "\n")
+        else: stream.write(f"[{event}] " + ", ".join(f"{k}={v}" for k, v in fields.items()) + "\n")
+        stream.flush()
+
+
+def make_progress_callback(jsonl=False, quiet=False):
+    """progress_callback for headless runs: {"event": "progress", ...} lines in --jsonl mode, nothing otherwise."""
+    if not jsonl or quiet: return None
+    return lambda record: emit_event("progress", jsonl, **record)
+
+
+def add_preprocess_arguments(command):
+    command.add_argument("--preprocess", choices=sorted(PREPROCESS_PRESETS), default="none",
+                         help="Image preprocessing preset before OCR (default: %(default)s).")
+    command.add_argument("--max-side", type=int, help="Override the preset's cap on the longest image side (px).")
+
+
+def preprocess_from_args(args):
+    """Preset from --preprocess, with --max-side applied on top."""
+    preprocess = resolve_preprocess(args.preprocess) or {}
+    if args.max_side: preprocess.update(max_side=args.max_side, reduced_decode=True)
+    return preprocess or None
+
+
+def add_cpu_mode_arguments(command, with_switch=True):
+    if with_switch:
+        command.add_argument("--cpu-mode", action="store_true",
+                             help="CPU inference mode: explicit torch threads and inference_mode (ignored on GPU). The recognizer is int8 on CPU either way.")
+    command.add_argument("--threads", type=int, default=CPU_MODE_DEFAULTS['intra_op_threads'],
+                         help="CPU mode: torch intra-op threads, 0 = all cores split between workers (default: %(default)s).")
+    command.add_argument("--interop-threads", type=int, default=CPU_MODE_DEFAULTS['inter_op_threads'],
+                         help="CPU mode: torch inter-op threads (default: %(default)s).")
+    command.add_argument("--channels-last", action="store_true", help="CPU mode: channels-last memory layout for the detector.")
+    command.add_argument("--no-quantize", action="store_true", help="CPU mode: use the fp32 recognizer instead of EasyOCR's default int8 one.")
+
+
+def cpu_mode_from_args(args, enabled=None):
+    """CPU mode options from the --cpu-mode family of flags, or None when the mode is off."""
+    if not (args.cpu_mode if enabled is None else enabled): return None
+    return resolve_cpu_mode({'quantize': not args.no_quantize, 'intra_op_threads': args.threads,
+                             'inter_op_threads': args.interop_threads, 'channels_last': args.channels_last})
+
+
+def add_dedup_arguments(command):
+    command.add_argument("--dedup", nargs="?", type=int, const=DEDUP_DEFAULTS['threshold'], metavar="THRESHOLD",
+                         help="Reuse the last OCR'd frame's text for near-duplicate images (perceptual hash within "
+                              "THRESHOLD bits, default: %(const)s). Single worker only.")
+    command.add_argument("--dedup-hash", choices=("phash", "dhash"), default=DEDUP_DEFAULTS['hash'], help="Perceptual hash for --dedup (default: %(default)s).")
+
+
+def dedup_from_args(args):
+    """Near-duplicate options from --dedup/--dedup-hash, or None when it is off."""
+    if args.dedup is None: return None
+    return {'threshold': args.dedup, 'hash': args.dedup_hash}
+
+
+def add_tiling_arguments(command):
+    command.add_argument("--tiled", action="store_true",
+                         help="OCR huge scans in overlapping strips and every page of multi-page TIFFs. Pages are decoded one at a time, "
+                              "each in full before it is cut into strips, so peak memory is about one full page.")
+    command.add_argument("--tile-min-side", type=int, default=TILING_DEFAULTS['min_side'],
+                         help="Tiled mode: pages with a longer side (px) are cut into strips (default: %(default)s).")
+    command.add_argument("--tile-overlap", type=int, default=TILING_DEFAULTS['overlap'],
+                         help="Tiled mode: rows shared by neighbouring strips, more than the tallest text line (default: %(default)s).")
+    command.add_argument("--strip-megapixels", type=float, default=TILING_DEFAULTS['strip_pixels'] / 1e6,
+                         help="Tiled mode: pixel budget per strip, in megapixels (default: %(default).1f).")
+
+
+def tiling_from_args(args):
+    """Tiling options from --tiled and its tuning flags, or None when it is off."""
+    if not args.tiled: return None
+    return {'min_side': args.tile_min_side, 'overlap': args.tile_overlap, 'strip_pixels': int(args.strip_megapixels * 1e6)}
+
+
+def add_order_arguments(command):
+    command.add_argument("--order", choices=list(OCR_ORDER_POLICIES), default=DEFAULT_OCR_ORDER,
+                         help="Processing order: oldest first, smallest files first, or the --priority images first "
+                              "(default: %(default)s). The compiled file is always in mtime order.")
+    command.add_argument("--priority", action="append", default=[], metavar="NAME", help="Image to OCR before the others (repeatable).")
+    command.add_argument("--priority-file", metavar="FILE", help="File with one image name per line to OCR first, in that order.")
+
+
+def ocr_order_from_args(args):
+    """(order, priority list) from --order/--priority/--priority-file. Raises OSError if the priority file can't be read."""
+    priority = list(args.priority)
+    if args.priority_file:
+        with open(args.priority_file, 'r', encoding='utf-8') as f: priority += [line.strip() for line in f if line.strip()]
+    return args.order, priority or None
+
+
+def add_cache_arguments(command):
+    command.add_argument("--cache", nargs="?", const=DEFAULT_OCR_CACHE_PATH, metavar="PATH",
+                         help=f"Reuse OCR results for identical images from a cache file (off by default, like the GUI; default path: {DEFAULT_OCR_CACHE_PATH}).")
+
+
+def add_store_arguments(command, help_text):
+    command.add_argument("--store", nargs="?", const=True, metavar="PATH",
+                         help=f"{help_text} (default path: FOLDER/{TEXT_STORE_FILENAME}).")
+
+
+def open_existing_text_store(args):
+    """The store named by a query/export command's arguments, or (None, error message) if there is none yet."""
+    store_path = get_text_store_path(args.folder, args.store or True)
+    if not os.path.isfile(store_path): return None, f"No text store at '{store_path}' (create it with: run/compile --store)."
+    try: return OCRTextStore(store_path, args.folder), None
+    except sqlite3.Error as e: return None, f"Could not open text store '{store_path}': {e}"
+
+
+def add_shard_arguments(command):
+    command.add_argument("--shard", nargs="?", const=True, metavar="DIR",
+                         help="Share the work with other nodes running the same command on this (shared) folder, through lease files "
+                              f"in DIR (default: FOLDER/{SHARD_DIRNAME}). One node compiles once all images are done.")
+    command.add_argument("--node-id", help="Name of this node in lease files (default: HOSTNAME-PID).")
+    command.add_argument("--chunk-images", type=int, default=DEFAULT_SHARD_CHUNK_IMAGES, help="Images claimed per lease (default: %(default)s).")
+    command.add_argument("--lease-seconds", type=float, default=DEFAULT_SHARD_LEASE_SECONDS,
+                         help="A node that hasn't renewed its lease for this long is presumed dead and its chunk is taken over (default: %(default)s).")
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        prog="batch_ocr",
+        description="Batch OCR a folder of images (oldest first) and compile the text into one file. "
+                    "Headless counterpart of the GUI script.")
+    parser.add_argument("--jsonl", action="store_true", help="Emit JSON-lines progress/result events on stdout.")
+    parser.add_argument("--quiet", action="store_true", help="Only print result events, not the per-image log.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_cmd = commands.add_parser("run", help="OCR the folder, then compile (what the GUI button does).")
+    run_cmd.add_argument("folder")
+    run_cmd.add_argument("--output", help=f"Compiled file (default: FOLDER/{DEFAULT_COMPILED_FILENAME}).")
+    run_cmd.add_argument("--overwrite", action="store_true", help="Re-OCR images that already have a .txt file (default: use existing).")
+    run_cmd.add_argument("--no-compile", action="store_true", help="Only write the per-image .txt files.")
+    run_cmd.add_argument("--languages", default=",".join(OCR_LANGUAGES), help="Comma-separated EasyOCR language codes (default: %(default)s).")
+    run_cmd.add_argument("--gpu", choices=("auto", "on", "off"), default="auto", help="Use CUDA (default: auto-detect).")
+    run_cmd.add_argument("--workers", type=int, default=DEFAULT_OCR_WORKERS, help="OCR worker processes (default: %(default)s).")
+    run_cmd.add_argument("--prefetch", type=int, default=DEFAULT_PREFETCH_IMAGES, help="Images decoded ahead of the model (default: %(default)s).")
+    run_cmd.add_argument("--batch-images", type=int, default=DEFAULT_OCR_BATCH_IMAGES,
+                         help="Group up to N same-sized images per batched model call (default: %(default)s = off).")
+    add_cache_arguments(run_cmd)
+    run_cmd.add_argument("--manifest", action="store_true", help=f"Also save the folder scan to {FOLDER_INDEX_MANIFEST_FILENAME}.")
+    run_cmd.add_argument("--full-compile", action="store_true", help="Rebuild the compiled file from scratch instead of incrementally.")
+    run_cmd.add_argument("--metrics-dir", metavar="DIR", help=f"Write per-stage timings to DIR/{METRICS_JSON_FILENAME} and DIR/{METRICS_PROM_FILENAME}.")
+    run_cmd.add_argument("--profile", choices=("cprofile", "torch"), help="Profile the OCR loop (output goes to --metrics-dir, else the image folder).")
+    add_preprocess_arguments(run_cmd)
+    add_cpu_mode_arguments(run_cmd)
+    add_dedup_arguments(run_cmd)
+    add_tiling_arguments(run_cmd)
+    add_store_arguments(run_cmd, "Also keep a searchable SQLite FTS5 copy of the folder's text")
+    add_order_arguments(run_cmd)
+    run_cmd.add_argument("--no-journal", action="store_true",
+                         help=f"Don't keep the {JOURNAL_FILENAME} journal that lets an interrupted run resume where it stopped.")
+    add_shard_arguments(run_cmd)
+    run_cmd.add_argument("--daemon", nargs="?", const=f"{DEFAULT_DAEMON_HOST}:{DEFAULT_DAEMON_PORT}", metavar="HOST:PORT",
+                         help="Submit the job to a running 'serve' daemon (warm models) instead of loading EasyOCR here.")
+
+    watch_cmd = commands.add_parser("watch", help="Keep OCRing images as they arrive in the folder (models stay loaded) until Ctrl+C.")
+    watch_cmd.add_argument("folder")
+    watch_cmd.add_argument("--output", help=f"Compiled file (default: FOLDER/{DEFAULT_COMPILED_FILENAME}).")
+    watch_cmd.add_argument("--no-compile", action="store_true", help="Only write the per-image .txt files.")
+    watch_cmd.add_argument("--languages", default=",".join(OCR_LANGUAGES), help="Comma-separated EasyOCR language codes (default: %(default)s).")
+    watch_cmd.add_argument("--gpu", choices=("auto", "on", "off"), default="auto", help="Use CUDA (default: auto-detect).")
+    watch_cmd.add_argument("--settle", type=float, default=DEFAULT_WATCH_SETTLE_SECONDS,
+                           help="Seconds an image must stay unchanged before it is OCR'd (default: %(default)s).")
+    watch_cmd.add_argument("--poll", type=float, default=DEFAULT_WATCH_POLL_SECONDS, help="Polling interval in seconds (default: %(default)s).")
+    watch_cmd.add_argument("--polling", action="store_true", help="Poll the folder even where inotify is available (e.g. network shares).")
+    add_cache_arguments(watch_cmd)
+    add_preprocess_arguments(watch_cmd)
+    add_cpu_mode_arguments(watch_cmd)
+    add_dedup_arguments(watch_cmd)
+    add_tiling_arguments(watch_cmd)
+    add_store_arguments(watch_cmd, "Also keep a searchable SQLite FTS5 copy of the folder's text")
+
+    serve_cmd = commands.add_parser("serve", help="Run a local OCR daemon that keeps EasyOCR Readers loaded between jobs.")
+    serve_cmd.add_argument("--listen", default=f"{DEFAULT_DAEMON_HOST}:{DEFAULT_DAEMON_PORT}", metavar="HOST:PORT", help="Address to listen on (default: %(default)s).")
+    serve_cmd.add_argument("--readers", type=int, default=1, help="Warm Readers per language set, i.e. concurrent jobs (default: %(default)s).")
+    serve_cmd.add_argument("--languages", default=",".join(OCR_LANGUAGES), help="Default languages, preloaded at start (default: %(default)s).")
+    serve_cmd.add_argument("--gpu", choices=("auto", "on", "off"), default="auto", help="Use CUDA (default: auto-detect).")
+    serve_cmd.add_argument("--batch-images", type=int, default=DEFAULT_OCR_BATCH_IMAGES,
+                           help="Default for jobs: group up to N same-sized images per batched model call (default: %(default)s = off).")
+    serve_cmd.add_argument("--allow-path", action="append", default=[], metavar="DIR",
+                           help="Also let jobs write their output, metrics and text store under DIR (default: only inside the job's folder). Repeatable.")
+    add_cache_arguments(serve_cmd)
+    add_preprocess_arguments(serve_cmd)
+    add_cpu_mode_arguments(serve_cmd)
+    add_dedup_arguments(serve_cmd)
+    add_tiling_arguments(serve_cmd)
+
+    report_cmd = commands.add_parser("preprocess-report", help="Compare preprocessing presets (time, text length, similarity) on a sample.")
+    report_cmd.add_argument("folder")
+    report_cmd.add_argument("--presets", default="none,balanced,fast,document", help="Comma-separated presets; the first is the baseline (default: %(default)s).")
+    report_cmd.add_argument("--sample", type=int, default=20, help="Images to sample, spread over the folder (default: %(default)s).")
+    report_cmd.add_argument("--languages", default=",".join(OCR_LANGUAGES), help="Comma-separated EasyOCR language codes (default: %(default)s).")
+    report_cmd.add_argument("--gpu", choices=("auto", "on", "off"), default="auto", help="Use CUDA (default: auto-detect).")
+
+    cpu_report_cmd = commands.add_parser("cpu-report", help="Compare CPU mode against the fp32 models (speed and text differences) on a sample.")
+    cpu_report_cmd.add_argument("folder")
+    cpu_report_cmd.add_argument("--sample", type=int, default=20, help="Images to sample, spread over the folder (default: %(default)s).")
+    cpu_report_cmd.add_argument("--languages", default=",".join(OCR_LANGUAGES), help="Comma-separated EasyOCR language codes (default: %(default)s).")
+    add_cpu_mode_arguments(cpu_report_cmd, with_switch=False)
+
+    compile_cmd = commands.add_parser("compile", help="Only compile existing .txt files (no OCR, no torch import).")
+    compile_cmd.add_argument("folder")
+    compile_cmd.add_argument("--output", help=f"Compiled file (default: FOLDER/{DEFAULT_COMPILED_FILENAME}).")
+    compile_cmd.add_argument("--manifest", action="store_true", help=f"Also save the folder scan to {FOLDER_INDEX_MANIFEST_FILENAME}.")
+    compile_cmd.add_argument("--full-compile", action="store_true", help="Rebuild the compiled file from scratch instead of incrementally.")
+    add_store_arguments(compile_cmd, "Also bring the searchable text store up to date with the .txt files")
+
+    query_cmd = commands.add_parser("query", help="Full-text search of the folder's text store, best matches first.")
+    query_cmd.add_argument("folder")
+    query_cmd.add_argument("terms", nargs="+", help='Words to find (FTS5 syntax: "exact phrase", prefix*, AND/OR/NOT).')
+    query_cmd.add_argument("--limit", type=int, default=20, help="Maximum hits (default: %(default)s).")
+    add_store_arguments(query_cmd, "Text store to search")
+
+    export_cmd = commands.add_parser("export", help="Write the compiled file from the text store (no .txt files read).")
+    export_cmd.add_argument("folder")
+    export_cmd.add_argument("--output", help=f"Compiled file (default: FOLDER/{DEFAULT_COMPILED_FILENAME}).")
+    add_store_arguments(export_cmd, "Text store to export")
+
+    scan_cmd = commands.add_parser("scan", help="List images in mod-time order with their .txt status.")
+    scan_cmd.add_argument("folder")
+    scan_cmd.add_argument("--manifest", action="store_true", help=f"Also save the folder scan to {FOLDER_INDEX_MANIFEST_FILENAME}.")
+    return parser
+
+
+def main(argv=None):
+    """Command line entry point. Returns the process exit code (0 ok, 1 errors)."""
+    args = build_arg_parser().parse_args(argv)
+    log = make_console_callback(jsonl=args.jsonl, quiet=args.quiet)
+    progress = make_progress_callback(jsonl=args.jsonl, quiet=args.quiet)
+
+    if args.command == "serve":
+        return serve_daemon(args, log)
+    if args.command == "watch":
+        return watch_command(args, log, progress)
+
+    if args.command in ("query", "export"): # Only the store is read, not the folder
+        store, store_error = open_existing_text_store(args)
+        if store_error:
+            emit_event("error", args.jsonl, message=store_error)
+            return 1
+        try:
+            if args.command == "query":
+                start_time = time.perf_counter()
+                hits = store.search(" ".join(args.terms), args.limit)
+                for hit in hits:
+                    if args.jsonl: emit_event("hit", True, **hit)
+                    elif not args.quiet: print(f"{hit['score']:8.3f}  {hit['path']}\n          {hit['snippet']}")
+                emit_event("query_result", args.jsonl, hits=len(hits), milliseconds=round((time.perf_counter() - start_time) * 1000, 2))
+                return 0
+            output_file = args.output or os.path.join(args.folder, DEFAULT_COMPILED_FILENAME)
+            compiled_count, export_msg = store.export_compiled(output_file, log)
+            emit_event("compile_result", args.jsonl, compiled=compiled_count, output=os.path.abspath(output_file), error=export_msg)
+            return 0 if export_msg is None else 1
+        finally: store.close()
+
+    folder_index, index_error = build_folder_index(args.folder, use_manifest=getattr(args, "manifest", False))
+    if index_error:
+        emit_event("error", args.jsonl, message=index_error)
+        return 1
+
+    if args.command == "cpu-report":
+        entries = folder_index.entries
+        step = max(1, len(entries) // max(1, args.sample))
+        sample = [entry.path for entry in entries[::step][:args.sample]]
+        languages = [lang.strip() for lang in args.languages.split(",") if lang.strip()]
+        try: rows = compare_cpu_mode(sample, languages, cpu_mode_from_args(args, enabled=True), log)
+        except Exception as e:
+            emit_event("error", args.jsonl, message=f"Error initializing EasyOCR: {e}")
+            return 1
+        for row in rows: emit_event("cpu_report", args.jsonl, **row)
+        return 0
+
+    if args.command == "preprocess-report":
+        entries = folder_index.entries
+        step = max(1, len(entries) // max(1, args.sample))
+        sample = [entry.path for entry in entries[::step][:args.sample]]
+        languages = [lang.strip() for lang in args.languages.split(",") if lang.strip()]
+        use_gpu = {"auto": None, "on": True, "off": False}[args.gpu]
+        if use_gpu is None: use_gpu = detect_gpu(log)
+        try: reader = create_reader(languages, use_gpu)
+        except Exception as e:
+            emit_event("error", args.jsonl, message=f"Error initializing EasyOCR: {e}")
+            return 1
+        presets = [preset.strip() for preset in args.presets.split(",") if preset.strip()]
+        for row in compare_preprocess_presets(sample, reader, languages, presets, log):
+            emit_event("preprocess_report", args.jsonl, **row)
+        return 0
+
+    if args.command == "scan":
+        for entry in folder_index.entries:
+            if args.jsonl: emit_event("image", True, name=entry.name, size=entry.size, mtime=entry.mtime, has_txt=entry.has_txt)
+            elif not args.quiet: print(f"{'txt' if entry.has_txt else '---'}  {entry.mtime:.3f}  {entry.size:>12}  {entry.name}")
+        emit_event("scan_result", args.jsonl, images=len(folder_index.entries),
+                   with_txt=sum(1 for e in folder_index.entries if e.has_txt), stat_calls=folder_index.restat_count)
+        return 0
+
+    output_file = args.output or os.path.join(args.folder, DEFAULT_COMPILED_FILENAME)
+    if args.command == "compile":
+        store = open_text_store(args.store, args.folder, log)
+        if store is not None:
+            try: store.sync(folder_index, log)
+            finally: store.close()
+        compiled_count, compile_msg = compile_text_files(args.folder, output_file, status_callback=log,
+                                                         folder_index=folder_index, incremental=not args.full_compile)
+        emit_event("compile_result", args.jsonl, compiled=compiled_count, output=os.path.abspath(output_file), error=compile_msg)
+        return 0 if compile_msg is None else 1
+
+    # --- run ---
+    languages = [lang.strip() for lang in args.languages.split(",") if lang.strip()]
+    try: order, priority = ocr_order_from_args(args)
+    except OSError as e:
+        emit_event("error", args.jsonl, message=f"Could not read priority file: {e}")
+        return 1
+    if args.daemon and args.shard:
+        emit_event("error", args.jsonl, message="--shard can't be combined with --daemon; run the sharded command on each node.")
+        return 1
+    if args.daemon:
+        host, port = parse_daemon_address(args.daemon)
+        job = {"op": "run", "folder": os.path.abspath(args.folder), "overwrite": args.overwrite, "languages": languages,
+               "preprocess": preprocess_from_args(args), "batch_images": args.batch_images, "dedup": dedup_from_args(args), "tiling": tiling_from_args(args),
+               "store": os.path.abspath(args.store) if isinstance(args.store, str) else bool(args.store),
+               "order": order, "priority": priority, "journal": not args.no_journal,
+               "metrics_dir": os.path.abspath(args.metrics_dir) if args.metrics_dir else None,
+               "compile": not args.no_compile, "output": os.path.abspath(output_file), "incremental": not args.full_compile}
+        try: result = OCRDaemonClient(host, port).submit(job, log, progress)
+        except OSError as e:
+            emit_event("error", args.jsonl, message=f"Could not reach OCR daemon at {host}:{port}: {e}")
+            return 1
+        emit_event("daemon_result", args.jsonl, **result)
+        return 0 if result.get("ok") else 1
+
+    use_gpu = {"auto": None, "on": True, "off": False}[args.gpu]
+    if use_gpu is None: use_gpu = detect_gpu(log)
+    cache_path = args.cache
+    metrics = RunMetrics(args.metrics_dir or args.folder, args.profile) if (args.metrics_dir or args.profile) else None
+    control = OCRRunControl()
+    def cancel_on_interrupt(signum, frame):
+        control.cancel()
+        log("Cancelling: finishing the current image(s); press Ctrl+C again to abort immediately.")
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+    try: signal.signal(signal.SIGINT, cancel_on_interrupt)
+    except ValueError: pass # Not in the main thread
+    if args.shard:
+        return shard_command(args, log, progress, languages, use_gpu, cache_path, order, priority, control, output_file)
+    processed, skipped, errors, ocr_msg = perform_batch_ocr(
+        args.folder, languages=languages, use_gpu=use_gpu, overwrite_mode=args.overwrite,
+        status_callback=log, workers=args.workers, prefetch=args.prefetch,
+        cache_path=cache_path, folder_index=folder_index, preprocess=preprocess_from_args(args),
+        batch_images=args.batch_images, progress_callback=progress, metrics=metrics, cpu_mode=cpu_mode_from_args(args),
+        dedup=dedup_from_args(args), tiling=tiling_from_args(args), text_store=args.store, order=order, priority=priority,
+        control=control, journal=not args.no_journal)
+    emit_event("ocr_result", args.jsonl, processed=processed, skipped=skipped, errors=errors, error=ocr_msg)
+    if ocr_msg and "No image files found" not in ocr_msg: return 1
+    if args.no_compile:
+        if metrics is not None and args.metrics_dir: metrics.save(log)
+        return 0 if errors == 0 else 1
+
+    with stage_timer(metrics, "compile"):
+        compiled_count, compile_msg = compile_text_files(args.folder, output_file, status_callback=log,
+                                                         folder_index=folder_index, incremental=not args.full_compile)
+    if metrics is not None and args.metrics_dir: metrics.save(log)
+    emit_event("compile_result", args.jsonl, compiled=compiled_count, output=os.path.abspath(output_file), error=compile_msg)
+    return 0 if (errors == 0 and compile_msg is None) else 1
+
+
+def serve_daemon(args, log):
+    """'serve' command: preloads a Reader and serves jobs until interrupted (or a shutdown job)."""
+    host, port = parse_daemon_address(args.listen)
+    use_gpu = {"auto": None, "on": True, "off": False}[args.gpu]
+    if use_gpu is None: use_gpu = detect_gpu(log)
+    languages = [lang.strip() for lang in args.languages.split(",") if lang.strip()]
+    service = OCRService(languages=languages, use_gpu=use_gpu, readers_per_key=args.readers,
+                         cache_path=args.cache, preprocess=preprocess_from_args(args),
+                         batch_images=args.batch_images, cpu_mode=cpu_mode_from_args(args), dedup=dedup_from_args(args),
+                         tiling=tiling_from_args(args), allowed_paths=args.allow_path)
+    log(f"Daemon: Loading EasyOCR for {languages} (GPU: {use_gpu})...")
+    try: service.preload()
+    except Exception as e:
+        emit_event("error", args.jsonl, message=f"Error initializing EasyOCR: {e}")
+        return 1
+    try: server = OCRDaemonServer(service, host, port)
+    except OSError as e:
+        emit_event("error", args.jsonl, message=f"Could not start the OCR daemon on {host}:{port}: {e}")
+        return 1
+    with server:
+        emit_event("daemon_listening", args.jsonl, host=host, port=server.server_address[1], token_file=server.token_path)
+        try: server.serve_forever()
+        except KeyboardInterrupt: pass
+    return 0
+
+
+def shard_command(args, log, progress, languages, use_gpu, cache_path, order, priority, control, output_file):
+    """'run --shard': this node's share of a sharded run, then (on one node) the compile."""
+    if args.workers > 1: log("Warning: Sharded mode runs one OCR process per node; start more nodes instead of --workers.")
+    if args.metrics_dir or args.profile: log("Warning: --metrics-dir/--profile are not supported with --shard.")
+    processed, errors, shard_msg = run_sharded_ocr(
+        args.folder, languages=languages, use_gpu=use_gpu, overwrite_mode=args.overwrite, status_callback=log, output_file=output_file,
+        compile_output=not args.no_compile, incremental=not args.full_compile, shard_dir=args.shard, node_id=args.node_id,
+        chunk_images=args.chunk_images, lease_seconds=args.lease_seconds, prefetch=args.prefetch, cache_path=cache_path,
+        preprocess=preprocess_from_args(args), batch_images=args.batch_images, progress_callback=progress, cpu_mode=cpu_mode_from_args(args),
+        dedup=dedup_from_args(args), tiling=tiling_from_args(args), text_store=args.store, order=order, priority=priority, control=control)
+    emit_event("shard_result", args.jsonl, processed=processed, errors=errors, error=shard_msg)
+    return 0 if (errors == 0 and shard_msg is None) else 1
+
+
+def watch_command(args, log, progress):
+    """'watch' command: OCRs new images as they arrive until interrupted."""
+    use_gpu = {"auto": None, "on": True, "off": False}[args.gpu]
+    languages = [lang.strip() for lang in args.languages.split(",") if lang.strip()]
+    processed, errors, watch_msg = watch_folder(
+        args.folder, languages=languages, use_gpu=use_gpu, status_callback=log, output_file=args.output,
+        compile_output=not args.no_compile, settle_seconds=args.settle, poll_interval=args.poll, use_inotify=not args.polling,
+        cache_path=args.cache, preprocess=preprocess_from_args(args), progress_callback=progress,
+        cpu_mode=cpu_mode_from_args(args), dedup=dedup_from_args(args), tiling=tiling_from_args(args), text_store=args.store)
+    emit_event("watch_result", args.jsonl, processed=processed, errors=errors, error=watch_msg)
+    return 1 if watch_msg else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support() # Needed by the 'spawn' OCR worker pool in frozen builds
+    sys.exit(main())
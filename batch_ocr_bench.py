@@ -0,0 +1,431 @@
+# batch_ocr_bench.py
+# Reproducible benchmarks for batch_ocr.py: generates synthetic image folders (text drawn
+# with cv2.putText), then times the scan, decode, OCR pipeline and compile paths with a
+# deterministic stand-in OCR engine, plus an optional tier with the real EasyOCR models.
+# Every run appends one JSON line to a results file; `compare` diffs two runs.
+
+# --- Standard Library Imports ---
+import os
+import sys
+import time
+import json
+import random
+import shutil
+import difflib
+import platform
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+import batch_ocr
+from batch_ocr import import_heavy
+
+
+# --- Constants ---
+RESULTS_SCHEMA = 1 # Bump when result records change incompatibly
+DEFAULT_RESULTS_FILE = "bench_results.jsonl"
+CORPUS_MANIFEST_FILENAME = "_bench_corpus.json"
+EASYOCR_SAMPLE_DIRNAME = "_easyocr_sample" # Subfolder holding the real-EasyOCR tier's images
+CORPUS_PRESETS = { # --preset: file counts from a quick check to a huge folder
+    "small": 1000,
+    "medium": 10000,
+    "large": 100000,
+    "huge": 500000,
+}
+DEFAULT_SIZES = "640x480,1280x720,1920x1080"
+DEFAULT_FORMATS = "png,jpg"
+TEMPLATES_PER_VARIANT = 8 # Distinct rendered images per (size, format); files reuse their bytes
+ALL_SCENARIOS = ("scan", "scan_manifest", "decode", "ocr_fake", "compile_full", "compile_incremental")
+BENCH_WORDS = ("factura", "invoice", "total", "fecha", "date", "cliente", "customer", "importe", "amount",
+               "pedido", "order", "numero", "number", "pagina", "page", "resumen", "summary", "enero", "march")
+
+
+# ==============================================================================
+# --- Synthetic corpus ---
+# ==============================================================================
+
+def parse_sizes(sizes):
+    """'640x480,1920x1080' -> [(640, 480), (1920, 1080)]"""
+    result = []
+    for item in sizes.split(","):
+        width, height = item.lower().strip().split("x")
+        result.append((int(width), int(height)))
+    return result
+
+
+def render_text_image(width, height, rng):
+    """Draws a few lines of random words on a white page. Returns (image, ground_truth_text)."""
+    np, cv2 = import_heavy('numpy'), import_heavy('cv2')
+    img = np.full((height, width, 3), 255, np.uint8)
+    scale = max(0.4, height / 600.0)
+    line_height = int(40 * scale)
+    lines = []
+    y = line_height
+    while y < height - line_height // 2 and len(lines) < 12:
+        words = " ".join(rng.choice(BENCH_WORDS) for _ in range(rng.randint(2, 6)))
+        words += f" {rng.randint(1, 99999)}"
+        cv2.putText(img, words, (int(20 * scale), y), cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 0), max(1, int(2 * scale)), cv2.LINE_AA)
+        lines.append(words)
+        y += line_height + rng.randint(0, line_height // 2)
+    return img, "\n".join(lines)
+
+
+def encode_image(img, image_format):
+    cv2 = import_heavy('cv2')
+    ok, buffer = cv2.imencode("." + image_format, img)
+    if not ok: raise RuntimeError(f"OpenCV could not encode a .{image_format} image")
+    return buffer.tobytes()
+
+
+def corpus_params(files, sizes, formats, seed):
+    return {"files": files, "sizes": sizes, "formats": formats, "seed": seed, "templates_per_variant": TEMPLATES_PER_VARIANT}
+
+
+def generate_corpus(folder, files, sizes=DEFAULT_SIZES, formats=DEFAULT_FORMATS, seed=1, log=print, regenerate=False):
+    """
+    Creates (or reuses) a deterministic folder of `files` images. Only a handful of templates
+    per size/format are rendered; each file is a byte copy of one of them, so generating
+    500k files costs disk writes, not drawing. File names and modification times are
+    shuffled independently, so the mod-time sort is exercised.
+    Returns the corpus manifest dict (params plus ground truth per template).
+    """
+    params = corpus_params(files, sizes, formats, seed)
+    manifest_path = os.path.join(folder, CORPUS_MANIFEST_FILENAME)
+    if not regenerate and os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f: manifest = json.load(f)
+            if manifest.get("params") == params:
+                log(f"Bench: Reusing corpus {folder} ({files} files)")
+                return manifest
+        except (OSError, ValueError): pass
+    if os.path.isdir(folder): shutil.rmtree(folder)
+    os.makedirs(folder)
+
+    rng = random.Random(seed)
+    templates, truth = [], {}
+    start_time = time.perf_counter()
+    for width, height in parse_sizes(sizes):
+        for image_format in [fmt.strip().lower() for fmt in formats.split(",")]:
+            for _ in range(TEMPLATES_PER_VARIANT):
+                img, text = render_text_image(width, height, rng)
+                template_id = f"t{len(templates):03d}"
+                templates.append((template_id, image_format, encode_image(img, image_format)))
+                truth[template_id] = text
+
+    log(f"Bench: Writing {files} files to {folder} ({len(templates)} templates)...")
+    mtimes = list(range(files))
+    rng.shuffle(mtimes)
+    base_time = 1_600_000_000
+    for i in range(files):
+        template_id, image_format, data = templates[rng.randrange(len(templates))]
+        path = os.path.join(folder, f"img_{i:06d}_{template_id}.{image_format}")
+        with open(path, 'wb') as f: f.write(data)
+        os.utime(path, (base_time + mtimes[i], base_time + mtimes[i]))
+        if (i + 1) % 50000 == 0: log(f"Bench:   {i + 1}/{files} files")
+
+    manifest = {"params": params, "truth": truth, "generated_in_seconds": round(time.perf_counter() - start_time, 3)}
+    with open(manifest_path, 'w', encoding='utf-8') as f: json.dump(manifest, f)
+    log(f"Bench: Corpus ready in {manifest['generated_in_seconds']:.1f}s")
+    return manifest
+
+
+def template_id_of(image_path):
+    return os.path.splitext(os.path.basename(image_path))[0].rsplit("_", 1)[-1]
+
+
+# ==============================================================================
+# --- Deterministic stand-in OCR engine ---
+# ==============================================================================
+
+class FakeOCRReader:
+    """
+    Drop-in for easyocr.Reader in benchmarks: returns text derived only from the image pixels
+    (same image -> same text, on any machine) and optionally sleeps `latency_ms` per image
+    to simulate the model, so read/decode/write/compile overheads can be measured offline.
+    """
+    def __init__(self, latency_ms=0.0):
+        self.latency = latency_ms / 1000.0
+
+    def readtext(self, img, detail=0, paragraph=True, **kwargs):
+        if self.latency: time.sleep(self.latency)
+        checksum = int(img[::16, ::16].sum()) % 1000003
+        return [f"fake ocr {img.shape[1]}x{img.shape[0]}", f"checksum {checksum}"]
+
+    def readtext_batched(self, imgs, **kwargs):
+        return [self.readtext(img) for img in imgs]
+
+
+# ==============================================================================
+# --- Scenarios ---
+# ==============================================================================
+
+def quiet_log(msg):
+    pass
+
+
+def scenario_scan(folder, args, metrics=None):
+    index, error = batch_ocr.build_folder_index(folder)
+    if error: raise RuntimeError(error)
+    return len(index.entries)
+
+
+def scenario_scan_manifest(folder, args, metrics=None):
+    index, error = batch_ocr.build_folder_index(folder, use_manifest=True)
+    if error: raise RuntimeError(error)
+    return len(index.entries)
+
+
+def build_limited_index(folder, limit):
+    """Folder index cut to the `limit` oldest images (0 = all): the decode/OCR/compile scenarios' working set."""
+    index, error = batch_ocr.build_folder_index(folder)
+    if error: raise RuntimeError(error)
+    if limit: index = batch_ocr.FolderIndex(index.folder_path, index.entries[:limit], index.restat_count)
+    return index
+
+
+def scenario_decode(folder, args, metrics=None):
+    index = build_limited_index(folder, args.limit)
+    for path in index.image_paths: batch_ocr.load_image_for_ocr(path, quiet_log)
+    return len(index.entries)
+
+
+def scenario_ocr_fake(folder, args, metrics=None):
+    processed, skipped, errors, msg = batch_ocr.perform_batch_ocr(
+        folder, use_gpu=False, overwrite_mode=True, status_callback=quiet_log, prefetch=args.prefetch,
+        folder_index=build_limited_index(folder, args.limit), reader=FakeOCRReader(args.fake_latency_ms),
+        batch_images=args.batch_images, metrics=metrics)
+    if msg or errors: raise RuntimeError(msg or f"{errors} OCR errors")
+    return processed
+
+
+def scenario_compile_full(folder, args, metrics=None):
+    count, msg = batch_ocr.compile_text_files(folder, os.path.join(folder, batch_ocr.DEFAULT_COMPILED_FILENAME),
+                                              status_callback=quiet_log, folder_index=build_limited_index(folder, args.limit),
+                                              incremental=False)
+    if msg: raise RuntimeError(msg)
+    return count
+
+
+def scenario_compile_incremental(folder, args, metrics=None):
+    # Nothing changed since the last compile: measures the "all segments unchanged" fast path
+    count, msg = batch_ocr.compile_text_files(folder, os.path.join(folder, batch_ocr.DEFAULT_COMPILED_FILENAME),
+                                              status_callback=quiet_log, folder_index=build_limited_index(folder, args.limit),
+                                              incremental=True)
+    if msg: raise RuntimeError(msg)
+    return count
+
+
+SCENARIOS = {
+    "scan": scenario_scan,
+    "scan_manifest": scenario_scan_manifest,
+    "decode": scenario_decode,
+    "ocr_fake": scenario_ocr_fake,
+    "compile_full": scenario_compile_full,
+    "compile_incremental": scenario_compile_incremental,
+}
+
+
+# Scenarios that get one untimed run first: compile_full leaves no valid segment sidecar behind,
+# so the first incremental compile after it would be a full rebuild, not the fast path it measures.
+WARMUP_SCENARIOS = ("compile_incremental",)
+
+
+def time_scenario(name, folder, args, log):
+    """Runs one scenario args.repeat times (after a warm-up run, see WARMUP_SCENARIOS). Returns its result dict (median/min seconds, items/s)."""
+    runs, items, stages = [], 0, None
+    if name in WARMUP_SCENARIOS: SCENARIOS[name](folder, args, None)
+    for _ in range(args.repeat):
+        metrics = batch_ocr.RunMetrics() if name == "ocr_fake" else None
+        start_time = time.perf_counter()
+        items = SCENARIOS[name](folder, args, metrics)
+        runs.append(time.perf_counter() - start_time)
+        if metrics is not None: stages = {stage: data["mean"] for stage, data in metrics.snapshot()["stages"].items()}
+    median = statistics.median(runs)
+    result = {"seconds": round(median, 6), "min_seconds": round(min(runs), 6), "runs": [round(r, 6) for r in runs],
+              "items": items, "items_per_second": round(items / median, 2) if median > 0 else None}
+    if stages: result["stage_mean_seconds"] = stages
+    log(f"Bench: {name:<20} {median:9.3f}s (min {min(runs):.3f}s)  {items} items  {result['items_per_second']} items/s")
+    return result
+
+
+def run_easyocr_tier(folder, manifest, args, log):
+    """Real models on a small sample: model load time, OCR throughput and similarity to the drawn text."""
+    sample_folder = os.path.join(folder, EASYOCR_SAMPLE_DIRNAME)
+    if os.path.isdir(sample_folder): shutil.rmtree(sample_folder)
+    os.makedirs(sample_folder)
+    index, error = batch_ocr.build_folder_index(folder)
+    if error: raise RuntimeError(error)
+    for entry in index.entries[:args.easyocr]:
+        shutil.copy2(entry.path, os.path.join(sample_folder, entry.name))
+
+    use_gpu = batch_ocr.detect_gpu(quiet_log)
+    start_time = time.perf_counter()
+    reader = batch_ocr.create_reader(batch_ocr.OCR_LANGUAGES, use_gpu, verbose=False)
+    load_seconds = time.perf_counter() - start_time
+
+    metrics = batch_ocr.RunMetrics()
+    start_time = time.perf_counter()
+    processed, skipped, errors, msg = batch_ocr.perform_batch_ocr(
+        sample_folder, use_gpu=use_gpu, overwrite_mode=True, status_callback=quiet_log, reader=reader,
+        batch_images=args.batch_images, metrics=metrics)
+    seconds = time.perf_counter() - start_time
+    if msg: raise RuntimeError(msg)
+
+    similarities = []
+    for entry in index.entries[:args.easyocr]:
+        txt_path = batch_ocr.get_unique_txt_path(os.path.join(sample_folder, entry.name))
+        try:
+            with open(txt_path, 'r', encoding='utf-8') as f: text = f.read()
+        except OSError: continue
+        truth = manifest["truth"].get(template_id_of(entry.name), "")
+        similarities.append(difflib.SequenceMatcher(None, " ".join(truth.split()).lower(), " ".join(text.split()).lower()).ratio())
+    snapshot = metrics.snapshot()
+    result = {"seconds": round(seconds, 6), "items": processed, "errors": errors, "gpu": use_gpu,
+              "items_per_second": round(processed / seconds, 3) if seconds > 0 else None,
+              "model_load_seconds": round(load_seconds, 3),
+              "mean_similarity": round(statistics.mean(similarities), 4) if similarities else None,
+              "stage_mean_seconds": {stage: data["mean"] for stage, data in snapshot["stages"].items()},
+              "easyocr_version": batch_ocr.get_package_version('easyocr')}
+    log(f"Bench: ocr_easyocr          {seconds:9.3f}s  {processed} images  load {load_seconds:.1f}s  "
+        f"similarity {result['mean_similarity']}  (GPU: {use_gpu})")
+    return result
+
+
+# ==============================================================================
+# --- Results ---
+# ==============================================================================
+
+def get_environment():
+    """Where the numbers came from: needed to compare runs fairly."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError): commit = None
+    return {"git_commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+            "machine": platform.machine(), "cpu_count": os.cpu_count(),
+            "opencv": next((version for version in map(batch_ocr.get_package_version, ("opencv-python", "opencv-python-headless"))
+                            if version != "unknown"), "unknown"),
+            "numpy": batch_ocr.get_package_version('numpy')}
+
+
+def load_results(path):
+    """All result records of a JSON-lines results file, oldest first."""
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip(): records.append(json.loads(line))
+    return records
+
+
+def compare_results(baseline, current, threshold, min_seconds=0.0, log=print):
+    """
+    Prints per-scenario timings of two result records side by side. Only runs over the same
+    corpus parameters are comparable. Returns the names of scenarios slower by more than
+    threshold % (and by at least min_seconds).
+    """
+    if baseline.get("schema") != current.get("schema"): log("Warning: Result records use different schema versions.")
+    if baseline["corpus"] != current["corpus"]:
+        log(f"Warning: Different corpus parameters:\n  baseline: {baseline['corpus']}\n  current:  {current['corpus']}")
+    log(f"Baseline: {baseline.get('label') or ''} {baseline['environment'].get('git_commit')} ({time.ctime(baseline['time'])})")
+    log(f"Current:  {current.get('label') or ''} {current['environment'].get('git_commit')} ({time.ctime(current['time'])})")
+    log(f"{'scenario':<22}{'baseline s':>12}{'current s':>12}{'change':>10}")
+    regressions = []
+    for name in sorted(set(baseline["scenarios"]) | set(current["scenarios"])):
+        before, after = baseline["scenarios"].get(name), current["scenarios"].get(name)
+        if not before or not after:
+            before_text, after_text = (f"{r['seconds']:.3f}" if r else "-" for r in (before, after))
+            log(f"{name:<22}{before_text:>12}{after_text:>12}")
+            continue
+        change = (after["seconds"] - before["seconds"]) / before["seconds"] * 100 if before["seconds"] else 0.0
+        flag = "  <-- slower" if change > threshold and after["seconds"] - before["seconds"] >= min_seconds else ""
+        if flag: regressions.append(name)
+        log(f"{name:<22}{before['seconds']:>12.3f}{after['seconds']:>12.3f}{change:>+9.1f}%{flag}")
+    return regressions
+
+
+# ==============================================================================
+# --- Command line ---
+# ==============================================================================
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(prog="batch_ocr_bench", description="Benchmarks for batch_ocr.py on synthetic image folders.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_cmd = commands.add_parser("run", help="Generate (or reuse) a corpus and time the scenarios.")
+    run_cmd.add_argument("--preset", choices=sorted(CORPUS_PRESETS, key=CORPUS_PRESETS.get), default="small",
+                         help="Corpus size: " + ", ".join(f"{k}={v}" for k, v in CORPUS_PRESETS.items()) + " files (default: %(default)s).")
+    run_cmd.add_argument("--files", type=int, help="Exact number of files (overrides --preset).")
+    run_cmd.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated WIDTHxHEIGHT image sizes (default: %(default)s).")
+    run_cmd.add_argument("--formats", default=DEFAULT_FORMATS, help="Comma-separated image formats (default: %(default)s).")
+    run_cmd.add_argument("--seed", type=int, default=1, help="Corpus random seed (default: %(default)s).")
+    run_cmd.add_argument("--corpus-dir", help="Where to build the corpus (default: a folder per parameter set under the temp dir).")
+    run_cmd.add_argument("--regenerate", action="store_true", help="Rebuild the corpus even if a matching one exists.")
+    run_cmd.add_argument("--scenarios", default=",".join(ALL_SCENARIOS), help="Comma-separated scenarios (default: %(default)s).")
+    run_cmd.add_argument("--repeat", type=int, default=3, help="Runs per scenario; the median is reported (default: %(default)s).")
+    run_cmd.add_argument("--limit", type=int, default=5000,
+                         help="Oldest images used by the decode/OCR/compile scenarios, 0 = all; scans always cover the whole folder (default: %(default)s).")
+    run_cmd.add_argument("--prefetch", type=int, default=batch_ocr.DEFAULT_PREFETCH_IMAGES, help="Pipeline prefetch for ocr_fake (default: %(default)s).")
+    run_cmd.add_argument("--batch-images", type=int, default=batch_ocr.DEFAULT_OCR_BATCH_IMAGES, help="Images per batched OCR call (default: %(default)s).")
+    run_cmd.add_argument("--fake-latency-ms", type=float, default=0.0, help="Simulated model time per image for ocr_fake (default: %(default)s).")
+    run_cmd.add_argument("--easyocr", type=int, default=0, metavar="N", help="Also run the real EasyOCR models on N images (default: off).")
+    run_cmd.add_argument("--results", help=f"JSON-lines file the run is appended to (default: {DEFAULT_RESULTS_FILE} next to the corpus folder).")
+    run_cmd.add_argument("--label", help="Free-form label stored with the result (e.g. a branch name).")
+
+    compare_cmd = commands.add_parser("compare", help="Compare two result records (by default the last two in one file).")
+    compare_cmd.add_argument("results", help="Results file (current run: its last record).")
+    compare_cmd.add_argument("baseline", nargs="?", help="Baseline results file (its last record; default: the previous record of RESULTS).")
+    compare_cmd.add_argument("--threshold", type=float, default=10.0, help="Percent slowdown reported as a regression (default: %(default)s).")
+    compare_cmd.add_argument("--min-seconds", type=float, default=0.01,
+                             help="Ignore slowdowns smaller than this many seconds (timer noise; default: %(default)s).")
+    return parser
+
+
+def run_benchmarks(args, log=print):
+    files = args.files or CORPUS_PRESETS[args.preset]
+    folder = args.corpus_dir or os.path.join(tempfile.gettempdir(), "batch_ocr_bench",
+                                             f"{files}_{args.sizes.replace(',', '_')}_{args.formats.replace(',', '_')}_s{args.seed}")
+    manifest = generate_corpus(folder, files, args.sizes, args.formats, args.seed, log, args.regenerate)
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown: raise ValueError(f"Unknown scenario(s): {', '.join(unknown)}. Available: {', '.join(ALL_SCENARIOS)}")
+    if any(name.startswith("compile") for name in scenarios) and "ocr_fake" not in scenarios and \
+            not batch_ocr.check_existing_txt_files(folder):
+        scenarios.insert(0, "ocr_fake") # Compile scenarios need the .txt files
+
+    results = {}
+    for name in scenarios: results[name] = time_scenario(name, folder, args, log)
+    if args.easyocr: results["ocr_easyocr"] = run_easyocr_tier(folder, manifest, args, log)
+
+    record = {"schema": RESULTS_SCHEMA, "time": round(time.time(), 3), "label": args.label,
+              "environment": get_environment(), "corpus": manifest["params"],
+              "options": {"repeat": args.repeat, "limit": args.limit, "prefetch": args.prefetch,
+                          "batch_images": args.batch_images, "fake_latency_ms": args.fake_latency_ms},
+              "scenarios": results}
+    results_path = args.results or os.path.join(os.path.dirname(os.path.abspath(folder)), DEFAULT_RESULTS_FILE)
+    with open(results_path, 'a', encoding='utf-8') as f: f.write(json.dumps(record) + "\n")
+    log(f"Bench: Results appended to {os.path.abspath(results_path)}")
+    return record
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if args.command == "run":
+        try: run_benchmarks(args)
+        except (ValueError, RuntimeError, ImportError) as e:
+            print(f"!!! Benchmark failed: {e} !!!")
+            return 1
+        return 0
+
+    current_records = load_results(args.results)
+    baseline_records = load_results(args.baseline) if args.baseline else current_records[:-1]
+    if not current_records or not baseline_records:
+        print("Need two result records to compare (run the benchmark twice, or pass a baseline file).")
+        return 1
+    regressions = compare_results(baseline_records[-1], current_records[-1], args.threshold, args.min_seconds)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import batch_ocr_bench # noqa: E402  (after the path setup)
+
+BASE_MTIME = 1_700_000_000.0
+
+
+class CountingReader(batch_ocr_bench.FakeOCRReader):
+    """FakeOCRReader that counts its readtext calls (images actually OCR'd)."""
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def readtext(self, img, **kwargs):
+        self.calls += 1
+        return super().readtext(img, **kwargs)
+
+
+def write_image(folder, name, width, height, shade, mtime):
+    """Writes a small PNG whose pixels (and so FakeOCRReader's text) depend on `shade`, with the given mtime."""
+    np, cv2 = pytest.importorskip("numpy"), pytest.importorskip("cv2")
+    img = np.full((height, width, 3), 255, np.uint8)
+    cv2.rectangle(img, (4, 4), (width - 5, height - 5), (shade, shade, shade), -1)
+    path = os.path.join(str(folder), name)
+    assert cv2.imwrite(path, img)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+@pytest.fixture
+def image_folder(tmp_path):
+    """A folder of 6 images, one second apart in mtime (img0 oldest), without .txt files."""
+    folder = tmp_path / "images"
+    folder.mkdir()
+    for i in range(6):
+        write_image(folder, f"img{i}.png", 64 + 8 * (i % 2), 48, 20 * i, BASE_MTIME + i)
+    return folder
+
+
+@pytest.fixture
+def fake_reader():
+    return batch_ocr_bench.FakeOCRReader()
@@ -0,0 +1,51 @@
+import os
+
+import batch_ocr
+from conftest import BASE_MTIME, write_image
+
+
+def write_txt(folder, image_name, text, mtime):
+    path = os.path.join(str(folder), batch_ocr.get_unique_txt_path(image_name))
+    with open(path, 'w', encoding='utf-8') as f: f.write(text)
+    os.utime(path, (mtime, mtime))
+
+
+def compile_both(folder, tmp_path):
+    """Incremental compile into the folder's compiled file and a full compile elsewhere; returns both outputs."""
+    index, error = batch_ocr.build_folder_index(str(folder))
+    assert error is None
+    incremental_file = os.path.join(str(folder), batch_ocr.DEFAULT_COMPILED_FILENAME)
+    full_file = str(tmp_path / "full.txt")
+    incremental_count, incremental_error = batch_ocr.compile_text_files(str(folder), incremental_file, folder_index=index, incremental=True)
+    full_count, full_error = batch_ocr.compile_text_files(str(folder), full_file, folder_index=index, incremental=False)
+    assert (incremental_error, full_error) == (None, None)
+    assert incremental_count == full_count
+    with open(incremental_file, 'rb') as f: incremental = f.read()
+    with open(full_file, 'rb') as f: full = f.read()
+    return incremental, full
+
+
+def test_incremental_compile_matches_full_compile(image_folder, tmp_path):
+    folder = image_folder
+    for i in range(6): write_txt(folder, f"img{i}.png", f"text of image {i}\nsecond line {i}", BASE_MTIME + 100 + i)
+    incremental, full = compile_both(folder, tmp_path)
+    assert incremental == full and b"text of image 5" in full
+
+    steps = {
+        "append": lambda: (write_image(folder, "img6.png", 64, 48, 130, BASE_MTIME + 10),
+                           write_txt(folder, "img6.png", "appended image", BASE_MTIME + 110)),
+        "change": lambda: write_txt(folder, "img2.png", "changed text, longer than before\nwith a new line", BASE_MTIME + 200),
+        "change_same_size": lambda: write_txt(folder, "img3.png", "TEXT OF IMAGE 3\nSECOND LINE 3", BASE_MTIME + 201),
+        "remove": lambda: (os.remove(os.path.join(str(folder), "img1.png")), os.remove(os.path.join(str(folder), "img1.png.txt"))),
+        "insert": lambda: (write_image(folder, "img7.png", 72, 48, 150, BASE_MTIME + 2.5),
+                           write_txt(folder, "img7.png", "inserted in the middle", BASE_MTIME + 300)),
+        "reorder": lambda: os.utime(os.path.join(str(folder), "img0.png"), (BASE_MTIME + 20, BASE_MTIME + 20)),
+        "txt_removed": lambda: os.remove(os.path.join(str(folder), "img4.png.txt")),
+    }
+    for name, step in steps.items():
+        step()
+        incremental, full = compile_both(folder, tmp_path)
+        assert incremental == full, f"incremental compile differs from a full compile after '{name}'"
+
+    assert full.index(b"inserted in the middle") < full.index(b"appended image") < full.index(b"text of image 0")
+    assert b"TEXT OF IMAGE 3" in full and b"img1.png.txt" not in full and b"img4.png.txt" not in full
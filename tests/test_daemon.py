@@ -0,0 +1,103 @@
+import os
+import threading
+
+import batch_ocr
+import batch_ocr_bench
+
+
+def make_client(**service_options):
+    service = batch_ocr.OCRService(languages=["en"], use_gpu=False,
+                                   reader_factory=lambda languages, use_gpu: batch_ocr_bench.FakeOCRReader(), **service_options)
+    return batch_ocr.LocalOCRClient(service)
+
+
+def test_run_job_ocrs_and_compiles(image_folder):
+    logs, records = [], []
+    result = make_client().submit({"op": "run", "folder": str(image_folder), "journal": False}, logs.append, records.append)
+    assert result["ok"], result
+    assert (result["processed"], result["errors"], result["compiled"]) == (6, 0, 6)
+    assert sorted(name for name in os.listdir(image_folder) if name.endswith(".png.txt")) == [f"img{i}.png.txt" for i in range(6)]
+    with open(os.path.join(image_folder, batch_ocr.DEFAULT_COMPILED_FILENAME), encoding='utf-8') as f: compiled = f.read()
+    assert compiled.index("img0.png.txt") < compiled.index("img5.png.txt") # Oldest first
+    assert any("Daemon: Job 'run'" in line for line in logs)
+
+
+def test_run_job_progress_events(image_folder):
+    records = []
+    make_client().submit({"op": "run", "folder": str(image_folder), "journal": False}, None, records.append)
+    types = [record["type"] for record in records]
+    assert types[0] == "start" and types[-1] == "finish"
+    assert types.count("image") == 6
+    assert records[0]["pending"] == 6
+    assert records[-1]["processed"] == 6
+    assert all(record["saved"] for record in records if record["type"] == "image")
+
+
+def test_images_job_returns_text(image_folder):
+    images = [str(image_folder / "img1.png"), str(image_folder / "img2.png")]
+    result = make_client().submit({"op": "images", "images": images, "return_text": True})
+    assert result["ok"], result
+    assert [item["image"] for item in result["images"]] == images
+    assert [item["text"].splitlines()[0] for item in result["images"]] == ["fake ocr 72x48", "fake ocr 64x48"]
+    assert all(item["saved"] and os.path.isfile(item["image"] + ".txt") for item in result["images"])
+
+
+def test_bad_preset_is_reported(image_folder):
+    client = make_client()
+    for job in ({"op": "run", "folder": str(image_folder), "preprocess": "no-such-preset", "journal": False},
+                {"op": "images", "images": [str(image_folder / "img0.png")], "preprocess": "no-such-preset"}):
+        result = client.submit(job)
+        assert not result["ok"]
+        assert "no-such-preset" in result["error"]
+    assert not any(name.endswith(".txt") for name in os.listdir(image_folder))
+
+
+def test_unknown_op_and_ping():
+    client = make_client()
+    assert client.submit({"op": "ping"})["ok"]
+    assert not client.submit({"op": "explode"})["ok"]
+
+
+def test_job_paths_must_stay_inside_the_folder(image_folder, tmp_path):
+    outside = tmp_path / "elsewhere"
+    outside.mkdir()
+    for key in ("output", "metrics_dir", "store"):
+        result = make_client().submit({"op": "run", "folder": str(image_folder), "journal": False, key: str(outside / "x")})
+        assert not result["ok"] and key in result["error"]
+    assert not any(name.endswith(".txt") for name in os.listdir(image_folder))
+
+    result = make_client(allowed_paths=[str(outside)]).submit(
+        {"op": "run", "folder": str(image_folder), "journal": False, "output": str(outside / "compiled.txt")})
+    assert result["ok"], result
+    assert (outside / "compiled.txt").is_file()
+
+
+def test_tcp_daemon_requires_the_token(image_folder, tmp_path):
+    service = make_client().service
+    token_path = str(tmp_path / "daemon.token")
+    server = batch_ocr.OCRDaemonServer(service, "127.0.0.1", 0, token_path=token_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        port = server.server_address[1]
+        if os.name != 'nt': assert os.stat(token_path).st_mode & 0o777 == 0o600
+        with open(token_path, encoding='utf-8') as f: token = f.read().strip()
+
+        intruder = batch_ocr.OCRDaemonClient("127.0.0.1", port, timeout=10, token="wrong")
+        assert not intruder.submit({"op": "ping"})["ok"]
+        assert not intruder.submit({"op": "shutdown"})["ok"]
+        assert not intruder.submit({"op": "run", "folder": str(image_folder)})["ok"]
+        assert not any(name.endswith(".txt") for name in os.listdir(image_folder))
+
+        client = batch_ocr.OCRDaemonClient("127.0.0.1", port, timeout=10, token=token)
+        records = []
+        result = client.submit({"op": "run", "folder": str(image_folder), "journal": False}, None, records.append)
+        assert result["ok"] and result["processed"] == 6
+        assert [record["type"] for record in records].count("image") == 6
+        assert client.submit({"op": "shutdown"})["ok"]
+        thread.join(10)
+        assert not thread.is_alive()
+    finally:
+        if thread.is_alive(): server.shutdown()
+        server.server_close()
+    assert not os.path.exists(token_path)
@@ -0,0 +1,81 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+
+import pytest
+
+import batch_ocr
+from conftest import BASE_MTIME, REPO_DIR, CountingReader, write_image
+
+KILLED_RUN = """
+import os, signal, sys
+sys.path.insert(0, {repo!r})
+import batch_ocr, batch_ocr_bench
+
+class DyingReader(batch_ocr_bench.FakeOCRReader):
+    calls = 0
+    def readtext(self, img, **kwargs):
+        DyingReader.calls += 1
+        if DyingReader.calls == 4: os.kill(os.getpid(), signal.SIGKILL)
+        return super().readtext(img, **kwargs)
+
+batch_ocr.perform_batch_ocr({folder!r}, use_gpu=False, overwrite_mode=True, reader=DyingReader(latency_ms=100), journal=True)
+"""
+# The model latency gives the writer thread time to save (and journal) earlier images before the kill
+
+
+def journaled_names(folder):
+    with open(os.path.join(str(folder), batch_ocr.JOURNAL_FILENAME), encoding='utf-8') as f:
+        return [record["done"] for record in map(json.loads, f) if "done" in record]
+
+
+def resume(folder):
+    reader = CountingReader()
+    processed, skipped, errors, error = batch_ocr.perform_batch_ocr(str(folder), use_gpu=False, overwrite_mode=True, reader=reader, journal=True)
+    assert (errors, error) == (0, None)
+    return reader.calls, processed, skipped
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGKILL"), reason="needs SIGKILL")
+def test_resume_after_kill(image_folder):
+    completed = subprocess.run([sys.executable, "-c", KILLED_RUN.format(repo=REPO_DIR, folder=str(image_folder))], timeout=120)
+    assert completed.returncode == -signal.SIGKILL
+    done = journaled_names(image_folder)
+    assert 0 < len(done) <= 3 and done == [f"img{i}.png" for i in range(len(done))]
+
+    write_image(image_folder, "img0.png", 64, 48, 99, BASE_MTIME + 0.5) # Edited since: OCR'd again
+    calls, processed, skipped = resume(image_folder)
+    assert calls == processed == 6 - len(done) + 1
+    assert skipped == len(done) - 1
+    assert all(os.path.isfile(os.path.join(str(image_folder), f"img{i}.png.txt")) for i in range(6))
+    assert not os.path.exists(os.path.join(str(image_folder), batch_ocr.JOURNAL_FILENAME)) # Deleted once the run completed
+
+
+def test_resume_after_cancel(image_folder, fake_reader):
+    control = batch_ocr.OCRRunControl()
+    def cancel_after_two(record):
+        if record["type"] == "image" and record["position"].startswith("2/"): control.cancel()
+    result = batch_ocr.perform_batch_ocr(str(image_folder), use_gpu=False, overwrite_mode=True, reader=fake_reader, journal=True,
+                                         progress_callback=cancel_after_two, control=control)
+    assert result[3] == batch_ocr.OCR_CANCELLED_MESSAGE
+    done = journaled_names(image_folder)
+    assert done[:2] == ["img0.png", "img1.png"]
+
+    calls, processed, skipped = resume(image_folder)
+    assert calls == processed == 6 - len(done) and skipped == len(done)
+    assert not os.path.exists(os.path.join(str(image_folder), batch_ocr.JOURNAL_FILENAME))
+
+    calls, _, _ = resume(image_folder) # A completed run is not resumed: everything is OCR'd again
+    assert calls == 6
+
+
+def test_other_settings_start_over(image_folder, fake_reader):
+    control = batch_ocr.OCRRunControl()
+    batch_ocr.perform_batch_ocr(str(image_folder), use_gpu=False, overwrite_mode=True, reader=fake_reader, journal=True,
+                                progress_callback=lambda record: record["type"] == "image" and control.cancel(), control=control)
+    assert journaled_names(image_folder)
+    reader = CountingReader()
+    batch_ocr.perform_batch_ocr(str(image_folder), use_gpu=False, overwrite_mode=True, reader=reader, journal=True, preprocess="fast")
+    assert reader.calls == 6
@@ -0,0 +1,53 @@
+import os
+import signal
+import subprocess
+import sys
+
+import pytest
+
+import batch_ocr
+from conftest import REPO_DIR, CountingReader
+
+SHARD_OPTIONS = dict(use_gpu=False, overwrite_mode=False, chunk_images=2, lease_seconds=1.0)
+
+KILLED_NODE = """
+import os, signal, sys
+sys.path.insert(0, {repo!r})
+import batch_ocr, batch_ocr_bench
+
+class DyingReader(batch_ocr_bench.FakeOCRReader):
+    calls = 0
+    def readtext(self, img, **kwargs):
+        DyingReader.calls += 1
+        if DyingReader.calls == 2: os.kill(os.getpid(), signal.SIGKILL) # Halfway through its first chunk
+        return super().readtext(img, **kwargs)
+
+batch_ocr.run_sharded_ocr({folder!r}, node_id="dead-node", reader=DyingReader(latency_ms=100), **{options!r})
+"""
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGKILL"), reason="needs SIGKILL")
+def test_chunk_of_killed_node_is_taken_over(image_folder, tmp_path):
+    node = subprocess.run([sys.executable, "-c", KILLED_NODE.format(repo=REPO_DIR, folder=str(image_folder), options=SHARD_OPTIONS)], timeout=120)
+    assert node.returncode == -signal.SIGKILL
+    shard_dir = os.path.join(str(image_folder), batch_ocr.SHARD_DIRNAME)
+    (run_dir,) = os.listdir(shard_dir)
+    assert "c0.g0.lease" in os.listdir(os.path.join(shard_dir, run_dir)) # Left behind by the dead node
+    assert not os.path.exists(os.path.join(str(image_folder), "img1.png.txt"))
+    saved_by_dead_node = int(os.path.exists(os.path.join(str(image_folder), "img0.png.txt"))) # Its .txt is kept, not OCR'd again
+
+    reader, records = CountingReader(), []
+    processed, errors, error = batch_ocr.run_sharded_ocr(str(image_folder), node_id="live-node", reader=reader,
+                                                         progress_callback=records.append, **SHARD_OPTIONS)
+    assert (errors, error) == (0, None)
+    chunks = [record for record in records if record["type"] == "chunk"]
+    assert sorted(record["chunk"] for record in chunks) == [1, 2, 3]
+    assert [record["taken_over"] for record in chunks if record["chunk"] == 1] == [True]
+    assert processed == reader.calls == 6 - saved_by_dead_node
+    assert all(os.path.isfile(os.path.join(str(image_folder), f"img{i}.png.txt")) for i in range(6))
+    assert os.path.exists(os.path.join(shard_dir, run_dir, "complete"))
+
+    full_file = str(tmp_path / "full.txt")
+    assert batch_ocr.compile_text_files(str(image_folder), full_file)[1] is None
+    with open(os.path.join(str(image_folder), batch_ocr.DEFAULT_COMPILED_FILENAME), 'rb') as f: compiled = f.read()
+    with open(full_file, 'rb') as f: assert compiled == f.read()